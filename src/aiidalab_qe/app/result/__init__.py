@@ -3,10 +3,10 @@ import traitlets as tl
 
 from aiida.engine import ProcessState
 from aiidalab_qe.common.infobox import InAppGuide
-from aiidalab_qe.common.process import STATE_ICONS
+from aiidalab_qe.common.process import STATE_ICONS, ProcessChangeMonitor
 from aiidalab_qe.common.widgets import LoadingWidget
 from aiidalab_qe.common.wizard import QeDependentWizardStep
-from aiidalab_widgets_base import ProcessMonitor, WizardAppWidgetStep
+from aiidalab_widgets_base import WizardAppWidgetStep
 
 from .components import ResultsComponent
 from .components.status import WorkChainStatusModel, WorkChainStatusPanel
@@ -125,14 +125,17 @@ class ViewQeAppWorkChainStatusAndResultsStep(QeDependentWizardStep[ResultsStepMo
             else "Status"
         )
 
-        self.process_monitor = ProcessMonitor(
-            timeout=0.5,
+        self.process_monitor = ProcessChangeMonitor(
             callbacks=[
                 self._update_status,
                 self._update_state,
             ],
             log_widget=self.log_widget,
         )
+        ipw.dlink(
+            (self.process_monitor, "snapshot"),
+            (self._model, "process_snapshot"),
+        )
         ipw.dlink(
             (self._model, "process_uuid"),
             (self.process_monitor, "value"),
@@ -175,10 +178,12 @@ class ViewQeAppWorkChainStatusAndResultsStep(QeDependentWizardStep[ResultsStepMo
     def _on_kill_button_click(self, _):
         self._model.kill_process()
         self._update_kill_button_layout()
+        self.process_monitor.wake_up()
 
     def _on_clean_scratch_button_click(self, _):
         self._model.clean_remote_data()
         self._update_clean_scratch_button_layout()
+        self.process_monitor.wake_up()
 
     def _update_children(self):
         self.children = [
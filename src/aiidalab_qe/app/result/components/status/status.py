@@ -25,6 +25,10 @@ class WorkChainStatusPanel(ResultsComponent[WorkChainStatusModel]):
             (self._model, "monitor_counter"),
             (model, "monitor_counter"),
         )
+        ipw.dlink(
+            (self._model, "process_snapshot"),
+            (model, "process_snapshot"),
+        )
         model.observe(
             self._on_calculation_link_click,
             "clicked",
@@ -62,3 +62,7 @@ class ResultsStepModel(
             (self, "monitor_counter"),
             (model, "monitor_counter"),
         )
+        tl.dlink(
+            (self, "process_snapshot"),
+            (model, "process_snapshot"),
+        )
@@ -4,6 +4,7 @@ import ipywidgets as ipw
 from table_widget import TableWidget
 
 from aiida.orm import QueryBuilder, load_node
+from aiidalab_qe.common.bands_pdos.analysis import BAND_ANALYSIS_EXTRA
 from aiidalab_qe.common.process import STATE_ICONS
 from aiidalab_qe.common.widgets import LoadingWidget
 
@@ -51,6 +52,13 @@ COLUMNS = {
     "download": {"headerName": "Download", "dataType": "link", "editable": False},
     "uuid": {"headerName": "UUID", "editable": False, "hide": True},
     "properties": {"headerName": "Properties", "editable": False, "hide": True},
+    "band_gap": {
+        "headerName": "Band gap (eV)",
+        "type": "number",
+        "editable": False,
+        "hide": True,
+    },
+    "gap_type": {"headerName": "Gap type", "editable": False, "hide": True},
 }
 
 
@@ -99,6 +107,9 @@ class CalculationHistory:
             "description",
             "extras.workchain.relax_type",
             "extras.workchain.properties",
+            # Cached when the band structure is analyzed, see `analysis.py`
+            f"extras.{BAND_ANALYSIS_EXTRA}.band_gap",
+            f"extras.{BAND_ANALYSIS_EXTRA}.gap_type",
         ]
 
         qb = QueryBuilder()
@@ -126,6 +137,8 @@ class CalculationHistory:
                 description,
                 relax_type,
                 properties,
+                band_gap,
+                gap_type,
             ) = row
 
             creation_time_str = (
@@ -172,6 +185,8 @@ class CalculationHistory:
                     "delete": delete_link,
                     "download": download_link,
                     "properties": properties,
+                    "band_gap": round(band_gap, 3) if band_gap is not None else None,
+                    "gap_type": gap_type,
                     "creation_time": creation_time,
                 }
             )
@@ -0,0 +1,228 @@
+"""Analysis of the band structure: band gaps, band edges and effective masses.
+
+The analysis is computed from the arrays of the bands data, as returned by
+`get_bands_data`, and cached in the extras of the root workchain node, so that
+it is available without parsing the bands again, e.g. in the calculation
+history, where its values are queried as
+`extras.aiidalab_qe_band_analysis.<key>`.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from aiida import orm
+from aiidalab_qe.common.bands_pdos.utils import (
+    _get_spin_fermi_energy,
+    extract_bands_output,
+    get_bands_data,
+)
+
+BAND_ANALYSIS_VERSION = 1
+BAND_ANALYSIS_EXTRA = "aiidalab_qe_band_analysis"
+
+# ħ²/m_e in eV Å², the effective mass in units of m_e being ħ²/(d²E/dk²)
+HBAR2_OVER_ME = 7.61996
+
+# Tolerance, in eV, on the Fermi energy of insulators, i.e. the highest occupied
+# level, which is rounded in the output parameters
+FERMI_ENERGY_TOLERANCE = 1e-3
+
+# Number of k-points on each side of a band edge fitted by a parabola
+EFFECTIVE_MASS_FIT_POINTS = 2
+
+
+def analyze_bands(bands_data) -> dict:
+    """Analyze the band structure of the bands data.
+
+    The bands crossing the Fermi energy make the spin channel metallic. Otherwise,
+    the valence band maximum (VBM) and the conduction band minimum (CBM) are the
+    extrema of the bands right below and above the Fermi energy.
+
+    The effective masses are those of the parabola fitted to the band edges along
+    the k-path, i.e. in the direction of the path at the edges, with the k-point
+    distances in Å⁻¹.
+
+    Parameters
+    ----------
+    `bands_data`: `dict`
+        The bands data, as returned by `get_bands_data`.
+
+    Returns
+    -------
+    `dict`
+        The overall `band_gap` and `direct_gap` in eV and the `gap_type` (`metal`,
+        `direct` or `indirect`), and the analysis of each spin channel in `spins`.
+        The gap is `None` if there are no bands on one side of the Fermi energy.
+    """
+    band_type_idx = np.asarray(bands_data["band_type_idx"])
+    y = np.asarray(bands_data["y"], dtype=float)
+    spins = [
+        _analyze_spin(
+            bands_data,
+            y[:, band_type_idx == spin],
+            _get_spin_fermi_energy(bands_data, spin),
+        )
+        for spin in np.unique(band_type_idx)
+    ]
+    if len(spins) == 2:
+        spins[0]["spin"], spins[1]["spin"] = "up", "down"
+
+    analysis = {"version": BAND_ANALYSIS_VERSION, "spins": spins}
+    if any(spin["gap_type"] == "metal" for spin in spins):
+        analysis.update(band_gap=0.0, direct_gap=0.0, gap_type="metal")
+        return analysis
+    if any(spin["gap_type"] is None for spin in spins):
+        analysis.update(band_gap=None, direct_gap=None, gap_type=None)
+        return analysis
+
+    vbm = max(spins, key=lambda spin: spin["vbm"]["energy"])["vbm"]
+    cbm = min(spins, key=lambda spin: spin["cbm"]["energy"])["cbm"]
+    band_gap = cbm["energy"] - vbm["energy"]
+    direct_gap = min(spin["direct_gap"] for spin in spins)
+    analysis.update(
+        band_gap=band_gap,
+        direct_gap=direct_gap,
+        gap_type="direct" if np.isclose(direct_gap, band_gap) else "indirect",
+    )
+    return analysis
+
+
+def get_band_analysis(
+    node: orm.WorkChainNode,
+    outputs=None,
+    bands_data=None,
+) -> dict | None:
+    """Return the band analysis of the workchain, cached in its extras.
+
+    The analysis is computed if missing or outdated, and then cached if the node
+    is stored.
+
+    Parameters
+    ----------
+    `node`: `orm.WorkChainNode`
+        The root QE app workchain node, or the bands workchain node.
+    `outputs`: `AttributeDict`, optional
+        The bands outputs, by default extracted from the node. They are given
+        e.g. for a root workchain whose outputs are not attached yet.
+    `bands_data`: `dict`, optional
+        The bands data of the outputs, see `get_bands_data`, if already parsed,
+        e.g. by the plot model.
+
+    Returns
+    -------
+    `dict`
+        The band analysis, see `analyze_bands`, or `None` if the workchain has no
+        band structure output (yet).
+    """
+    analysis = node.base.extras.get(BAND_ANALYSIS_EXTRA, None)
+    if analysis and analysis.get("version") == BAND_ANALYSIS_VERSION:
+        return analysis
+
+    if bands_data is None:
+        outputs = outputs or extract_bands_output(node)
+        if not outputs or "band_structure" not in outputs:
+            return None
+        bands_data = get_bands_data(outputs)
+
+    analysis = analyze_bands(bands_data)
+    if node.is_stored:
+        node.base.extras.set(BAND_ANALYSIS_EXTRA, analysis)
+    return analysis
+
+
+def _analyze_spin(bands_data, bands, fermi_energy) -> dict:
+    """Analyze the bands of a spin channel, of shape `(n_kpoints, n_bands)`."""
+    band_min = bands.min(axis=0)
+    band_max = bands.max(axis=0)
+    analysis = {
+        "spin": None,
+        "fermi_energy": fermi_energy,
+        "band_widths": (band_max - band_min).tolist(),
+    }
+
+    valence = band_max <= fermi_energy + FERMI_ENERGY_TOLERANCE
+    conduction = band_min > fermi_energy + FERMI_ENERGY_TOLERANCE
+    if not (valence | conduction).all():
+        analysis.update(band_gap=0.0, direct_gap=0.0, gap_type="metal")
+        return analysis
+    if not (valence.any() and conduction.any()):
+        # Without bands on both sides of the Fermi energy, the gap is unknown
+        analysis.update(band_gap=None, direct_gap=None, gap_type=None)
+        return analysis
+
+    # The bands are sorted by energy at each k-point
+    valence_index = int(np.flatnonzero(valence)[-1])
+    conduction_index = int(np.flatnonzero(conduction)[0])
+    valence_band = bands[:, valence_index]
+    conduction_band = bands[:, conduction_index]
+    vbm_index = int(np.argmax(valence_band))
+    cbm_index = int(np.argmin(conduction_band))
+    direct_gaps = conduction_band - valence_band
+    direct_index = int(np.argmin(direct_gaps))
+
+    band_gap = float(conduction_band[cbm_index] - valence_band[vbm_index])
+    direct_gap = float(direct_gaps[direct_index])
+    analysis.update(
+        band_gap=band_gap,
+        direct_gap=direct_gap,
+        gap_type="direct" if np.isclose(direct_gap, band_gap) else "indirect",
+        direct_gap_kpoint=_get_kpoint(bands_data, direct_index),
+        vbm={
+            "energy": float(valence_band[vbm_index]),
+            "band_index": valence_index,
+            **_get_kpoint(bands_data, vbm_index),
+        },
+        cbm={
+            "energy": float(conduction_band[cbm_index]),
+            "band_index": conduction_index,
+            **_get_kpoint(bands_data, cbm_index),
+        },
+        # The mass of the holes is the opposite of the one of the valence band
+        hole_effective_mass=_get_effective_mass(bands_data, -valence_band, vbm_index),
+        electron_effective_mass=_get_effective_mass(
+            bands_data, conduction_band, cbm_index
+        ),
+    )
+    return analysis
+
+
+def _get_kpoint(bands_data, index) -> dict:
+    """Return the index, the distance and the label, if any, of a k-point."""
+    x = float(bands_data["x"][index])
+    labels, values = bands_data["pathlabels"]
+    matches = np.flatnonzero(np.isclose(values, x))
+    return {
+        "kpoint_index": index,
+        "x": x,
+        "label": labels[matches[0]] if len(matches) else None,
+    }
+
+
+def _get_effective_mass(bands_data, band, index) -> float | None:
+    """Return the effective mass, in units of m_e, at a minimum of the band.
+
+    A parabola is fitted to the band around the minimum, within the continuous
+    segment of the k-path of the minimum. At an end of the segment, e.g. at a
+    high-symmetry point, the band is assumed to be symmetric around the minimum.
+    Returns `None` if the segment is too short or the band is flat.
+    """
+    x = np.asarray(bands_data["x"], dtype=float)
+    segments = np.asarray(bands_data["segments"])
+    start, stop = segments[(segments[:, 0] <= index) & (index <= segments[:, 1])][0]
+    window = slice(
+        max(index - EFFECTIVE_MASS_FIT_POINTS, start),
+        min(index + EFFECTIVE_MASS_FIT_POINTS, stop) + 1,
+    )
+    dx = x[window] - x[index]
+    energies = band[window]
+    if index in (start, stop):
+        dx = np.concatenate([dx, -dx])
+        energies = np.concatenate([energies, energies])
+    if np.count_nonzero(dx) < 2:
+        return None
+
+    curvature = 2 * np.polyfit(dx, energies, 2)[0]
+    if curvature <= 0:
+        return None
+    return float(HBAR2_OVER_ME / curvature)
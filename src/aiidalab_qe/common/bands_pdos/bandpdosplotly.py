@@ -3,13 +3,27 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 from aiidalab_qe.common.bands_pdos.utils import (
-    find_max_in_range,
-    find_max_up_and_down,
+    downsample_curves,
+    find_extremes_in_range,
     prepare_combined_plotly_traces,
 )
 
 
 class BandsPdosPlotly:
+    """Plotly figure of the bands and/or PDOS.
+
+    If the `downsample` plot setting is true, the band and DOS curves are plotted
+    at the resolution of the plot (level of detail), keeping the minimum and the
+    maximum of each curve per pixel of the visible range. The curves are
+    resampled from the full-resolution data whenever the axes range changes, e.g.
+    when zooming in.
+
+    Each trace is identified by a key, built from its panel (`bands`, `pdos` or
+    `projections`), spin and label, and set as its `meta`. The keys allow to
+    update the traces of a panel in place when the data change, e.g. for a new
+    grouping of the PDOS, only adding and removing the traces whose key changed.
+    """
+
     SETTINGS = {
         "axis_linecolor": "#111111",
         "bands_linecolor": "#111111",
@@ -38,9 +52,15 @@ class BandsPdosPlotly:
     ):
         self.bands_data = bands_data
         self.external_bands_data = external_bands_data
+        # Extremes of the DOS traces, by energy window
+        self._dos_extremes = {}
         self.pdos_data = pdos_data
         self.project_bands = bands_projections_data
         self.plot_settings = plot_settings or {}
+        self.downsample = self.plot_settings.get("downsample", False)
+
+        # Full-resolution data of the downsampled traces, by trace key
+        self._full_resolution_traces = {}
 
         self.fermi_energy = self._get_fermi_energy()
 
@@ -53,6 +73,15 @@ class BandsPdosPlotly:
         # Plotly figure object
         self.figure_object = self._get_bandspdos_plot()
 
+    @property
+    def pdos_data(self):
+        return self._pdos_data
+
+    @pdos_data.setter
+    def pdos_data(self, pdos_data):
+        self._pdos_data = pdos_data
+        self._dos_extremes.clear()
+
     @property
     def plot_type(self):
         """Define the plot type."""
@@ -63,10 +92,36 @@ class BandsPdosPlotly:
         elif self.pdos_data:
             return "pdos"
 
+    @property
+    def energy_axis(self):
+        """The name of the layout axis of the energies."""
+        return "xaxis" if self.plot_type == "pdos" else "yaxis"
+
     @property
     def bandspdosfigure(self):
         return self.figure_object
 
+    @staticmethod
+    def get_trace_key(panel, label):
+        """Return the key of a trace from its panel and its label."""
+        if label.endswith("(↑)"):
+            spin = "up"
+        elif label.endswith("(↓)"):
+            spin = "down"
+        else:
+            spin = "none"
+        return f"{panel}/{spin}/{label}"
+
+    @staticmethod
+    def parse_trace_key(key):
+        """Return the panel, spin and label of a trace key.
+
+        Returns `None` if the trace has no key, i.e. is not a data trace.
+        """
+        if not isinstance(key, str) or key.count("/") < 2:
+            return None
+        return tuple(key.split("/", 2))
+
     def _get_fermi_energy(self):
         """Function to return the Fermi energy information depending on the data available."""
         fermi_data = {}
@@ -89,10 +144,9 @@ class BandsPdosPlotly:
 
         if not self.bands_data:
             return None
-        paths = self.bands_data.get("paths")
         bandxaxis = go.layout.XAxis(
             title="k-points",
-            range=[0, paths[-1]["x"][-1]],
+            range=[0, self.bands_data["x"][-1]],
             showgrid=True,
             showline=True,
             tickmode="array",
@@ -196,7 +250,14 @@ class BandsPdosPlotly:
         else:
             self._customize_single_layout(fig)
 
-        return go.FigureWidget(fig)
+        widget = go.FigureWidget(fig)
+        if self.downsample:
+            widget.layout.on_change(
+                self._on_axes_range_change,
+                "xaxis.range",
+                "yaxis.range",
+            )
+        return widget
 
     def adding_bands_traces(self, fig):
         if self.bands_data:
@@ -255,6 +316,81 @@ class BandsPdosPlotly:
         )
         return fig
 
+    @staticmethod
+    def _to_plot_array(values):
+        """Return the values as a single-precision array.
+
+        Unlike lists, NumPy arrays are sent to the `FigureWidget` frontend as binary
+        typed arrays rather than as JSON text.
+        """
+        return np.asarray(values, dtype=np.float32)
+
+    def _get_energy_range(self):
+        """Return the initial range of the energy axis of the DOS."""
+        if self.plot_type == "combined":
+            return self.SETTINGS["vertical_range_bands"]
+        return self.SETTINGS["horizontal_range_pdos"]
+
+    def _get_num_buckets(self, axis):
+        """Return the number of downsampling buckets, i.e. of pixels, of an axis."""
+        if self.plot_type == "combined":
+            if axis == "kpoints":
+                return int(
+                    self.SETTINGS["combined_plot_width"]
+                    * self.SETTINGS["combined_column_widths"][0]
+                )
+            return self.SETTINGS["combined_plot_height"]
+        return self.SETTINGS[f"{self.plot_type}_plot_width"]
+
+    def _get_lines_data(self, full_resolution, axis_range):
+        """Return the plot data of lines, downsampled to the axis range if enabled.
+
+        The lines sharing the same x values are combined into single-trace data if
+        `combined` is true, otherwise only the first line is returned.
+        """
+        x, y = full_resolution["x"], full_resolution["y"]
+        if self.downsample:
+            x, y = downsample_curves(
+                x,
+                y,
+                self._get_num_buckets(full_resolution["axis"]),
+                axis_range,
+            )
+        if full_resolution["combined"]:
+            x, y = prepare_combined_plotly_traces(x, y)
+        else:
+            x, y = np.broadcast_to(x, y.shape)[0], y[0]
+        return self._to_plot_array(x), self._to_plot_array(y)
+
+    def _register_full_resolution(self, key, full_resolution):
+        """Keep the full-resolution data of a trace, if downsampling.
+
+        Returns the key to be set as the `meta` of the trace.
+        """
+        if self.downsample:
+            self._full_resolution_traces[key] = full_resolution
+        return key
+
+    def _on_axes_range_change(self, layout, xaxis_range, yaxis_range):
+        """Resample the downsampled traces for the new range of the axes."""
+        axes_ranges = {
+            "kpoints": xaxis_range,
+            "energy": xaxis_range if self.energy_axis == "xaxis" else yaxis_range,
+        }
+        fig = layout.figure
+        with fig.batch_update():
+            for trace in fig.data:
+                if trace.meta not in self._full_resolution_traces:
+                    continue
+                full_resolution = self._full_resolution_traces[trace.meta]
+                x, y = self._get_lines_data(
+                    full_resolution,
+                    axes_ranges[full_resolution["axis"]],
+                )
+                if full_resolution["swapped"]:
+                    x, y = y, x
+                trace.update(x=x, y=y)
+
     def _add_traces_to_fig(self, fig, traces, col):
         """Add a list of traces to a figure."""
         if self.plot_type == "combined":
@@ -268,7 +404,7 @@ class BandsPdosPlotly:
         """Generate the band traces and add them to the figure."""
         from copy import deepcopy
 
-        trace_settings = trace_settings or {}
+        trace_settings = dict(trace_settings or {})
         name = trace_settings.pop("name", "Bands")
         trace_settings.setdefault("dash", "solid")
         trace_settings.setdefault("shape", "linear")
@@ -298,74 +434,173 @@ class BandsPdosPlotly:
             if spin not in bands_data["band_type_idx"]:
                 continue
 
-            x_bands = np.array(bands_data["x"]).reshape(1, -1)
+            x_bands = np.asarray(bands_data["x"])
             # New shape: (number of bands, number of kpoints)
             y_bands = bands_data["y"][:, bands_data["band_type_idx"] == spin].T
-            # Concatenate the bands and prepare the traces
-            x_bands_comb, y_bands_comb = prepare_combined_plotly_traces(
-                x_bands, y_bands
-            )
 
             fermi_energy = fermi_energy_mapping.get(
                 ("fermi_energy" in self.fermi_energy, spin),
                 self.fermi_energy.get("fermi_energy"),
             )
+            trace_name = trace_name_mapping[(spin_polarized, spin)]
+            full_resolution = {
+                "axis": "kpoints",
+                "x": x_bands,
+                "y": y_bands - fermi_energy,
+                "combined": True,
+                "swapped": False,
+            }
+            # Concatenate the bands and prepare the traces
+            x_bands_comb, y_bands_comb = self._get_lines_data(
+                full_resolution, self._bands_xaxis.range
+            )
             trace_settings_spin.setdefault("color", colors[(spin_polarized, spin)])
             scatter_objects.append(
                 go.Scattergl(
                     x=x_bands_comb,
-                    y=y_bands_comb - fermi_energy,
+                    y=y_bands_comb,
                     mode="lines",
                     line=trace_settings_spin,
-                    showlegend=spin_polarized,
-                    name=trace_name_mapping[(spin_polarized, spin)],
+                    # Compared band structures need a legend entry to be told apart
+                    showlegend=spin_polarized or bool(self.external_bands_data),
+                    name=trace_name,
+                    meta=self._register_full_resolution(
+                        self.get_trace_key("bands", trace_name), full_resolution
+                    ),
                 )
             )
 
         self._add_traces_to_fig(fig, scatter_objects, 1)
 
     def _add_pdos_traces(self, fig):
-        # Extract DOS data
-        dos_data = self.pdos_data["dos"]
+        self._add_traces_to_fig(fig, self._get_pdos_traces(), 2)
 
-        # Pre-allocate memory for Scatter objects
-        num_traces = len(dos_data)
-        scatter_objects = [None] * num_traces
+    def _get_pdos_traces(self, energy_range=None):
+        """Return the PDOS traces, downsampled to the energy range if enabled."""
+        fill = "tozerox" if self.plot_type == "combined" else "tozeroy"
+        scatter_objects = []
+        for trace in self.pdos_data["dos"]:
+            x_data, y_data, meta = self._get_pdos_trace_data(trace, energy_range)
+            scatter_objects.append(
+                go.Scattergl(
+                    x=x_data,
+                    y=y_data,
+                    fill=fill,
+                    name=trace["label"],
+                    line={
+                        "color": trace["borderColor"],
+                        "shape": "linear",
+                    },
+                    legendgroup=trace["label"],
+                    meta=meta,
+                )
+            )
+        return scatter_objects
 
+    def update_pdos_traces(self, fig):
+        """Update the PDOS traces of the figure to the PDOS data.
+
+        See `update_traces` for details.
+        """
+        traces = (
+            self._get_pdos_traces(fig.layout[self.energy_axis].range)
+            if self.pdos_data
+            else []
+        )
+        return self.update_traces(fig, "pdos", traces)
+
+    def update_projection_traces(self, fig):
+        """Update the projected bands traces of the figure to the projections data.
+
+        See `update_traces` for details.
+        """
+        traces = self._get_projection_traces() if self.project_bands else []
+        return self.update_traces(fig, "projections", traces)
+
+    def update_traces(self, fig, panel, traces):
+        """Update the traces of a panel of the figure to the given traces.
+
+        The traces are matched by key. Those of the figure whose key is not among
+        the given traces are removed, the new ones are added, and the others only
+        have their data updated, in a single batch update, so that only the
+        changes are sent to the frontend. The traces of the panel are ordered as
+        the given traces.
+
+        Returns
+        -------
+        `tuple[list[str], list[str]]`
+            The keys of the removed traces and of the added traces.
+        """
+        plotted = {}
+        for trace in fig.data:
+            parsed_key = self.parse_trace_key(trace.meta)
+            if parsed_key and parsed_key[0] == panel:
+                plotted[trace.meta] = trace
+        keys = [trace.meta for trace in traces]
+        new_keys = set(keys)
+        removed = [key for key in plotted if key not in new_keys]
+        added = [trace for trace in traces if trace.meta not in plotted]
+
+        if removed or added:
+            self._add_traces_to_fig(fig, added, 1 if panel != "pdos" else 2)
+            panel_traces = {
+                trace.meta: trace for trace in fig.data if trace.meta in new_keys
+            }
+            data = [
+                trace
+                for trace in fig.data
+                if trace.meta in new_keys or trace.meta not in plotted
+            ]
+            start = next(
+                (i for i, trace in enumerate(data) if trace.meta in panel_traces),
+                len(data),
+            )
+            others = [trace for trace in data if trace.meta not in panel_traces]
+            fig.data = (
+                *others[:start],
+                *(panel_traces[key] for key in keys),
+                *others[start:],
+            )
+
+        # The edits of a batch update are applied by trace index, so only once the
+        # traces are reordered
+        with fig.batch_update():
+            for trace in traces:
+                if trace.meta in plotted:
+                    plotted[trace.meta].update(x=trace.x, y=trace.y)
+
+        for key in removed:
+            self._full_resolution_traces.pop(key, None)
+        return removed, [trace.meta for trace in added]
+
+    def _get_pdos_trace_data(self, trace, energy_range=None):
+        """Return the plot data of a PDOS trace and its key."""
         # dictionary with keys (bool(spin polarized), bool(spin up))
         fermi_energy_spin_mapping = {
             (False, True): self.fermi_energy.get("fermi_energy_up", None),
             (False, False): self.fermi_energy.get("fermi_energy_down", None),
         }
+        fermi_energy = fermi_energy_spin_mapping.get(
+            ("fermi_energy" in self.fermi_energy, trace["label"].endswith("(↑)")),
+            self.fermi_energy.get("fermi_energy"),
+        )
 
-        # Vectorize Scatter object creation
-        for i, trace in enumerate(dos_data):
-            dos_np = np.array(trace["x"])
-            fill = "tozerox" if self.plot_type == "combined" else "tozeroy"
-            fermi_energy = fermi_energy_spin_mapping.get(
-                ("fermi_energy" in self.fermi_energy, trace["label"].endswith("(↑)")),
-                self.fermi_energy.get("fermi_energy"),
-            )
-
-            x_data = (
-                trace["y"] if self.plot_type == "combined" else dos_np - fermi_energy
-            )
-            y_data = (
-                dos_np - fermi_energy if self.plot_type == "combined" else trace["y"]
-            )
-            scatter_objects[i] = go.Scattergl(  # type: ignore
-                x=x_data,
-                y=y_data,
-                fill=fill,
-                name=trace["label"],
-                line={
-                    "color": trace["borderColor"],
-                    "shape": "linear",
-                },
-                legendgroup=trace["label"],
-            )
-
-        self._add_traces_to_fig(fig, scatter_objects, 2)
+        full_resolution = {
+            "axis": "energy",
+            "x": np.asarray(trace["x"]) - fermi_energy,
+            "y": np.asarray(trace["y"]).reshape(1, -1),
+            "combined": False,
+            "swapped": self.plot_type == "combined",
+        }
+        energy_data, dos_data = self._get_lines_data(
+            full_resolution, energy_range or self._get_energy_range()
+        )
+        meta = self._register_full_resolution(
+            self.get_trace_key("pdos", trace["label"]), full_resolution
+        )
+        if self.plot_type == "combined":
+            return dos_data, energy_data, meta
+        return energy_data, dos_data, meta
 
     def _prepare_bands_projection_traces_data(self, projected_bands):
         """
@@ -393,8 +628,8 @@ class BandsPdosPlotly:
             )
             prepared_data.append(
                 {
-                    "x": proj_bands["x"],
-                    "y": np.array(proj_bands["y"]) - fermi_energy,
+                    "x": self._to_plot_array(proj_bands["x"]),
+                    "y": self._to_plot_array(proj_bands["y"] - fermi_energy),
                     "color": proj_bands["color"],
                     "label": proj_bands["label"],
                 }
@@ -403,9 +638,13 @@ class BandsPdosPlotly:
 
     def _add_projection_traces(self, fig):
         """Function to add the projected bands traces to the bands plot."""
+        self._add_traces_to_fig(fig, self._get_projection_traces(), 1)
+
+    def _get_projection_traces(self):
+        """Return the projected bands traces."""
         prepared_data = self._prepare_bands_projection_traces_data(self.project_bands)
 
-        scatter_objects = [
+        return [
             go.Scattergl(
                 x=data["x"],
                 y=data["y"],
@@ -416,12 +655,11 @@ class BandsPdosPlotly:
                 name=data["label"],
                 # If PDOS is present, use those legend entries
                 showlegend=True if self.plot_type == "bands" else False,
+                meta=self.get_trace_key("projections", data["label"]),
             )
             for data in prepared_data
         ]
 
-        self._add_traces_to_fig(fig, scatter_objects, 1)
-
     def update_projected_bands_thickness(self, fig):
         """Update the projected bands thickness."""
         prepared_data = self._prepare_bands_projection_traces_data(self.project_bands)
@@ -431,7 +669,9 @@ class BandsPdosPlotly:
 
         with fig.batch_update():
             for trace in fig.data:
-                if trace.xaxis == "x" and trace.legendgroup in y_data_by_label:
+                # The PDOS traces (`x2` axis) share the legend group of the bands
+                # traces, while the latter have no axis set in single plots
+                if trace.xaxis != "x2" and trace.legendgroup in y_data_by_label:
                     trace.y = y_data_by_label[trace.legendgroup]
 
     def _customize_combined_layout(self, fig):
@@ -472,87 +712,50 @@ class BandsPdosPlotly:
         )
         self._update_dos_layout(fig)
 
-    def _update_dos_layout(self, fig):
-        def update_layout_spin_polarized(
-            x_data_up,
-            y_data_up,
-            x_data_down,
-            y_data_down,
-            x_min,
-            x_max,
-            update_func,
-            layout_type,
-        ):
-            most_negative_down, max_up = find_max_up_and_down(
-                x_data_up, y_data_up, x_data_down, y_data_down, x_min, x_max
-            )
-            if layout_type == "layout":
-                update_func(yaxis={"range": [most_negative_down * 1.10, max_up * 1.10]})
-            elif layout_type == "xaxes":
-                update_func(
-                    patch={"range": [most_negative_down * 1.10, max_up * 1.10]},
-                    row=1,
-                    col=2,
-                )
-
-        def update_layout_non_spin_polarized(
-            total_dos_xdata, total_dos_ydata, x_min, x_max, update_func, layout_type
-        ):
-            max_value = find_max_in_range(
-                total_dos_xdata, total_dos_ydata, x_min, x_max
-            )
-            if layout_type == "layout":
-                update_func(yaxis={"range": [0, max_value * 1.10]})
-            elif layout_type == "xaxes":
-                update_func(patch={"range": [0, max_value * 1.10]}, row=1, col=2)
-
-        def get_x_min_max(fermi_energy):
-            return (
-                self.SETTINGS["horizontal_range_pdos"][0] + fermi_energy,
-                self.SETTINGS["horizontal_range_pdos"][1] + fermi_energy,
-            )
+    def _get_dos_extremes(self, x_min, x_max):
+        """Return the maxima and minima of the DOS traces in the energy window.
 
-        def handle_spin_polarization(fermi_energy, update_func, layout_type):
-            spin_polarized = "(↑)" in self.pdos_data["dos"][0]["label"]
-            if not spin_polarized:
-                total_dos_xdata = self.pdos_data["dos"][0]["x"]
-                total_dos_ydata = self.pdos_data["dos"][0]["y"]
-                x_min, x_max = get_x_min_max(fermi_energy)
-                update_layout_non_spin_polarized(
-                    total_dos_xdata,
-                    total_dos_ydata,
-                    x_min,
-                    x_max,
-                    update_func,
-                    layout_type,
+        The traces sharing the energy grid of the first one are reduced in a
+        single pass over their stacked values. The result is cached per window.
+        """
+        window = (x_min, x_max)
+        if window not in self._dos_extremes:
+            traces = self.pdos_data["dos"]
+            x_data = np.asarray(traces[0]["x"])
+            if all(np.array_equal(trace["x"], x_data) for trace in traces):
+                self._dos_extremes[window] = find_extremes_in_range(
+                    x_data, [trace["y"] for trace in traces], x_min, x_max
                 )
             else:
-                x_data_up = self.pdos_data["dos"][0]["x"]
-                y_data_up = self.pdos_data["dos"][0]["y"]
-                x_data_down = self.pdos_data["dos"][1]["x"]
-                y_data_down = self.pdos_data["dos"][1]["y"]
-                x_min, x_max = get_x_min_max(fermi_energy)
-                update_layout_spin_polarized(
-                    x_data_up,
-                    y_data_up,
-                    x_data_down,
-                    y_data_down,
-                    x_min,
-                    x_max,
-                    update_func,
-                    layout_type,
+                extremes = [
+                    find_extremes_in_range(trace["x"], [trace["y"]], x_min, x_max)
+                    for trace in traces
+                ]
+                self._dos_extremes[window] = tuple(
+                    np.concatenate(values) for values in zip(*extremes)
                 )
+        return self._dos_extremes[window]
 
-        # PDOS plot type
-        if self.plot_type == "pdos":
-            fermi_energy = self.fermi_energy.get(
-                "fermi_energy", self.fermi_energy.get("fermi_energy_up")
-            )
-            handle_spin_polarization(fermi_energy, fig.update_layout, "layout")
+    def _update_dos_layout(self, fig):
+        """Scale the DOS axis to the total DOS in the PDOS energy range."""
+        if self.plot_type not in ("pdos", "combined"):
+            return
+        fermi_energy = self.fermi_energy.get(
+            "fermi_energy", self.fermi_energy.get("fermi_energy_up")
+        )
+        x_min, x_max = (
+            self.SETTINGS["horizontal_range_pdos"][0] + fermi_energy,
+            self.SETTINGS["horizontal_range_pdos"][1] + fermi_energy,
+        )
+        maxima, minima = np.nan_to_num(self._get_dos_extremes(x_min, x_max))
 
-        # Combined plot type
-        if self.plot_type == "combined":
-            fermi_energy = self.fermi_energy.get(
-                "fermi_energy", self.fermi_energy.get("fermi_energy_up")
-            )
-            handle_spin_polarization(fermi_energy, fig.update_xaxes, "xaxes")
+        if "(↑)" in self.pdos_data["dos"][0]["label"]:
+            # The spin down DOS is plotted as negative values
+            dos_range = [float(min(minima[1], 0.0)) * 1.10, float(maxima[0]) * 1.10]
+        else:
+            dos_range = [0, float(maxima[0]) * 1.10]
+
+        if self.plot_type == "pdos":
+            fig.update_layout(yaxis={"range": dos_range})
+        else:
+            fig.update_xaxes(patch={"range": dos_range}, row=1, col=2)
@@ -1,6 +1,7 @@
 import ipywidgets as ipw
 
-from aiidalab_qe.common.widgets import LoadingWidget
+from aiidalab_qe.common.image_renderer import get_image_renderer
+from aiidalab_qe.common.widgets import LoadingWidget, ProgressBar
 from aiidalab_widgets_base.utils import StatusHTML, string_range_to_list
 
 from .model import BandsPdosModel
@@ -28,8 +29,16 @@ class BandsPdosWidget(ipw.VBox):
          Button widget to update the plot.
     `download_button`: `ipywidgets.Button`
          Button widget to download the data.
+    `data_format`: `ipywidgets.Dropdown`
+         Dropdown widget to select the file format of the downloaded data.
+    `dos_broadening_slider`: `ipywidgets.FloatSlider`
+         Slider widget to broaden the DOS, recomputed from the eigenvalues.
+    `dos_broadening_type`: `ipywidgets.Dropdown`
+         Dropdown widget to select the broadening function of the DOS.
     `project_bands_box`: `ipywidgets.Checkbox`
          Checkbox widget to choose whether projected bands should be plotted.
+    `progress_bar`: `ProgressBar`
+         Progress of the preparation of the plot data, done in the background.
     `plot`: `plotly.graph_objects.FigureWidget`
          Plotly widget for band structure and PDOS plot.
     """
@@ -47,10 +56,15 @@ class BandsPdosWidget(ipw.VBox):
         )
         self._model.observe(
             self._on_needs_pdos_options_change,
-            "needs_pdos_options",
+            ["needs_pdos_options", "needs_broadening_controls"],
+        )
+        self._model.observe(
+            self._on_updating_change,
+            "updating",
         )
 
         self.rendered = False
+        self.plot = None
 
     def render(self):
         if self.rendered:
@@ -119,6 +133,12 @@ class BandsPdosWidget(ipw.VBox):
             layout=ipw.Layout(visibility="hidden"),
         )
         self.download_button.on_click(self._model.download_data)
+        self.data_format = ipw.Dropdown(
+            description="Format:",
+            layout=ipw.Layout(width="auto", visibility="hidden"),
+        )
+        ipw.dlink((self._model, "data_format_options"), (self.data_format, "options"))
+        ipw.link((self._model, "data_format"), (self.data_format, "value"))
 
         self.download_image = ipw.Button(
             description="Download image",
@@ -126,16 +146,87 @@ class BandsPdosWidget(ipw.VBox):
             icon="fa-image",
         )
         self.download_image.on_click(self._model.download_image)
+        ipw.dlink((self._model, "rendering_image"), (self.download_image, "disabled"))
         self.image_format = ipw.Dropdown(
             description="Format:",
             layout=ipw.Layout(width="auto"),
         )
         ipw.dlink((self._model, "image_format_options"), (self.image_format, "options"))
         ipw.link((self._model, "image_format"), (self.image_format, "value"))
+        self.image_format.observe(self._warm_up_image_renderer, "value")
+        self.image_error = StatusHTML(clear_after=8)
+        ipw.dlink(
+            (self._model, "image_error"),
+            (self.image_error, "message"),
+            lambda error: f"<div class='alert alert-danger'>{error}</div>"
+            if error
+            else "",
+        )
 
         self.download_buttons = ipw.HBox(
-            children=[self.download_button, self.download_image, self.image_format]
+            children=[
+                self.download_button,
+                self.data_format,
+                self.download_image,
+                self.image_format,
+                self.image_error,
+            ]
+        )
+        self.dos_broadening_slider = ipw.FloatSlider(
+            min=0.0,
+            max=0.5,
+            step=0.005,
+            description="DOS broadening (eV):",
+            orientation="horizontal",
+            continuous_update=False,
+            readout=True,
+            readout_format=".3f",
+            style={"description_width": "initial"},
+            layout=ipw.Layout(width="380px"),
+        )
+        ipw.link(
+            (self._model, "dos_broadening"),
+            (self.dos_broadening_slider, "value"),
+        )
+        self.dos_broadening_slider.observe(
+            self._update_dos_broadening,
+            "value",
+        )
+        self.dos_broadening_type = ipw.Dropdown(
+            layout=ipw.Layout(width="auto"),
+        )
+        ipw.dlink(
+            (self._model, "dos_broadening_type_options"),
+            (self.dos_broadening_type, "options"),
+        )
+        ipw.link(
+            (self._model, "dos_broadening_type"),
+            (self.dos_broadening_type, "value"),
+        )
+        self.dos_broadening_type.observe(
+            self._update_dos_broadening,
+            "value",
+        )
+
+        self.broadening_controls = ipw.VBox(
+            children=[
+                ipw.HTML("""
+                    <div style="line-height: 140%; padding-top: 10px; max-width: 600px;">
+                        Broaden the DOS, recomputed from the eigenvalues and their
+                        projections. Set the broadening to 0 to plot the DOS
+                        computed by <code>projwfc.x</code>.
+                    </div>
+                """),
+                ipw.HBox(
+                    children=[
+                        self.dos_broadening_slider,
+                        self.dos_broadening_type,
+                    ]
+                ),
+            ],
+            layout=ipw.Layout(display="none"),
         )
+
         self.project_bands_box = ipw.Checkbox(
             description="Add `fat bands` projections",
             style={"description_width": "initial"},
@@ -194,6 +285,7 @@ class BandsPdosWidget(ipw.VBox):
                         self.update_plot_button,
                     ]
                 ),
+                self.broadening_controls,
                 self.proj_controls,
             ],
             layout=ipw.Layout(display="none"),
@@ -278,6 +370,17 @@ class BandsPdosWidget(ipw.VBox):
             "value",
         )
 
+        self.progress_bar = ProgressBar(layout=ipw.Layout(width="600px"))
+        ipw.dlink(
+            (self._model, "progress"),
+            (self.progress_bar, "value"),
+        )
+        ipw.dlink(
+            (self._model, "progress_message"),
+            (self.progress_bar, "description"),
+        )
+        self.progress_bar.layout.visibility = "hidden"
+
         self.legend_interaction_description = ipw.HTML(
             """
                 <div style="line-height: 140%; padding-top: 10px; padding-bottom: 5px; max-width: 600px;">
@@ -300,6 +403,7 @@ class BandsPdosWidget(ipw.VBox):
             """),
             self.pdos_options,
             self.download_buttons,
+            self.progress_bar,
             self.legend_interaction_description,
         ]
 
@@ -315,15 +419,36 @@ class BandsPdosWidget(ipw.VBox):
     def _on_needs_pdos_options_change(self, _):
         self._toggle_pdos_options()
 
+    def _on_updating_change(self, change):
+        if not self.rendered:
+            return
+        self.progress_bar.layout.visibility = (
+            "visible" if change["new"] or self._model.progress_message else "hidden"
+        )
+        if change["new"] or self._model.plot is None:
+            return
+        if self.plot is None:
+            self._show_plot()
+        self._trace_selector_change({"new": self.trace_selector.value})
+
+    def _warm_up_image_renderer(self, _):
+        """Start the renderer of the images once an image format is chosen, for a
+        quick first download, without starting it for plots never downloaded."""
+        self.image_format.unobserve(self._warm_up_image_renderer, "value")
+        get_image_renderer().warm_up()
+
     def _initial_plot(self):
-        """Create the initial plot."""
-        self._model.fetch_data()
-        self._model.create_plot()
+        """Request the initial plot, prepared in the background."""
+        self._model.request_plot_update()
+
+    def _show_plot(self):
+        """Show the plot, once created."""
         self.plot = self._model.plot
         self.proj_bands_width_slider.layout.visibility = (
             "visible" if self._model.project_bands_box else "hidden"
         )
         self.download_button.layout.visibility = "visible"
+        self.data_format.layout.visibility = "visible"
         self.project_bands_box.layout.visibility = "visible"
         self.children = [
             *self.children,
@@ -354,14 +479,23 @@ class BandsPdosWidget(ipw.VBox):
                 </div>
             """
         else:
-            self._model.update_bands_projections()
-            self._trace_selector_change({"new": 0})
+            self._model.request_plot_update(pdos=False)
 
     def _update_bands_projections_thickness(self, _):
         """Update the plot with the selected projection thickness."""
         self._model.update_bands_projections_thickness()
 
-    def _update_pdos_plot(self, _):
+    def _update_dos_broadening(self, change):
+        """Update the PDOS with the selected broadening."""
+        # The broadening function is irrelevant to the DOS of `projwfc.x`
+        if (
+            change["owner"] is self.dos_broadening_type
+            and not self._model.dos_broadening
+        ):
+            return
+        self._update_pdos_plot(change, projections=False)
+
+    def _update_pdos_plot(self, _, projections=True):
         """Update the plot with the selected PDOS options."""
         _, syntax_ok = string_range_to_list(self._model.selected_atoms, shift=-1)
         if not syntax_ok:
@@ -371,8 +505,7 @@ class BandsPdosWidget(ipw.VBox):
                 </div>
             """
         else:
-            self._model.update_pdos_plot()
-            self._trace_selector_change({"new": 0})
+            self._model.request_plot_update(projections=projections)
 
     def _toggle_projection_controls(self):
         """If projections are available in the bands data,
@@ -389,6 +522,9 @@ class BandsPdosWidget(ipw.VBox):
         contains projections."""
         if not self.rendered:
             return
+        self.broadening_controls.layout.display = (
+            "flex" if self._model.needs_broadening_controls else "none"
+        )
         if self._model.needs_pdos_options:
             self.pdos_options.layout.display = "flex"
             self.legend_interaction_description.layout.display = "flex"
@@ -0,0 +1,179 @@
+"""Broadening of the DOS and PDOS from the eigenvalues and projection weights.
+
+The `projwfc.x` PDOS are broadened with the smearing of the calculation, e.g.
+`pdos_degauss`. Since the `ProjectionData` nodes hold the eigenvalues, in their
+reference bands, and the projections of each state on the orbitals, the DOS and
+PDOS can be recomputed locally with any broadening width, without submitting a
+new calculation.
+
+The weighted eigenvalues are first binned onto the energy grid, each eigenvalue
+being split between its two neighbouring grid points, and the histograms are
+then convolved with the broadening function. The convolution is done with FFTs
+when the broadening function spans many grid points. Broadenings narrower than a
+few grid steps are computed on a finer grid, sampled back on the energy grid.
+"""
+
+from __future__ import annotations
+
+import typing as t
+
+import numpy as np
+
+BROADENING_TYPES = ["gaussian", "lorentzian"]
+
+# Half width of the sampled broadening functions, in units of the broadening width.
+# The Gaussian is negligible beyond, while the tails of the Lorentzian beyond hold
+# less than 1% of its weight.
+BROADENING_CUTOFFS = {"gaussian": 5.0, "lorentzian": 100.0}
+
+# Minimum number of grid points per broadening width. The densities of broadenings
+# narrower than this are computed on a finer grid, and then sampled on the grid.
+POINTS_PER_WIDTH = 4
+
+# Number of points of the sampled broadening function above which the histograms
+# are convolved with FFTs instead of directly
+FFT_KERNEL_SIZE = 64
+
+
+class Broadening(t.NamedTuple):
+    """Broadening of the DOS computed from the eigenvalues.
+
+    The `width` is the `degauss` of the Gaussian, i.e. `exp(-(E/width)²)`, or the
+    half width at half maximum of the Lorentzian, in eV. The `degeneracy` is the
+    number of electrons per state, i.e. 2 for non-spin-polarized calculations.
+    """
+
+    width: float
+    broadening_type: str = "gaussian"
+    degeneracy: float = 2.0
+
+
+def get_eigenvalues(projections, degeneracy=1.0, spin=0):
+    """Return the eigenvalues of the reference bands of the projections.
+
+    Parameters
+    ----------
+    `projections`: `ProjectionData`
+        The projections, whose reference bands hold the eigenvalues.
+    `degeneracy`: `float`
+        The number of electrons per state, the sum of the k-point weights.
+    `spin`: `int`
+        The spin index of the eigenvalues, if the reference bands hold both spins.
+
+    Returns
+    -------
+    `tuple[np.ndarray, np.ndarray]`
+        The eigenvalues, of shape `(n_kpoints, n_bands)`, and the weights of the
+        k-points, of shape `(n_kpoints, 1)`, uniform if the k-points have none.
+    """
+    bands = projections.get_reference_bandsdata()
+    eigenvalues = np.asarray(bands.get_bands(), dtype=float)
+    if eigenvalues.ndim == 3:
+        eigenvalues = eigenvalues[spin]
+    try:
+        _, weights = bands.get_kpoints(also_weights=True)
+        weights = np.asarray(weights, dtype=float)
+    except AttributeError:
+        weights = np.ones(len(eigenvalues))
+    weights = weights * degeneracy / weights.sum()
+    return eigenvalues, weights.reshape(-1, 1)
+
+
+def broaden(eigenvalues, weights, energies, width, broadening_type="gaussian"):
+    """Return the broadened densities of weighted eigenvalues on an energy grid.
+
+    Parameters
+    ----------
+    `eigenvalues`: `array_like`
+        The eigenvalues, of any shape.
+    `weights`: `array_like`
+        The weights of the eigenvalues, with an additional leading dimension for
+        each density to compute, i.e. of shape `(n_densities, *eigenvalues.shape)`.
+    `energies`: `array_like`
+        The evenly spaced energy grid, of shape `(n_energies,)`.
+    `width`: `float`
+        The broadening width, see `Broadening`.
+    `broadening_type`: `str`
+        One of `BROADENING_TYPES`.
+
+    Returns
+    -------
+    `np.ndarray`
+        The densities, of shape `(n_densities, n_energies)`, in states per unit of
+        energy.
+    """
+    if broadening_type not in BROADENING_TYPES:
+        raise ValueError(f"Invalid broadening type: {broadening_type}")
+    if width <= 0:
+        raise ValueError(f"The broadening width must be positive, got {width}")
+
+    energies = np.asarray(energies, dtype=float)
+    eigenvalues = np.asarray(eigenvalues, dtype=float).ravel()
+    weights = np.asarray(weights, dtype=float).reshape(-1, eigenvalues.size)
+    num_densities, num_energies = len(weights), len(energies)
+    if num_energies < 2 or not eigenvalues.size:
+        return np.zeros((num_densities, num_energies))
+    step = (energies[-1] - energies[0]) / (num_energies - 1)
+    oversampling = int(np.ceil(POINTS_PER_WIDTH * step / width))
+    if oversampling > 1:
+        step /= oversampling
+        num_energies = (num_energies - 1) * oversampling + 1
+
+    # The grid is extended by the half width of the sampled broadening function,
+    # which is not longer than the distance from the grid to the furthest eigenvalue
+    half_size = int(
+        min(
+            np.ceil(BROADENING_CUTOFFS[broadening_type] * width / step),
+            np.ceil(
+                max(energies[-1] - eigenvalues.min(), eigenvalues.max() - energies[0])
+                / step
+            ),
+        )
+    )
+    half_size = max(half_size, 1)
+    num_bins = num_energies + 2 * half_size
+    histograms = _bin(weights, (eigenvalues - energies[0]) / step + half_size, num_bins)
+
+    offsets = np.arange(-half_size, half_size + 1) * step
+    if broadening_type == "gaussian":
+        kernel = np.exp(-((offsets / width) ** 2)) / (width * np.sqrt(np.pi))
+    else:
+        kernel = width / np.pi / (offsets**2 + width**2)
+
+    # The densities are the `valid` part of the convolution of the histograms
+    if kernel.size > FFT_KERNEL_SIZE:
+        size = 1 << (num_bins + kernel.size - 2).bit_length()
+        convolved = np.fft.irfft(
+            np.fft.rfft(histograms, size) * np.fft.rfft(kernel, size), size
+        )
+        densities = convolved[:, kernel.size - 1 : kernel.size - 1 + num_energies]
+    else:
+        densities = np.zeros((num_densities, num_energies))
+        # The kernel is symmetric
+        for index, value in enumerate(kernel):
+            densities += value * histograms[:, index : index + num_energies]
+    return densities[:, ::oversampling] if oversampling > 1 else densities
+
+
+def _bin(weights, positions, num_bins):
+    """Split the weights of the eigenvalues between the two closest grid points.
+
+    The `positions` are the fractional grid indices of the eigenvalues. Returns
+    the histograms, of shape `(n_densities, num_bins)`.
+    """
+    lower = np.floor(positions).astype(int)
+    fraction = positions - lower
+    inside = (lower >= 0) & (lower < num_bins - 1)
+    lower, fraction = lower[inside], fraction[inside]
+    weights = weights[:, inside]
+
+    # The histograms of all the densities are filled at once, offset in a flat array
+    offsets = (np.arange(len(weights)) * num_bins).reshape(-1, 1)
+    indices = np.concatenate([lower + offsets, lower + 1 + offsets], axis=1)
+    values = np.concatenate([weights * (1 - fraction), weights * fraction], axis=1)
+    histograms = np.bincount(
+        indices.ravel(),
+        weights=values.ravel(),
+        minlength=len(weights) * num_bins,
+    )
+    return histograms.reshape(len(weights), num_bins)
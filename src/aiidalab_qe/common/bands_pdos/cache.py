@@ -0,0 +1,140 @@
+"""Process-wide cache of the parsed bands and PDOS data.
+
+Each results panel creates its own `BandsPdosModel`, which parses the bands and
+PDOS outputs again, e.g. when switching between the bands, PDOS and combined
+views, or when reopening a calculation. As the output nodes are immutable, the
+parsed data are shared between the models through a cache keyed by the UUIDs of
+the output nodes, and by the options the data depend on, e.g. the grouping.
+
+The cache is bounded by the total size of the arrays it holds, the least recently
+used entries being evicted first. The cached arrays are made read-only, as they
+are shared by all the models.
+"""
+
+from __future__ import annotations
+
+import typing as t
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+
+import numpy as np
+
+from aiida.orm import Node
+
+# Maximum total size, in bytes, of the arrays of the cached data
+DATA_CACHE_MAX_BYTES = 256 * 1024**2
+
+
+class DataCache:
+    """Least recently used cache of data, bounded by the size of their arrays.
+
+    Parameters
+    ----------
+    `max_bytes`: `int`
+        The maximum total size of the arrays of the cached data. Data larger than
+        this are not cached.
+    """
+
+    def __init__(self, max_bytes: int = DATA_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._lock = Lock()
+        self._entries: OrderedDict[t.Hashable, tuple[t.Any, int]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key: t.Hashable | None, compute: t.Callable[[], t.Any]):
+        """Return the cached data of the key, computing and caching them if missing.
+
+        The data are computed outside of the lock, so that the cache can be used
+        from several threads while the data are parsed. `None` data are not cached.
+
+        Parameters
+        ----------
+        `key`: `Hashable`, optional
+            The key of the data, see `get_outputs_key`. If `None`, e.g. for data of
+            unstored nodes, the data are computed without being cached.
+        `compute`: `Callable[[], Any]`
+            Called to compute the data if missing.
+        """
+        if key is None:
+            return compute()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        data = compute()
+        if data is not None:
+            self.put(key, data)
+        return data
+
+    def put(self, key: t.Hashable, data):
+        """Cache the data, evicting the least recently used ones if needed."""
+        nbytes = _freeze(data)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (data, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+
+    def clear(self):
+        """Remove all the cached data."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+def get_outputs_key(outputs, *options) -> tuple | None:
+    """Return the cache key of data parsed from the outputs with the given options.
+
+    The key holds the UUIDs of the output nodes, with the name of their output,
+    and the options, which must be hashable. Returns `None`, i.e. the data are not
+    to be cached, if the outputs are missing or hold unstored nodes, which may
+    still be modified.
+    """
+    if not outputs:
+        return None
+    uuids = []
+
+    def collect(value, path):
+        if isinstance(value, Node):
+            if not value.is_stored:
+                raise ValueError
+            uuids.append((path, value.uuid))
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                collect(item, f"{path}.{key}" if path else key)
+
+    try:
+        collect(outputs, "")
+    except ValueError:
+        return None
+    return (tuple(sorted(uuids)), *options)
+
+
+@lru_cache(maxsize=1)
+def get_data_cache() -> DataCache:
+    """Return the cache of the parsed data shared by the models of the app."""
+    return DataCache()
+
+
+def _freeze(data) -> int:
+    """Make the arrays of the data read-only and return their total size in bytes."""
+    if isinstance(data, np.ndarray):
+        data.flags.writeable = False
+        return data.nbytes
+    if isinstance(data, dict):
+        return sum(_freeze(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return sum(_freeze(value) for value in data)
+    return 0
@@ -0,0 +1,342 @@
+"""Export of the bands and PDOS data to files.
+
+The data are written in chunks to files of the export directory, served by the
+Jupyter server, instead of being encoded in memory and sent to the browser.
+The browser is then handed a link to download the file, through the `files/`
+handler of the server. The export directory is thus a directory of the root
+directory of the server, in which only the latest exports are kept.
+
+The JSON, NPZ and HDF5 files hold the same content, the arrays being stored as
+entries of the NPZ and HDF5 files. The CSV files hold the curves as columns,
+with the Fermi energies and the path labels as comment lines.
+
+The exported bands data keep the keys of the bands data of AiiDA's
+`BandsData._get_bandplot_data`, which the bands data were built from before the
+k-path was built by `build_kpath`, see `get_legacy_bands_data`.
+"""
+
+from __future__ import annotations
+
+import getpass
+import json
+import os
+import shutil
+import tempfile
+import time
+from functools import lru_cache
+from importlib.util import find_spec
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+
+from aiidalab_qe.common.bands_pdos.payload import _extract_arrays
+
+EXPORT_FORMATS = ["json", "npz", "csv"]
+if find_spec("h5py") is not None:
+    EXPORT_FORMATS.append("hdf5")
+
+# Number of rows of the CSV tables formatted at once
+CSV_CHUNK_SIZE = 4096
+
+# Name of the export directory, in the root directory of the Jupyter server. It is
+# not hidden, as hidden files are not served by default.
+EXPORT_DIRNAME = "aiidalab_qe_exports"
+
+# Maximum number, and age in seconds, of the exports kept in the export directory
+EXPORT_MAX_COUNT = 20
+EXPORT_MAX_AGE = 24 * 3600
+
+
+@lru_cache(maxsize=1)
+def get_server_info() -> dict | None:
+    """Return the `root_dir` and `base_url` of the Jupyter server of the kernel.
+
+    The server is the one whose root directory holds the working directory of the
+    kernel, i.e. of the notebook. Returns `None` without a running server.
+    """
+    try:
+        from jupyter_server.serverapp import list_running_servers
+    except ImportError:
+        return None
+    cwd = Path.cwd().resolve()
+    for server in list_running_servers():
+        root_dir = Path(server["root_dir"]).expanduser().resolve()
+        if cwd == root_dir or root_dir in cwd.parents:
+            return {"root_dir": root_dir, "base_url": server["base_url"]}
+    return None
+
+
+def get_export_dir() -> Path:
+    """Return the export directory, in the root directory of the Jupyter server.
+
+    Without a running server, e.g. in scripts, the exports are written to a
+    directory of the temporary directory of the user.
+    """
+    if server := get_server_info():
+        return server["root_dir"] / EXPORT_DIRNAME
+    return Path(tempfile.gettempdir()) / f"{EXPORT_DIRNAME}_{getpass.getuser()}"
+
+
+def get_download_url(path: Path) -> str:
+    """Return the URL of the exported file, served by the `files/` handler.
+
+    Without a running server, the URL is the path relative to the working
+    directory.
+    """
+    if not (server := get_server_info()):
+        return Path(os.path.relpath(path, Path.cwd())).as_posix()
+    relative = Path(path).resolve().relative_to(server["root_dir"]).as_posix()
+    return f"{server['base_url'].rstrip('/')}/files/{quote(relative)}"
+
+
+def prune_exports(export_dir: Path, keep: Path | None = None):
+    """Remove the old exports, beyond `EXPORT_MAX_COUNT` or `EXPORT_MAX_AGE`.
+
+    Parameters
+    ----------
+    `export_dir`: `pathlib.Path`
+        The export directory.
+    `keep`: `pathlib.Path`, optional
+        The directory of an export to keep, e.g. the one being downloaded.
+    """
+    directories = []
+    for directory in export_dir.iterdir():
+        try:
+            if directory.is_dir() and directory != keep:
+                directories.append((directory.stat().st_mtime, directory))
+        except OSError:  # e.g. removed meanwhile
+            continue
+    directories.sort(reverse=True)
+    oldest = time.time() - EXPORT_MAX_AGE
+    for index, (mtime, directory) in enumerate(directories):
+        if mtime < oldest or index >= EXPORT_MAX_COUNT - 1:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def export_data(data, name, export_format, export_dir=None) -> Path:
+    """Export the bands or PDOS data to a new file of the export directory.
+
+    The file is written under a temporary name and renamed once complete, so
+    that an interrupted export never leaves a truncated file behind.
+
+    Parameters
+    ----------
+    `data`: `dict`
+        The bands data, as returned by `get_bands_data`, or the PDOS data, as
+        returned by `get_pdos_data`.
+    `name`: `str`
+        The kind of data, `bands` or `dos`, and the stem of the file name.
+    `export_format`: `str`
+        One of `EXPORT_FORMATS`.
+    `export_dir`: `pathlib.Path`, optional
+        The directory of the exports, by default `get_export_dir()`.
+
+    Returns
+    -------
+    `pathlib.Path`
+        The path of the file, in a new subdirectory of the export directory.
+    """
+    writers = {
+        "json": write_json,
+        "npz": write_npz,
+        "csv": write_bands_csv if name == "bands" else write_pdos_csv,
+        "hdf5": write_hdf5,
+    }
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    if name == "bands" and export_format != "csv":
+        data = get_legacy_bands_data(data)
+
+    export_dir = Path(export_dir or get_export_dir())
+    export_dir.mkdir(parents=True, exist_ok=True)
+    directory = Path(tempfile.mkdtemp(prefix=f"{name}_", dir=export_dir))
+    extension = "h5" if export_format == "hdf5" else export_format
+    path = directory / f"{name}_data.{extension}"
+    partial_path = path.with_name(f".{path.name}.part")
+    writers[export_format](data, partial_path)
+    os.replace(partial_path, path)
+    prune_exports(export_dir, keep=directory)
+    return path
+
+
+def get_legacy_bands_data(bands_data) -> dict:
+    """Return the bands data with the keys of AiiDA's `_get_bandplot_data`.
+
+    The `raw_labels` and `labels` are the `(x, label)` pairs of the high-symmetry
+    k-points, and the `path` and `paths` are the pairs of consecutive labels and
+    the bands between them, as returned by `BandsData._get_bandplot_data` with
+    `get_segments=True`.
+
+    Parameters
+    ----------
+    `bands_data`: `dict`
+        The bands data, as returned by `get_bands_data`.
+
+    Returns
+    -------
+    `dict`
+        A copy of the bands data, with the legacy keys added.
+    """
+    x = np.asarray(bands_data["x"], dtype=float)
+    y = np.asarray(bands_data["y"], dtype=float)
+    two_band_types = bool(np.any(np.asarray(bands_data["band_type_idx"]) == 1))
+    labels = [(int(index), name) for index, name in bands_data.get("kpoint_labels", [])]
+    raw_labels = [(float(x[index]), name) for index, name in labels]
+
+    labelled = len(labels) > 1
+    if labelled:
+        if labels[0][0] != 0:
+            labels.insert(0, (0, ""))
+        if labels[-1][0] != len(y) - 1:
+            labels.append((len(y) - 1, ""))
+    else:
+        labels = [(0, "0"), (len(y) - 1, "1")]
+
+    path = []
+    paths = []
+    for (start, label_from), (end, label_to) in zip(labels, labels[1:]):
+        # As in AiiDA, the discontinuities, e.g. X|U, are not paths of their own
+        if end - start > 1 or not labelled:
+            path.append([label_from, label_to])
+        paths.append(
+            {
+                "length": end - start,
+                "from": label_from,
+                "to": label_to,
+                "values": y[start : end + 1].T.tolist(),
+                "x": x[start : end + 1].tolist(),
+                "two_band_types": two_band_types,
+            }
+        )
+
+    return {
+        **bands_data,
+        "raw_labels": raw_labels,
+        "labels": raw_labels,
+        "path": path,
+        "paths": paths,
+    }
+
+
+def write_json(data, path):
+    """Write the data to a JSON file, encoded in chunks."""
+    encoder = json.JSONEncoder(default=_to_json)
+    with open(path, "w", encoding="utf-8") as handle:
+        for chunk in encoder.iterencode(data):
+            handle.write(chunk)
+
+
+def write_npz(data, path):
+    """Write the data to an `.npz` archive.
+
+    The arrays are stored as entries of the archive, while the rest of the data is
+    stored as a JSON `metadata` entry, referring to the arrays by their entry name,
+    as in the plot payload.
+    """
+    arrays = {}
+    metadata = _extract_arrays(data, "data", arrays)
+    with open(path, "wb") as handle:
+        np.savez_compressed(handle, metadata=np.array(json.dumps(metadata)), **arrays)
+
+
+def write_hdf5(data, path):
+    """Write the data to an HDF5 file.
+
+    The arrays are stored as datasets, while the rest of the data is stored as a
+    JSON `metadata` attribute, as for the `.npz` archives.
+    """
+    import h5py
+
+    arrays = {}
+    metadata = _extract_arrays(data, "data", arrays)
+    with h5py.File(path, "w") as handle:
+        handle.attrs["metadata"] = json.dumps(metadata)
+        for key, array in arrays.items():
+            handle.create_dataset(key, data=array, compression="gzip")
+
+
+def write_bands_csv(bands_data, path):
+    """Write the bands to a CSV file, with a column per band.
+
+    The rows are the points of the k-path, the first column being their distance
+    along the path.
+    """
+    x = np.asarray(bands_data["x"], dtype=float)
+    y = np.asarray(bands_data["y"], dtype=float)
+    band_type_idx = np.asarray(bands_data["band_type_idx"])
+    if 1 in band_type_idx:
+        spins = np.where(band_type_idx == 0, "up", "down")
+        columns = [f"band_{index} ({spin})" for index, spin in enumerate(spins)]
+    else:
+        columns = [f"band_{index}" for index in range(y.shape[1])]
+
+    comments = _get_fermi_energy_comments(bands_data)
+    comments += [
+        f"label {label} at x={float(position):.8g}"
+        for label, position in zip(*bands_data["pathlabels"])
+    ]
+    _write_csv(path, comments, ["x", *columns], np.column_stack([x, y]))
+
+
+def write_pdos_csv(pdos_data, path):
+    """Write the DOS to a CSV file.
+
+    The traces sharing the energy grid of the total DOS are written as columns,
+    with a row per energy. Otherwise, the traces are written one after the other,
+    with a row per point of each trace.
+    """
+    traces = pdos_data["dos"]
+    comments = _get_fermi_energy_comments(pdos_data)
+    energies = np.asarray(traces[0]["x"], dtype=float)
+    if all(np.array_equal(trace["x"], energies) for trace in traces):
+        labels = [_csv_field(trace["label"]) for trace in traces]
+        rows = np.column_stack([energies, *(trace["y"] for trace in traces)])
+        _write_csv(path, comments, ["energy", *labels], rows)
+        return
+
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.writelines(f"# {comment}\n" for comment in comments)
+        handle.write("label,energy,dos\n")
+        for trace in traces:
+            rows = np.column_stack([trace["x"], trace["y"]]).astype(float)
+            prefix = f"{_csv_field(trace['label'])},".replace("%", "%%")
+            _write_rows(handle, rows, prefix)
+
+
+def _write_csv(path, comments, header, rows):
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.writelines(f"# {comment}\n" for comment in comments)
+        handle.write(",".join(header) + "\n")
+        _write_rows(handle, rows)
+
+
+def _write_rows(handle, rows, prefix=""):
+    """Write the rows of a table in chunks of `CSV_CHUNK_SIZE` rows."""
+    row_format = prefix + ",".join(["%.8g"] * rows.shape[1])
+    for start in range(0, len(rows), CSV_CHUNK_SIZE):
+        np.savetxt(handle, rows[start : start + CSV_CHUNK_SIZE], fmt=row_format)
+
+
+def _get_fermi_energy_comments(data):
+    return [
+        f"{key} = {data[key]} eV"
+        for key in ("fermi_energy", "fermi_energy_up", "fermi_energy_down")
+        if key in data
+    ]
+
+
+def _csv_field(value):
+    """Quote a field of a CSV file if needed."""
+    if any(character in value for character in ',"\n'):
+        return '"{}"'.format(value.replace('"', '""'))
+    return value
+
+
+def _to_json(value):
+    """Convert the NumPy arrays of the data to JSON-serializable lists."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
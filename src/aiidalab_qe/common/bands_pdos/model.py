@@ -1,27 +1,47 @@
 from __future__ import annotations
 
 import base64
-import json
+import threading
 
 import ipywidgets as ipw
-import numpy as np
+import plotly.colors
 import traitlets as tl
 from IPython.display import display
 
 from aiida import orm
 from aiida.common.extendeddicts import AttributeDict
+from aiidalab_qe.common.bands_pdos.broadening import BROADENING_TYPES
+from aiidalab_qe.common.bands_pdos.cache import get_data_cache, get_outputs_key
+from aiidalab_qe.common.bands_pdos.export import (
+    EXPORT_FORMATS,
+    export_data,
+    get_download_url,
+)
+from aiidalab_qe.common.bands_pdos.payload import (
+    PLOT_PAYLOAD_GROUPING,
+    load_plot_payload,
+)
 from aiidalab_qe.common.bands_pdos.utils import (
     HTML_TAGS,
+    ProjectedBandsBuilder,
+    align_bands_data,
     extract_bands_output,
     extract_pdos_output,
     get_bands_data,
-    get_bands_projections_data,
+    get_bands_masks,
+    get_bands_projections_builder,
     get_pdos_data,
     hex_to_rgba,
+    load_bands_data,
+    mask_bands_projections,
+    reload_outputs,
     replace_html_tags,
     rgba_to_hex,
+    slice_pdos_data,
 )
+from aiidalab_qe.common.image_renderer import get_image_renderer
 from aiidalab_qe.common.mvc import Model
+from aiidalab_qe.common.worker import BackgroundWorker
 from aiidalab_widgets_base.utils import string_range_to_list
 
 from .bandpdosplotly import BandsPdosPlotly
@@ -54,19 +74,49 @@ class BandsPdosModel(Model):
     project_bands_box = tl.Bool(False)
     proj_bands_width = tl.Float(0.5)
 
+    # Broadening width, in eV, of the DOS recomputed from the eigenvalues, or 0 to
+    # plot the DOS computed by `projwfc.x`
+    dos_broadening = tl.Float(0.0)
+    dos_broadening_type_options = tl.List(
+        trait=tl.Unicode(), default_value=BROADENING_TYPES
+    )
+    dos_broadening_type = tl.Unicode("gaussian")
+
     needs_pdos_options = tl.Bool(False)
     needs_projections_controls = tl.Bool(False)
+    needs_broadening_controls = tl.Bool(False)
 
-    trace = tl.Int()
+    # The selected trace and the options of the trace selector, by trace key
+    trace = tl.Unicode(allow_none=True)
     trace_selector_options = tl.List(
-        trait=tl.Tuple((tl.Unicode(), tl.Int())),
+        trait=tl.Tuple((tl.Unicode(), tl.Unicode())),
     )
     color_picker = tl.Unicode("#1f77b4")
 
+    # Progress of the preparation of the plot data in the background
+    updating = tl.Bool(False)
+    progress = tl.Float(0.0)
+    progress_message = tl.Unicode("")
+
+    # Whether an image of the plot is being rendered for download
+    rendering_image = tl.Bool(False)
+    image_error = tl.Unicode("")
+
     pdos_data = {}
     bands_data = {}
     external_bands_data = {}
     bands_projections_data = {}
+    _bands_projections_builder = None
+
+    helper = None
+    plot = None
+
+    # Precomputed plot data of the default groupings, see `payload.py`
+    plot_payload = None
+
+    # Energy window, relative to the Fermi energy, of the PDOS and projected bands
+    # data. It is extended when zooming out of it.
+    energy_window = None
 
     # Image format options
     image_format_options = tl.List(
@@ -74,6 +124,10 @@ class BandsPdosModel(Model):
     )
     image_format = tl.Unicode("png")
 
+    # Data export format options
+    data_format_options = tl.List(trait=tl.Unicode(), default_value=EXPORT_FORMATS)
+    data_format = tl.Unicode("json")
+
     # Aspect ratio
     horizontal_width = 850  # pixels
     horizontal_width_percentage = tl.Int(100)
@@ -83,11 +137,24 @@ class BandsPdosModel(Model):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        self._worker = BackgroundWorker()
+        # Scopes of the plot updates requested since the last applied one
+        self._pending_updates = set()
+        # Bands data loaded by a (possibly superseded) background request
+        self._prepared_bands_data = None
+        # Outputs with their nodes loaded in each thread, see `reload_outputs`
+        self._thread_outputs = {}
+
         ipw.dlink(
             (self, "bands"),
             (self, "needs_projections_controls"),
             lambda _: self._has_bands_projections,
         )
+        ipw.dlink(
+            (self, "pdos"),
+            (self, "needs_broadening_controls"),
+            lambda _: self._has_pdos,
+        )
         ipw.dlink(
             (self, "pdos"),
             (self, "needs_pdos_options"),
@@ -109,7 +176,8 @@ class BandsPdosModel(Model):
         """Create a `BandsPdosModel` instance from the provided nodes.
 
         The method attempts to extract the output attribute dictionaries from the
-        nodes and creates from them an instance of the model.
+        nodes and creates from them an instance of the model. The precomputed plot
+        payload of the root node is used, if available.
 
         Parameters
         ----------
@@ -139,24 +207,197 @@ class BandsPdosModel(Model):
         else:
             raise ValueError("At least one of the nodes must be provided")
         if bands_output or pdos_output:
-            return cls(bands=bands_output, pdos=pdos_output)
+            model = cls(bands=bands_output, pdos=pdos_output)
+            model.plot_payload = load_plot_payload(root)
+            return model
         raise ValueError("Failed to parse at least one node")
 
+    @classmethod
+    def from_comparison(
+        cls,
+        pks: list[int],
+        labels: list[str] | None = None,
+        max_workers: int = 8,
+    ):
+        """Create a `BandsPdosModel` instance comparing many band structures.
+
+        The bands of the workchains, e.g. of a strain or doping series, are loaded
+        concurrently. The first workchain is the reference, onto the k-path of
+        which the others are aligned. All bands are plotted relative to their own
+        Fermi energy, with a single trace per spin and workchain.
+
+        Parameters
+        ----------
+        `pks`: `list[int]`
+            The PKs of the workchains with bands outputs.
+        `labels`: `list[str]`, optional
+            The legend labels of the workchains. Defaults to their PKs.
+        `max_workers`: `int`
+            The maximum number of workchains loaded at once.
+
+        Returns
+        -------
+        `BandsPdosModel`
+            The model instance.
+
+        Raises
+        ------
+        `ValueError`
+            If no PK is provided, if the number of labels does not match, or if a
+            workchain has no bands outputs.
+        """
+        if not pks:
+            raise ValueError("At least one workchain PK must be provided")
+        labels = labels or [f"<{pk}>" for pk in pks]
+        if len(labels) != len(pks):
+            raise ValueError("The number of labels must match the number of PKs")
+
+        bands_data = load_bands_data(pks, max_workers=max_workers)
+        colors = plotly.colors.qualitative.Plotly
+
+        model = cls(
+            bands=extract_bands_output(orm.load_node(pks[0])),
+            plot_settings={
+                "bands_trace_settings": {"name": labels[0], "color": colors[0]},
+            },
+        )
+        model.bands_data = bands_data[0]
+        model.external_bands_data = {
+            label: {
+                **align_bands_data(data, bands_data[0]),
+                "trace_settings": {"color": colors[i % len(colors)]},
+            }
+            for i, (label, data) in enumerate(zip(labels, bands_data))
+            if i > 0
+        }
+        return model
+
     def fetch_data(self):
         """Fetch the data from the nodes."""
+        self._init_energy_window()
         if self.bands:
-            if not self.bands_data:
-                self.bands_data = self._get_bands_data(self.bands)
-            if not self.external_bands_data:
-                for key, bands_data in self.external_bands.items():
-                    self.external_bands_data[key] = self._get_bands_data(bands_data)
-                    self.external_bands_data[key]["trace_settings"] = bands_data.get(
-                        "trace_settings", {}
-                    )
+            self.bands_data, self.external_bands_data = self._get_all_bands_data()
 
         if self.pdos:
             self.pdos_data = self._get_pdos_data()
 
+    def request_plot_update(self, pdos=True, projections=True):
+        """Prepare the plot data in the background, then create or update the plot.
+
+        The data is prepared in a worker thread, which reports its progress in the
+        `progress` and `progress_message` traits, and is applied on the UI thread
+        once ready. A new request supersedes the pending one, taking over its
+        scope, e.g. when the user changes the grouping quickly.
+
+        Parameters
+        ----------
+        `pdos`: `bool`
+            Whether to update the PDOS, e.g. for a new grouping.
+        `projections`: `bool`
+            Whether to update the projected bands.
+        """
+        self._init_energy_window()
+        if pdos:
+            self._pending_updates.add("pdos")
+        if projections:
+            self._pending_updates.add("projections")
+        scope = frozenset(self._pending_updates)
+
+        self.updating = True
+        self.progress = 0.0
+        self.progress_message = "Preparing the plot data"
+        self._worker.submit(
+            lambda request: self._prepare_plot_data(request, scope),
+            on_result=self._apply_plot_data,
+            on_progress=self._on_update_progress,
+            on_error=self._on_update_error,
+        )
+
+    def wait_for_update(self, timeout=None):
+        """Wait for the requested plot update, see `BackgroundWorker.wait`."""
+        self._worker.wait(timeout)
+
+    def _prepare_plot_data(self, request, scope):
+        """Prepare the data of a plot update, in the worker thread."""
+        result = {}
+        if self.bands and not self.bands_data:
+            if self._prepared_bands_data is None:
+                request.report_progress(0.0, "Loading the bands")
+                self._prepared_bands_data = self._get_all_bands_data(
+                    bands=self._get_thread_outputs("bands"),
+                    external_bands=self._get_thread_outputs("external_bands"),
+                )
+            result["bands_data"], result["external_bands_data"] = (
+                self._prepared_bands_data
+            )
+
+        if self.pdos and "pdos" in scope:
+            request.report_progress(0.3, "Loading the PDOS")
+            result["pdos_data"] = self._get_pdos_data(
+                pdos=self._get_thread_outputs("pdos")
+            )
+
+        if self._has_bands_projections and "projections" in scope:
+            if self.project_bands_box:
+                request.report_progress(0.6, "Loading the projected bands")
+                result["bands_projections_builder"] = (
+                    self._get_bands_projections_builder(
+                        bands=self._get_thread_outputs("bands"),
+                        bands_data=result.get("bands_data", self.bands_data),
+                    )
+                )
+
+        request.report_progress(0.9, "Plotting")
+        return result
+
+    def _apply_plot_data(self, result):
+        """Apply the prepared plot data, on the UI thread."""
+        scope, self._pending_updates = self._pending_updates, set()
+        if "bands_data" in result:
+            self.bands_data = result["bands_data"]
+            self.external_bands_data = result["external_bands_data"]
+        if "pdos_data" in result:
+            self.pdos_data = result["pdos_data"]
+
+        if self.plot is None:
+            self.create_plot()
+        elif "pdos_data" in result:
+            self._update_pdos_traces()
+        if self._has_bands_projections and "projections" in scope:
+            self._apply_bands_projections(result.get("bands_projections_builder"))
+
+        self.progress = 1.0
+        self.progress_message = ""
+        self.updating = False
+
+    def _on_update_progress(self, progress, message):
+        self.progress = progress
+        self.progress_message = message
+
+    def _on_update_error(self, error):
+        self._pending_updates.clear()
+        self.progress_message = f"Failed to prepare the plot data: {error}"
+        self.updating = False
+
+    def _get_thread_outputs(self, name):
+        """Return the `bands`, `pdos` or `external_bands` outputs, with their nodes
+        loaded in the current thread."""
+        outputs = getattr(self, name)
+        key = (threading.get_ident(), name)
+        if (
+            key not in self._thread_outputs
+            or self._thread_outputs[key][0] is not outputs
+        ):
+            self._thread_outputs[key] = (outputs, reload_outputs(outputs))
+        return self._thread_outputs[key][1]
+
+    def _init_energy_window(self):
+        if self.energy_window is None:
+            self.energy_window = self._get_padded_energy_window(
+                *BandsPdosPlotly.SETTINGS["vertical_range_bands"],
+                *BandsPdosPlotly.SETTINGS["horizontal_range_pdos"],
+            )
+
     def create_plot(self):
         """Create the plot."""
         self.helper = BandsPdosPlotly(
@@ -167,55 +408,95 @@ class BandsPdosModel(Model):
             plot_settings=self.plot_settings,
         )
         self.plot = self.helper.bandspdosfigure
-        self._get_traces_selector_options()
+        self.plot.layout.on_change(
+            self._on_energy_range_change,
+            f"{self.helper.energy_axis}.range",
+        )
+        self.trace_selector_options = []
+        self._update_traces_selector_options(
+            added=[trace.meta for trace in self.plot.data]
+        )
 
     def update_bands_projections(self):
-        """Update the bands projections."""
+        """Update the bands projections.
+
+        Only the projected bands traces whose key changed are removed or added,
+        the others are updated in place.
+        """
+        self._apply_bands_projections(
+            self._get_bands_projections_builder() if self.project_bands_box else None
+        )
+
+    def _apply_bands_projections(self, builder):
+        """Plot the bands projections of the builder, or remove them if unchecked."""
         if self.project_bands_box:
-            if self.bands_projections_data:
-                self._remove_bands_traces()
-            self.bands_projections_data = self._get_bands_projections_data()
+            self._bands_projections_builder = builder
+            self.bands_projections_data = self._build_bands_projections_data()
             self.helper.project_bands = self.bands_projections_data
-            self.helper.adding_projected_bands(self.plot)
+            removed, added = self.helper.update_projection_traces(self.plot)
         else:
-            self._remove_bands_traces()
-        self._get_traces_selector_options()
+            removed, added = self._remove_bands_traces()
+        self._update_traces_selector_options(removed, added)
 
     def update_bands_projections_thickness(self):
-        """Update the bands projections thickness."""
-        if self.project_bands_box:
-            self.bands_projections_data = self._get_bands_projections_data()
+        """Update the bands projections thickness.
+
+        Only the `y` arrays of the existing traces are rebuilt for the new width.
+        """
+        if self.project_bands_box and self._bands_projections_builder:
+            self.bands_projections_data = self._build_bands_projections_data()
             self.helper.project_bands = self.bands_projections_data
             self.helper.update_projected_bands_thickness(self.plot)
 
     def _remove_bands_traces(self):
-        """Remove the bands traces."""
-        self.plot.data = tuple(
-            trace
-            for trace in self.plot.data
-            if trace.xaxis == "x2" or trace.legendgroup == ""
-        )
+        """Remove the projected bands traces.
+
+        Returns the keys of the removed and added traces, see `update_traces`.
+        """
         self.bands_projections_data = {}
+        self._bands_projections_builder = None
         self.helper.project_bands = {}
-
-    def _remove_pdos_traces(self):
-        """Remove the PDOS traces."""
-        if self.helper.plot_type == "pdos":
-            self.plot.data = ()
-        elif self.helper.plot_type == "combined":
-            self.plot.data = tuple(
-                trace for trace in self.plot.data if trace.xaxis != "x2"
-            )
+        return self.helper.update_projection_traces(self.plot)
 
     def update_pdos_plot(self):
-        """Update the PDOS plot."""
+        """Update the PDOS plot.
+
+        Only the PDOS traces whose key changed are removed or added, the others
+        are updated in place.
+        """
         self.fetch_data()
+        self._update_pdos_traces()
         if self.project_bands_box:
             self.update_bands_projections()
+
+    def _update_pdos_traces(self):
         self.helper.pdos_data = self.pdos_data
-        self._remove_pdos_traces()
-        self.helper.adding_pdos_traces(self.plot)
-        self._get_traces_selector_options()
+        removed, added = self.helper.update_pdos_traces(self.plot)
+        self._update_traces_selector_options(removed, added)
+
+    def _on_energy_range_change(self, _, energy_range):
+        """Extend the energy window of the data when zooming out of it."""
+        if not energy_range or self.energy_window is None:
+            return
+        emin, emax = energy_range
+        if self.energy_window[0] <= emin and emax <= self.energy_window[1]:
+            return
+        self.energy_window = self._get_padded_energy_window(
+            emin, emax, *self.energy_window
+        )
+        # The data of the extended window are prepared in the background, as any
+        # other plot update, superseded by the next zoom if still pending
+        pdos = bool(self.pdos_data)
+        projections = bool(self.project_bands_box and self.bands_projections_data)
+        if pdos or projections:
+            self.request_plot_update(pdos=pdos, projections=projections)
+
+    @staticmethod
+    def _get_padded_energy_window(*energies):
+        """Return the window of the energies, padded by half its width on each side."""
+        emin, emax = min(energies), max(energies)
+        padding = (emax - emin) / 2
+        return (emin - padding, emax + padding)
 
     @property
     def _has_bands(self):
@@ -229,75 +510,171 @@ class BandsPdosModel(Model):
     def _has_bands_projections(self):
         return self._has_bands and "projwfc" in self.bands
 
-    def _get_pdos_data(self):
-        if not self.pdos:
+    def _get_pdos_data(self, windowed=True, pdos=None):
+        pdos = pdos or self.pdos
+        if not pdos:
             return None
+        energy_window = self.energy_window if windowed else None
+        if not self.dos_broadening and (pdos_data := self._get_plot_payload("pdos")):
+            return slice_pdos_data(pdos_data, energy_window)
         expanded_selection, syntax_ok = string_range_to_list(
             self.selected_atoms, shift=-1
         )
-        if syntax_ok:
-            return get_pdos_data(
-                self.pdos,
-                group_tag=self.dos_atoms_group,
-                plot_tag=self.dos_plot_group,
-                selected_atoms=expanded_selection,
-            )
-        return None
+        if not syntax_ok:
+            return None
+        options = {
+            "group_tag": self.dos_atoms_group,
+            "plot_tag": self.dos_plot_group,
+            "selected_atoms": tuple(expanded_selection),
+            "energy_window": energy_window,
+            "broadening": self.dos_broadening,
+            "broadening_type": self.dos_broadening_type,
+        }
+        # The PDOS are cached for each set of options
+        return get_data_cache().get(
+            get_outputs_key(pdos, "pdos", *sorted(options.items())),
+            lambda: get_pdos_data(pdos, **options),
+        )
 
     def _get_bands_data(self, bands=None):
         if not bands:
             return None
 
-        bands_data = get_bands_data(bands)
-        return bands_data
+        return get_data_cache().get(
+            get_outputs_key(bands, "bands"),
+            lambda: get_bands_data(bands),
+        )
+
+    def _get_all_bands_data(self, bands=None, external_bands=None):
+        """Return the bands data and the external bands data, if not fetched yet."""
+        bands_data = (
+            self.bands_data
+            or self._get_plot_payload("bands")
+            or self._get_bands_data(bands or self.bands)
+        )
+        external_bands_data = self.external_bands_data
+        if not external_bands_data:
+            external_bands = external_bands or self.external_bands or {}
+            external_bands_data = {
+                key: {
+                    **self._get_bands_data(outputs),
+                    "trace_settings": outputs.get("trace_settings", {}),
+                }
+                for key, outputs in external_bands.items()
+            }
+        return bands_data, external_bands_data
 
-    def _get_bands_projections_data(self):
-        if not self.bands:
+    def _get_bands_projections_builder(self, bands=None, bands_data=None):
+        bands = bands or self.bands
+        bands_data = bands_data or self.bands_data
+        if not bands:
             return None
 
+        if projections := self._get_plot_payload("projections"):
+            bands_masks = get_bands_masks(
+                bands_data, len(projections), self.energy_window
+            )
+            return ProjectedBandsBuilder(
+                bands_data,
+                mask_bands_projections(projections, bands_masks),
+                bands_masks,
+            )
+
         expanded_selection, syntax_ok = string_range_to_list(
             self.selected_atoms, shift=-1
         )
         if syntax_ok:
-            bands_projections = get_bands_projections_data(
-                self.bands,
-                bands_data=self.bands_data,
+            return get_bands_projections_builder(
+                bands,
+                bands_data=bands_data,
                 group_tag=self.dos_atoms_group,
                 plot_tag=self.dos_plot_group,
                 selected_atoms=expanded_selection,
-                bands_width=self.proj_bands_width,
+                energy_window=self.energy_window,
             )
-            return bands_projections
         return None
 
-    def _get_traces_selector_options(self):
-        """Generate a list of unique (trace name, index) options with specific conditions."""
-        seen_names = set()
+    def _get_plot_payload(self, key):
+        """Return the `bands`, `pdos` or `projections` data of the plot payload.
 
-        self.trace_selector_options = [
-            (replace_html_tags(trace.name, HTML_TAGS), i)
-            for i, trace in enumerate(self.plot.data)
-            if trace.name not in seen_names and not seen_names.add(trace.name)
+        The PDOS and projections data are only returned for the default groupings
+        of the payload. Returns `None` if the data is not available.
+        """
+        if not self.plot_payload:
+            return None
+        if key != "bands":
+            expanded_selection, _ = string_range_to_list(self.selected_atoms, shift=-1)
+            if (
+                self.dos_atoms_group != PLOT_PAYLOAD_GROUPING["group_tag"]
+                or self.dos_plot_group != PLOT_PAYLOAD_GROUPING["plot_tag"]
+                or expanded_selection != PLOT_PAYLOAD_GROUPING["selected_atoms"]
+            ):
+                return None
+        return self.plot_payload.get(key)
+
+    def _build_bands_projections_data(self):
+        if not self._bands_projections_builder:
+            return None
+        return self._bands_projections_builder.build(self.proj_bands_width)
+
+    def _update_traces_selector_options(self, removed=(), added=()):
+        """Update the unique (trace name, trace key) options for the changed traces.
+
+        The options of the removed traces are dropped and those of the added
+        traces with a new name are appended. The figure is only scanned for the
+        names of dropped options still used by other traces, e.g. a PDOS trace and
+        the projected bands trace of the same orbitals.
+        """
+        removed, added_keys = set(removed), set(added)
+        dropped_names = {
+            name for name, key in self.trace_selector_options if key in removed
+        }
+        options = [
+            (name, key)
+            for name, key in self.trace_selector_options
+            if key not in removed
         ]
+        names = {name for name, _ in options}
+        dropped_names -= names
+
+        keys = [trace.meta for trace in self.plot.data] if dropped_names else added
+        for key in keys:
+            parsed_key = BandsPdosPlotly.parse_trace_key(key)
+            if not parsed_key:
+                continue
+            name = replace_html_tags(parsed_key[2], HTML_TAGS)
+            if name not in names and (key in added_keys or name in dropped_names):
+                names.add(name)
+                options.append((name, key))
+
+        self.trace_selector_options = options
+
+    def _get_trace(self, key):
+        """Return the trace of the figure with the given key."""
+        return next(trace for trace in self.plot.data if trace.meta == key)
 
     def update_color_picker(self, trace):
         """Update the color picker."""
         self.trace = trace
-        self.color_picker = rgba_to_hex(self.plot.data[trace].line.color)
+        if trace is not None:
+            self.color_picker = rgba_to_hex(self._get_trace(trace).line.color)
 
     def update_trace_color(self, color):
         """Update the trace color."""
-        trace_name = self.plot.data[self.trace].name
+        if self.trace is None:
+            return
+        selected_trace = self._get_trace(self.trace)
+        trace_name = selected_trace.name
 
         with self.plot.batch_update():
             if trace_name == "Bands (↑)":
                 rgba_color = hex_to_rgba(color, alpha=0.4)
-                # Update the specific trace by index
-                self.plot.data[self.trace].update(line={"color": rgba_color})
+                # Update the specific trace only
+                selected_trace.update(line={"color": rgba_color})
             elif trace_name == "Bands (↓)":
                 rgba_color = hex_to_rgba(color, alpha=0.4)
-                # Update the specific trace by index
-                self.plot.data[self.trace].update(line={"color": rgba_color})
+                # Update the specific trace only
+                selected_trace.update(line={"color": rgba_color})
             else:
                 # Update all traces with the same name
                 for trace in self.plot.data:
@@ -305,7 +682,7 @@ class BandsPdosModel(Model):
                         trace.update(line={"color": color})
 
         # Update the color picker to match the updated trace
-        self.color_picker = rgba_to_hex(self.plot.data[self.trace].line.color)
+        self.color_picker = rgba_to_hex(selected_trace.line.color)
 
     def update_horizontal_width(self, width_percentage):
         """Update the horizontal width based on the percentge."""
@@ -321,8 +698,13 @@ class BandsPdosModel(Model):
         )
 
     def download_image(self, _=None):
-        """
-        Downloads the current plot as an image in the format specified by self.image_format.
+        """Render the current plot as an image in the format specified by
+        `self.image_format`, in the background, and download it.
+
+        Returns
+        -------
+        `Future`
+            The future of the rendered image, see `ImageRenderer.render_async`.
         """
         # Define the filename
         if self.bands and self.pdos:
@@ -330,12 +712,26 @@ class BandsPdosModel(Model):
         else:
             filename = f"{'bands' if self.bands else 'pdos'}.{self.image_format}"
 
-        # Generate the image in the specified format
-        image_payload = self.plot.to_image(format=self.image_format)
-        image_payload_base64 = base64.b64encode(image_payload).decode("utf-8")
+        self.rendering_image = True
+        self.image_error = ""
+        return get_image_renderer().render_async(
+            [self.plot],
+            on_result=lambda images: self._on_image_rendered(images[0], filename),
+            on_error=self._on_image_error,
+            image_format=self.image_format,
+        )
 
+    def _on_image_rendered(self, image_payload, filename):
+        self.rendering_image = False
+        image_payload_base64 = base64.b64encode(image_payload).decode("utf-8")
         self._download_image(payload=image_payload_base64, filename=filename)
 
+    def _on_image_error(self, error):
+        # Run as a callback of the event loop, where a raised error would only be
+        # logged, the error is reported by the widget instead
+        self.rendering_image = False
+        self.image_error = f"Failed to render the image: {error}"
+
     @staticmethod
     def _download_image(payload, filename):
         from IPython.display import Javascript
@@ -356,32 +752,29 @@ class BandsPdosModel(Model):
         display(javas)
 
     def download_data(self, _=None):
-        """Function to download the data."""
+        """Export the data in the format specified by `self.data_format` and
+        download the files.
+        """
         if self.bands_data:
-            bands_data_export = {
-                key: value.tolist() if isinstance(value, np.ndarray) else value
-                for key, value in self.bands_data.items()
-            }
-            json_str = json.dumps(bands_data_export)
-            b64_str = base64.b64encode(json_str.encode()).decode()
-            file_name_bands = "bands_data.json"
-            self._download(payload=b64_str, filename=file_name_bands)
+            path = export_data(self.bands_data, "bands", self.data_format)
+            self._download(path)
         if self.pdos_data:
-            json_str = json.dumps(self.pdos_data)
-            b64_str = base64.b64encode(json_str.encode()).decode()
-            file_name_pdos = "dos_data.json"
-            self._download(payload=b64_str, filename=file_name_pdos)
+            # The plotted PDOS is restricted to the energy window
+            pdos_data = self._get_pdos_data(windowed=False)
+            path = export_data(pdos_data, "dos", self.data_format)
+            self._download(path)
 
     @staticmethod
-    def _download(payload, filename):
-        """Download payload as a file named as filename."""
+    def _download(path):
+        """Download the exported file through a link to the served file."""
         from IPython.display import Javascript
 
+        href = get_download_url(path)
         javas = Javascript(
             f"""
             var link = document.createElement('a');
-            link.href = 'data:text/json;charset=utf-8;base64,{payload}'
-            link.download = "{filename}"
+            link.href = "{href}";
+            link.download = "{path.name}";
             document.body.appendChild(link);
             link.click();
             document.body.removeChild(link);
@@ -0,0 +1,197 @@
+"""Precomputed plot payload of the bands and PDOS results.
+
+Parsing the bands, the DOS and the orbital projections is the most expensive
+part of opening the results of a calculation. The payload holds the plot data
+for the default groupings, computed once when the calculation finishes and
+stored as a versioned `.npz` file in a `SinglefileData` output of the
+`QeAppWorkChain`. If the payload is missing or outdated, the data is parsed from
+the outputs as usual.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+
+import numpy as np
+
+from aiida import orm
+from aiida.common.extendeddicts import AttributeDict
+from aiida.engine import calcfunction
+from aiidalab_qe.common.bands_pdos.cache import get_data_cache, get_outputs_key
+from aiidalab_qe.common.bands_pdos.utils import (
+    get_bands_data,
+    get_bands_projections,
+    get_orbital_table,
+    get_pdos_data,
+)
+
+PLOT_PAYLOAD_VERSION = 3
+PLOT_PAYLOAD_FILENAME = "bands_pdos.npz"
+PLOT_PAYLOAD_OUTPUT = "plot_payload"
+
+# The groupings the payload is computed for, i.e. the defaults of the plot
+PLOT_PAYLOAD_GROUPING = {
+    "group_tag": "kinds",
+    "plot_tag": "angular_momentum",
+    "selected_atoms": [],
+}
+
+# Keys of the nested inputs of `create_plot_payload`
+PLOT_PAYLOAD_INPUTS = {
+    "band_structure": ("bands", "band_structure"),
+    "band_parameters": ("bands", "band_parameters"),
+    "bands_projections": ("bands", "projwfc", "projections"),
+    "bands_projections_up": ("bands", "projwfc", "projections_up"),
+    "bands_projections_down": ("bands", "projwfc", "projections_down"),
+    "output_dos": ("pdos", "dos", "output_dos"),
+    "pdos_projections": ("pdos", "projwfc", "projections"),
+    "pdos_projections_up": ("pdos", "projwfc", "projections_up"),
+    "pdos_projections_down": ("pdos", "projwfc", "projections_down"),
+    "nscf_parameters": ("pdos", "nscf", "output_parameters"),
+}
+
+
+def build_plot_payload(bands=None, pdos=None) -> dict:
+    """Build the plot payload of the bands and/or PDOS outputs.
+
+    Parameters
+    ----------
+    `bands`: `AttributeDict`, optional
+        The bands outputs, as returned by `extract_bands_output`.
+    `pdos`: `AttributeDict`, optional
+        The PDOS outputs, as returned by `extract_pdos_output`.
+
+    Returns
+    -------
+    `dict`
+        The `bands` data, the `pdos` data and the bands `projections`, for the
+        default groupings. The missing data are `None`.
+    """
+    payload = {"bands": None, "pdos": None, "projections": None}
+    if bands:
+        payload["bands"] = get_bands_data(bands)
+        if "projwfc" in bands:
+            payload["projections"] = get_bands_projections(
+                bands, **PLOT_PAYLOAD_GROUPING
+            )
+    if pdos:
+        payload["pdos"] = get_pdos_data(pdos, **PLOT_PAYLOAD_GROUPING)
+    return payload
+
+
+def get_plot_payload_inputs(bands=None, pdos=None) -> dict:
+    """Return the flat inputs of `create_plot_payload` from the outputs."""
+    outputs = {"bands": bands, "pdos": pdos}
+    inputs = {}
+    for key, path in PLOT_PAYLOAD_INPUTS.items():
+        value = outputs
+        for name in path:
+            value = value[name] if value and name in value else None
+        if value is not None:
+            inputs[key] = value
+    return inputs
+
+
+@calcfunction
+def create_plot_payload(**kwargs) -> orm.SinglefileData:
+    """Create the plot payload file of the bands and/or PDOS outputs.
+
+    The inputs are the output nodes, flattened as in `PLOT_PAYLOAD_INPUTS`.
+    """
+    outputs = {"bands": AttributeDict(), "pdos": AttributeDict()}
+    for key, node in kwargs.items():
+        *namespaces, name = PLOT_PAYLOAD_INPUTS[key]
+        namespace = outputs
+        for namespace_name in namespaces:
+            namespace = namespace.setdefault(namespace_name, AttributeDict())
+        namespace[name] = node
+        if isinstance(node, orm.ProjectionData):
+            # Stored in the extras, for the other groupings to be parsed faster
+            get_orbital_table(node, persist=True)
+
+    payload = build_plot_payload(
+        bands=outputs["bands"] or None,
+        pdos=outputs["pdos"] or None,
+    )
+    handle = io.BytesIO()
+    write_plot_payload(payload, handle)
+    handle.seek(0)
+    return orm.SinglefileData(handle, filename=PLOT_PAYLOAD_FILENAME)
+
+
+def load_plot_payload(node: orm.WorkChainNode | None) -> dict | None:
+    """Load the plot payload of the given workchain node, if available.
+
+    The payload is read once per process, see `cache.py`. Returns `None` if the
+    node has no payload, or if the payload version differs from the current one.
+    """
+    if not node or PLOT_PAYLOAD_OUTPUT not in node.outputs:
+        return None
+    payload_node = node.outputs[PLOT_PAYLOAD_OUTPUT]
+
+    def read():
+        with payload_node.open(mode="rb") as handle:
+            return read_plot_payload(io.BytesIO(handle.read()))
+
+    return get_data_cache().get(
+        get_outputs_key({PLOT_PAYLOAD_OUTPUT: payload_node}, "payload"),
+        read,
+    )
+
+
+def write_plot_payload(payload, handle):
+    """Write the plot payload to a binary file handle as an `.npz` archive.
+
+    The arrays are stored as entries of the archive, while the rest of the data is
+    stored as a JSON `metadata` entry, referring to the arrays by their entry name.
+    """
+    arrays = {}
+    metadata = {
+        "version": PLOT_PAYLOAD_VERSION,
+        "payload": _extract_arrays(payload, "payload", arrays),
+    }
+    np.savez_compressed(handle, metadata=np.array(json.dumps(metadata)), **arrays)
+
+
+def read_plot_payload(handle) -> dict | None:
+    """Read the plot payload from a binary file handle.
+
+    Returns `None` if the payload version differs from the current one.
+    """
+    with np.load(handle, allow_pickle=False) as archive:
+        metadata = json.loads(archive["metadata"].item())
+        if metadata.get("version") != PLOT_PAYLOAD_VERSION:
+            return None
+        return _insert_arrays(metadata["payload"], archive)
+
+
+def _extract_arrays(value, name, arrays):
+    """Replace the arrays of a nested value by references to entries of `arrays`."""
+    if isinstance(value, np.ndarray):
+        arrays[name] = value
+        return {"__array__": name}
+    if isinstance(value, dict):
+        return {
+            key: _extract_arrays(item, f"{name}.{key}", arrays)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [
+            _extract_arrays(item, f"{name}.{index}", arrays)
+            for index, item in enumerate(value)
+        ]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _insert_arrays(value, archive):
+    """Replace the array references of a nested value by the archive entries."""
+    if isinstance(value, dict):
+        if "__array__" in value:
+            return archive[value["__array__"]]
+        return {key: _insert_arrays(item, archive) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_insert_arrays(item, archive) for item in value]
+    return value
@@ -1,13 +1,23 @@
 from __future__ import annotations
 
-import json
+import copy
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import NamedTuple
 
 import numpy as np
 from pymatgen.core.periodic_table import Element
 
 from aiida.common.extendeddicts import AttributeDict
-from aiida.orm import ProjectionData, WorkChainNode
+from aiida.orm import Node, ProjectionData, WorkChainNode, load_node
+from aiidalab_qe.common.bands_pdos.broadening import (
+    Broadening,
+    broaden,
+    get_eigenvalues,
+)
+from aiidalab_qe.common.bands_pdos.cache import get_data_cache, get_outputs_key
 
 # Constants for HTML tags
 HTML_TAGS = {
@@ -39,6 +49,39 @@ HTML_TAGS = {
     "m_j": "m<sub>j</sub>",
 }
 
+# Greek letters of the labels of the high-symmetry k-points
+UNICODE_SYMBOL = {
+    "GAMMA": "\u0393",
+    "DELTA": "\u0394",
+    "LAMBDA": "\u039b",
+    "SIGMA": "\u03a3",
+    "EPSILON": "\u0395",
+}
+
+# Grouping keys, with `var` the atom position, `var1` the kind name, `var2` the
+# orbital name and `var3` the angular momentum
+GROUPING_KEY_FORMATS = {
+    ("atoms", "total"): r"{var1}-{var}",
+    ("kinds", "total"): r"{var1}",
+    ("atoms", "orbital"): r"{var1}-{var2}<br>{var}",
+    ("kinds", "orbital"): r"{var1}-{var2}",
+    ("atoms", "angular_momentum"): r"{var1}-{var3}<br>{var}",
+    ("kinds", "angular_momentum"): r"{var1}-{var3}",
+}
+
+# Columns of the orbital table identifying the groups of each orbital grouping
+GROUPING_COLUMNS = {
+    "total": [],
+    "orbital": ["orbital_index"],
+    "angular_momentum": ["angular_momentum_index"],
+}
+
+# Maximum number of orbital arrays stacked at once when reducing projections
+REDUCE_CHUNK_SIZE = 64
+
+ORBITAL_TABLE_VERSION = 1
+ORBITAL_TABLE_EXTRA = "aiidalab_qe_orbital_table"
+
 
 def extract_pdos_output(node: WorkChainNode) -> AttributeDict | None:
     """Extract the PDOS output node from the given node.
@@ -91,12 +134,51 @@ def extract_bands_output(node: WorkChainNode) -> AttributeDict | None:
 
 
 def get_bands_data(outputs, fermi_energy=None):
+    """Return the plot data of the band structure of the bands outputs.
+
+    Parameters
+    ----------
+    `outputs`: `AttributeDict`
+        The bands outputs, as returned by `extract_bands_output`.
+    `fermi_energy`: `float`, optional
+        The Fermi energy, by default the one of the band parameters.
+
+    Returns
+    -------
+    `dict`
+        The bands `y` of shape `(n_kpoints, n_bands)`, the spin of each band in
+        `band_type_idx`, the Fermi energy or energies, and the k-path data, see
+        `build_kpath`. Returns `None` if the outputs have no band structure.
+    """
     if "band_structure" not in outputs:
         return None
 
-    bands_data = outputs.band_structure._get_bandplot_data(
-        cartesian=True, prettify_format=None, join_symbol=None, get_segments=True
-    )
+    band_structure = outputs.band_structure
+    stored_bands = band_structure.get_bands()
+    if stored_bands.ndim == 3:
+        # The spin up and down bands are plotted side by side
+        num_bands = stored_bands.shape[2]
+        bands = np.concatenate(stored_bands, axis=1)
+        band_type_idx = np.repeat([0, 1], num_bands)
+    else:
+        bands = stored_bands
+        band_type_idx = np.zeros(stored_bands.shape[1], dtype=int)
+
+    try:
+        kpoints = band_structure.get_kpoints(cartesian=True)
+    except AttributeError:
+        # Without a cell, the distances are computed in reciprocal coordinates
+        kpoints = band_structure.get_kpoints()
+    try:
+        labels = band_structure.labels or []
+    except (AttributeError, TypeError):
+        labels = []
+
+    bands_data = {
+        "y": bands,
+        "band_type_idx": band_type_idx,
+        **build_kpath(kpoints, labels),
+    }
     # The fermi energy from band calculation is not robust.
     if "fermi_energy_up" in outputs.band_parameters:
         bands_data["fermi_energy_up"] = outputs.band_parameters["fermi_energy_up"]
@@ -108,11 +190,155 @@ def get_bands_data(outputs, fermi_energy=None):
             else outputs.band_parameters["fermi_energy"]
         )
 
-    bands_data["pathlabels"] = _get_bands_labeling(bands_data)
-
     return bands_data
 
 
+def build_kpath(kpoints, labels) -> dict:
+    """Build the k-path of a band structure plot from its k-points and labels.
+
+    The path is discontinuous between consecutive labelled k-points, e.g. at
+    `X|U` in `Γ-X|U-K`, where the distance along the path is not increased.
+
+    Parameters
+    ----------
+    `kpoints`: `np.ndarray`
+        The k-points of the path, of shape `(n_kpoints, 3)`.
+    `labels`: `list[tuple[int, str]]`
+        The index and the label of the high-symmetry k-points.
+
+    Returns
+    -------
+    `dict`
+        The distance `x` of the k-points along the path, the `segments` of shape
+        `(n_segments, 2)` with the first and last k-point index of each
+        continuous segment of the path, the `pathlabels`, the deduplicated
+        labels of the high-symmetry k-points and their distance along the path,
+        and the `kpoint_labels`, the given index and label of the high-symmetry
+        k-points, e.g. for the export, see `export.py`.
+    """
+    kpoints = np.asarray(kpoints, dtype=float)
+    num_kpoints = len(kpoints)
+    indices = np.array([index for index, _ in labels], dtype=int)
+
+    labelled = np.zeros(num_kpoints, dtype=bool)
+    labelled[indices] = True
+    breaks = np.flatnonzero(labelled[1:] & labelled[:-1]) + 1
+
+    distances = np.linalg.norm(np.diff(kpoints, axis=0), axis=1)
+    distances[breaks - 1] = 0.0
+    x = np.concatenate([[0.0], np.cumsum(distances)])
+
+    segments = np.column_stack(
+        [np.insert(breaks, 0, 0), np.append(breaks - 1, num_kpoints - 1)]
+    )
+
+    if len(labels) > 1:
+        names = [name for _, name in labels]
+        # The ends of the path are labelled, if not by a high-symmetry point
+        if indices[0] != 0:
+            names.insert(0, "")
+            indices = np.insert(indices, 0, 0)
+        if indices[-1] != num_kpoints - 1:
+            names.append("")
+            indices = np.append(indices, num_kpoints - 1)
+    else:
+        names = ["0", "1"]
+        indices = np.array([0, num_kpoints - 1])
+
+    return {
+        "x": x,
+        "segments": segments,
+        "pathlabels": _get_path_labels(names, x[indices].tolist()),
+        "kpoint_labels": [[int(index), name] for index, name in labels],
+    }
+
+
+def load_bands_data(pks, max_workers=8) -> list[dict]:
+    """Load the bands data of many workchains concurrently.
+
+    Parameters
+    ----------
+    `pks`: `list[int]`
+        The PKs of the workchains with bands outputs.
+    `max_workers`: `int`
+        The maximum number of workchains loaded at once.
+
+    Returns
+    -------
+    `list[dict]`
+        The bands data of each workchain, as returned by `get_bands_data`, and
+        shared through the data cache, see `cache.py`.
+
+    Raises
+    ------
+    `ValueError`
+        If a workchain has no bands outputs.
+    """
+
+    def load(pk):
+        # The nodes are loaded in the thread, as they are bound to its session
+        outputs = extract_bands_output(load_node(pk))
+        if not outputs or "band_structure" not in outputs:
+            raise ValueError(f"No bands output found for the node <{pk}>")
+        return get_data_cache().get(
+            get_outputs_key(outputs, "bands"),
+            lambda: get_bands_data(outputs),
+        )
+
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(pks)), 1)) as pool:
+        return list(pool.map(load, pks))
+
+
+def reload_outputs(outputs):
+    """Return a copy of the outputs with their stored nodes loaded again.
+
+    AiiDA nodes are bound to the storage session of the thread they are loaded
+    in, so the nodes used in another thread, e.g. a worker thread, need to be
+    loaded again in that thread, by UUID.
+    """
+    if isinstance(outputs, Node):
+        return load_node(outputs.uuid) if outputs.is_stored else outputs
+    if isinstance(outputs, dict):
+        return AttributeDict(
+            {key: reload_outputs(value) for key, value in outputs.items()}
+        )
+    return outputs
+
+
+def align_bands_data(bands_data, reference):
+    """Return a copy of the bands data aligned to the reference bands data.
+
+    The k-points are mapped onto the path of the reference, linearly between the
+    high-symmetry points if both paths go through the same points, and otherwise
+    linearly over the whole path. The energies are shifted for the Fermi energy
+    to match the reference one, i.e. for the bands to be plotted relative to their
+    own Fermi energy.
+    """
+    labels, values = bands_data["pathlabels"]
+    reference_labels, reference_values = reference["pathlabels"]
+    if labels == reference_labels:
+        x = np.interp(bands_data["x"], values, reference_values)
+    else:
+        x = np.interp(
+            bands_data["x"],
+            [values[0], values[-1]],
+            [reference_values[0], reference_values[-1]],
+        )
+
+    y = np.array(bands_data["y"], dtype=float)
+    for spin in np.unique(bands_data["band_type_idx"]):
+        y[:, bands_data["band_type_idx"] == spin] += _get_spin_fermi_energy(
+            reference, spin
+        ) - _get_spin_fermi_energy(bands_data, spin)
+
+    return {
+        **bands_data,
+        "x": x,
+        "y": y,
+        "pathlabels": reference["pathlabels"],
+    }
+
+
 def get_bands_projections_data(
     outputs,
     bands_data,
@@ -120,56 +346,148 @@ def get_bands_projections_data(
     plot_tag,
     selected_atoms,
     bands_width,
+    energy_window=None,
+):
+    builder = get_bands_projections_builder(
+        outputs,
+        bands_data,
+        group_tag=group_tag,
+        plot_tag=plot_tag,
+        selected_atoms=selected_atoms,
+        energy_window=energy_window,
+    )
+    if builder is None:
+        return None
+    return builder.build(bands_width)
+
+
+def get_bands_projections_builder(
+    outputs,
+    bands_data,
+    group_tag,
+    plot_tag,
+    selected_atoms,
+    energy_window=None,
 ):
+    """Return a builder of the projected bands traces, to be built for any width.
+
+    If an energy window, relative to the Fermi energy, is given, the bands lying
+    entirely outside of it are dropped before the projections are aggregated.
+    """
     if "projwfc" not in outputs:
         return None
 
-    projections = []
-    bands_projection = {}
+    num_spins = 1 if "projections" in outputs.projwfc else 2
+    bands_masks = get_bands_masks(bands_data, num_spins, energy_window)
+    projections = get_bands_projections(
+        outputs,
+        group_tag=group_tag,
+        plot_tag=plot_tag,
+        selected_atoms=selected_atoms,
+        bands_masks=bands_masks,
+    )
+    return ProjectedBandsBuilder(bands_data, projections, bands_masks)
+
 
+def get_bands_projections(
+    outputs,
+    group_tag,
+    plot_tag,
+    selected_atoms,
+    bands_masks=None,
+):
+    """Return the curated projections on the bands of each spin.
+
+    Parameters
+    ----------
+    `outputs`: `AttributeDict`
+        The bands outputs, with the `projwfc` namespace.
+    `group_tag`: `str`
+        The grouping of the atoms, `kinds` or `atoms`.
+    `plot_tag`: `str`
+        The grouping of the orbitals, `total`, `orbital` or `angular_momentum`.
+    `selected_atoms`: `list[int]`
+        The indices of the atoms to include, or all atoms if empty.
+    `bands_masks`: `list[np.ndarray | None]`, optional
+        The masks of the bands of each spin to restrict the projections to.
+
+    Returns
+    -------
+    `list[list[dict]]`
+        The projections of each spin, with their `label`, `color` and
+        `projections` of shape `(number of kpoints, number of bands)`.
+    """
     if "projections" in outputs.projwfc:
-        projections.append(
-            _projections_curated_options(
-                outputs.projwfc.projections,
-                spin_type="none",
-                group_tag=group_tag,
-                plot_tag=plot_tag,
-                selected_atoms=selected_atoms,
-                projections_pdos="projections",
-            )
-        )
+        spin_projections = [(outputs.projwfc.projections, "none")]
     else:
-        for spin_proj, spin_type in zip(
-            [
-                outputs.projwfc.projections_up,
-                outputs.projwfc.projections_down,
-            ],
-            ["up", "down"],
-        ):
-            projections.append(
-                _projections_curated_options(
-                    spin_proj,
-                    spin_type=spin_type,
-                    group_tag=group_tag,
-                    plot_tag=plot_tag,
-                    selected_atoms=selected_atoms,
-                    projections_pdos="projections",
-                )
-            )
+        spin_projections = [
+            (outputs.projwfc.projections_up, "up"),
+            (outputs.projwfc.projections_down, "down"),
+        ]
+
+    projections = [
+        _projections_curated_options(
+            spin_proj,
+            spin_type=spin_type,
+            group_tag=group_tag,
+            plot_tag=plot_tag,
+            selected_atoms=selected_atoms,
+            projections_pdos="projections",
+            bands_mask=bands_masks[spin] if bands_masks else None,
+        )
+        for spin, (spin_proj, spin_type) in enumerate(spin_projections)
+    ]
 
-    bands_projection["projected_bands"] = _prepare_projections_to_plot(
-        bands_data, projections, bands_width
-    )
     if plot_tag != "total":
         band_parameters: dict = outputs.band_parameters.get_dict()
         if not band_parameters.get("spin_orbit_calculation"):
-            bands_projection["projected_bands"] = _update_pdos_labels(
-                bands_projection["projected_bands"]
-            )
-    return bands_projection["projected_bands"]
+            _update_pdos_labels([proj for spin in projections for proj in spin])
+    return projections
+
+
+def get_bands_masks(bands_data, num_spins, energy_window=None):
+    """Return the masks of the bands of each spin crossing the energy window.
+
+    The window is relative to the Fermi energy. If no window is given, the masks
+    are `None`, i.e. all bands are kept.
+    """
+    return [
+        _get_bands_mask(bands_data, spin, energy_window) for spin in range(num_spins)
+    ]
+
+
+def mask_bands_projections(projections, bands_masks):
+    """Restrict the curated projections of each spin to the masked bands."""
+    return [
+        [
+            {**proj, "projections": proj["projections"][:, mask]}
+            if mask is not None
+            else proj
+            for proj in spin_projections
+        ]
+        for spin_projections, mask in zip(projections, bands_masks)
+    ]
+
+
+def get_pdos_data(
+    pdos,
+    group_tag,
+    plot_tag,
+    selected_atoms,
+    energy_window=None,
+    broadening=0.0,
+    broadening_type="gaussian",
+):
+    """Return the total and projected DOS.
 
+    If an energy window, relative to the Fermi energy, is given, the DOS grids are
+    sliced to the window before the projections are aggregated.
 
-def get_pdos_data(pdos, group_tag, plot_tag, selected_atoms):
+    If a broadening width, in eV, is given, the DOS and PDOS are recomputed on the
+    energy grid of the `projwfc.x` DOS, from the eigenvalues and projections of
+    the states, with a `broadening_type` broadening of that width. Otherwise, the
+    DOS and PDOS of `projwfc.x` are returned.
+    """
     dos = []
 
     if "output_dos" not in pdos.dos:
@@ -177,13 +495,47 @@ def get_pdos_data(pdos, group_tag, plot_tag, selected_atoms):
 
     _, energy_dos, _ = pdos.dos.output_dos.get_x()
     tdos_values = {f"{n}": v for n, v, _ in pdos.dos.output_dos.get_y()}
+    output_parameters: dict = pdos.nscf.output_parameters.get_dict()
+    spin_polarized = "projections" not in pdos.projwfc
+    noncollinear = output_parameters.get("non_colinear_calculation", False)
+    broadening = (
+        Broadening(
+            broadening,
+            broadening_type,
+            degeneracy=1.0 if spin_polarized or noncollinear else 2.0,
+        )
+        if broadening
+        else None
+    )
+    if broadening:
+        projections = [
+            pdos.projwfc[key]
+            for key in ("projections", "projections_up", "projections_down")
+            if key in pdos.projwfc
+        ]
+        tdos_values = {
+            label: _broaden_total_dos(spin_projections, energy_dos, broadening, spin)
+            for spin, (label, spin_projections) in enumerate(
+                zip(
+                    ["dos_spin_up", "dos_spin_down"] if spin_polarized else ["dos"],
+                    projections,
+                )
+            )
+        }
+    spin_windows = [
+        _shift_energy_window(
+            energy_window, _get_spin_fermi_energy(output_parameters, spin)
+        )
+        for spin in (0, 1)
+    ]
 
     if "projections" in pdos.projwfc:
         # Total DOS
+        window = _get_window_slice(energy_dos, spin_windows[0])
         tdos = {
             "label": "Total DOS",
-            "x": energy_dos.tolist(),
-            "y": tdos_values.get("dos").tolist(),
+            "x": energy_dos[window],
+            "y": tdos_values.get("dos")[window],
             "borderColor": "#8A8A8A",  # dark gray
             "backgroundColor": "#999999",  # light gray
             "backgroundAlpha": "40%",
@@ -196,13 +548,17 @@ def get_pdos_data(pdos, group_tag, plot_tag, selected_atoms):
             group_tag=group_tag,
             plot_tag=plot_tag,
             selected_atoms=selected_atoms,
+            energy_window=spin_windows[0],
+            broadening=broadening,
         )
     else:
         # Total DOS (↑) and Total DOS (↓)
+        window_up = _get_window_slice(energy_dos, spin_windows[0])
+        window_down = _get_window_slice(energy_dos, spin_windows[1])
         tdos_up = {
             "label": "Total DOS (↑)",
-            "x": energy_dos.tolist(),
-            "y": tdos_values.get("dos_spin_up").tolist(),
+            "x": energy_dos[window_up],
+            "y": tdos_values.get("dos_spin_up")[window_up],
             "borderColor": "#8A8A8A",  # dark gray
             "backgroundColor": "#999999",  # light gray
             "backgroundAlpha": "40%",
@@ -210,8 +566,8 @@ def get_pdos_data(pdos, group_tag, plot_tag, selected_atoms):
         }
         tdos_down = {
             "label": "Total DOS (↓)",
-            "x": energy_dos.tolist(),
-            "y": (-tdos_values.get("dos_spin_down")).tolist(),
+            "x": energy_dos[window_down],
+            "y": -tdos_values.get("dos_spin_down")[window_down],
             "borderColor": "#8A8A8A",  # dark gray
             "backgroundColor": "#999999",  # light gray
             "backgroundAlpha": "40%",
@@ -226,6 +582,8 @@ def get_pdos_data(pdos, group_tag, plot_tag, selected_atoms):
             group_tag=group_tag,
             plot_tag=plot_tag,
             selected_atoms=selected_atoms,
+            energy_window=spin_windows[0],
+            broadening=broadening,
         )
         dos += _projections_curated_options(
             pdos.projwfc.projections_down,
@@ -234,6 +592,8 @@ def get_pdos_data(pdos, group_tag, plot_tag, selected_atoms):
             group_tag=group_tag,
             plot_tag=plot_tag,
             selected_atoms=selected_atoms,
+            energy_window=spin_windows[1],
+            broadening=broadening,
         )
 
     data_dict = {
@@ -249,11 +609,74 @@ def get_pdos_data(pdos, group_tag, plot_tag, selected_atoms):
 
     # Updata labels if plot_tag is different than total and SOC is false
     if plot_tag != "total":
-        output_parameters: dict = pdos.nscf.output_parameters.get_dict()
         if not output_parameters.get("spin_orbit_calculation", False):
             data_dict = _update_pdos_labels(data_dict)
 
-    return json.loads(json.dumps(data_dict))
+    return data_dict
+
+
+def slice_pdos_data(pdos_data, energy_window):
+    """Return a copy of the PDOS data restricted to the energy window.
+
+    The window is relative to the Fermi energy of the spin of each trace.
+    """
+    if energy_window is None:
+        return pdos_data
+    sliced = {key: value for key, value in pdos_data.items() if key != "dos"}
+    sliced["dos"] = []
+    for trace in pdos_data["dos"]:
+        spin = 1 if trace["label"].endswith("(↓)") else 0
+        window = _get_window_slice(
+            trace["x"],
+            _shift_energy_window(
+                energy_window, _get_spin_fermi_energy(pdos_data, spin)
+            ),
+        )
+        sliced["dos"].append(
+            {**trace, "x": trace["x"][window], "y": trace["y"][window]}
+        )
+    return sliced
+
+
+def get_orbital_table(projections: ProjectionData, persist=False) -> dict:
+    """Return the table of orbital metadata of the projections.
+
+    The table holds, for each orbital, its kind, site, quantum numbers and HTML
+    labels. As `ProjectionData` nodes are immutable, the table of a stored node is
+    computed once and cached in memory. If `persist` is true, it is also stored in
+    the extras of the node, to be reused across sessions, e.g. by the workchain
+    when building the plot payload.
+
+    Parameters
+    ----------
+    `projections`: `ProjectionData`
+        The projections node.
+    `persist`: `bool`
+        Whether to store the table in the extras of the node.
+
+    Returns
+    -------
+    `dict`
+        A copy of the JSON-serializable orbital table. The `*_index` columns point
+        to the corresponding lists of unique values, e.g. `kind_names` for
+        `kind_index`.
+    """
+    table = _get_orbital_table(projections)
+    if persist and projections.is_stored:
+        extras = projections.base.extras
+        if extras.get(ORBITAL_TABLE_EXTRA, None) != table:
+            extras.set(ORBITAL_TABLE_EXTRA, table)
+    return copy.deepcopy(table)
+
+
+def _get_orbital_table(projections: ProjectionData) -> dict:
+    """Return the orbital table of the projections, shared by all the callers.
+
+    The table must not be modified, see `get_orbital_table` for a copy.
+    """
+    if not projections.is_stored:
+        return _build_orbital_table(projections.get_orbitals())
+    return _get_cached_orbital_table(projections.uuid)
 
 
 def prepare_combined_plotly_traces(x_to_conc, y_to_conc):
@@ -262,6 +685,7 @@ def prepare_combined_plotly_traces(x_to_conc, y_to_conc):
     The rows of y are concatenated with a np.nan column as a separator. Moreover,
     the x values are ajduced to match the shape of the concatenated y values. These
     transfomred arrays, representing multiple datasets/lines, can be plotted in a single trace.
+    The x values are either shared by all lines or given per line, as rows.
     """
     if y_to_conc.ndim != 2:
         raise ValueError("y must be a 2D array")
@@ -277,12 +701,64 @@ def prepare_combined_plotly_traces(x_to_conc, y_to_conc):
     ).flatten()
 
     # Same logic for the x axis
-    x_transf = x_to_conc.reshape(1, -1) * np.ones(y_dim0).reshape(-1, 1)
+    x_transf = np.broadcast_to(x_to_conc, y_to_conc.shape)
     x_transf = np.hstack([x_transf, np.full((y_dim0, 1), np.nan)]).flatten()
 
     return x_transf, y_transf
 
 
+def downsample_curves(x, y, num_buckets, x_range=None):
+    """Downsample curves sharing the same sorted x values, preserving their shape.
+
+    The x range is split into `num_buckets` buckets of equal width, e.g. one per
+    pixel, and only the minimum and the maximum of each curve in each bucket are
+    kept. Peaks and band edges are therefore preserved. Points outside of the
+    range, except the closest one on each side, are discarded. If the range holds
+    fewer points than twice the number of buckets, its points are all kept.
+
+    Parameters
+    ----------
+    `x`: `np.ndarray`
+        The sorted x values, of shape `(n_points,)`.
+    `y`: `np.ndarray`
+        The curves, of shape `(n_curves, n_points)`.
+    `num_buckets`: `int`
+        The number of buckets.
+    `x_range`: `list[float]`, optional
+        The x range to resolve. Defaults to the whole range of `x`.
+
+    Returns
+    -------
+    `tuple[np.ndarray, np.ndarray]`
+        The x and y values of the downsampled curves, both of shape
+        `(n_curves, n_kept_points)`.
+    """
+    x_min, x_max = x_range if x_range is not None else (x[0], x[-1])
+    visible = _get_window_slice(x, (x_min, x_max))
+    x_visible = x[visible]
+    y_visible = y[:, visible]
+
+    if len(x_visible) <= 2 * num_buckets or x_max <= x_min:
+        return np.broadcast_to(x_visible, y_visible.shape), y_visible
+
+    buckets = np.floor((x_visible - x_min) / (x_max - x_min) * num_buckets)
+    buckets = np.clip(buckets, 0, num_buckets - 1)
+    # As x is sorted, the points of a bucket are contiguous
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    counts = np.diff(np.append(starts, len(x_visible)))
+    columns = np.arange(len(x_visible))
+
+    indices = []
+    for reduce in (np.minimum, np.maximum):
+        extrema = np.repeat(reduce.reduceat(y_visible, starts, axis=1), counts, axis=1)
+        # First point of each bucket reaching the extremum
+        candidates = np.where(y_visible == extrema, -columns, -len(x_visible))
+        indices.append(-np.maximum.reduceat(candidates, starts, axis=1))
+    indices = np.sort(np.hstack(indices), axis=1)
+
+    return x_visible[indices], np.take_along_axis(y_visible, indices, axis=1)
+
+
 def find_max_up_and_down(x_data_up, y_data_up, x_data_down, y_data_down, x_min, x_max):
     """
     Function to find the maximum positive value and the most negative value.
@@ -333,16 +809,7 @@ def _get_grouping_key(
 ):
     """Generates the grouping key based on group_tag and plot_tag."""
 
-    key_formats = {
-        ("atoms", "total"): r"{var1}-{var}",
-        ("kinds", "total"): r"{var1}",
-        ("atoms", "orbital"): r"{var1}-{var2}<br>{var}",
-        ("kinds", "orbital"): r"{var1}-{var2}",
-        ("atoms", "angular_momentum"): r"{var1}-{var3}<br>{var}",
-        ("kinds", "angular_momentum"): r"{var1}-{var3}",
-    }
-
-    key = key_formats.get((group_tag, plot_tag))
+    key = GROUPING_KEY_FORMATS.get((group_tag, plot_tag))
     if key is not None:
         return key.format(
             var=atom_position,
@@ -382,47 +849,80 @@ def _curate_orbitals(orbital):
     return orbital_name_plotly, orbital_angular_momentum, kind_name, atom_position
 
 
-def _prepare_projections_to_plot(bands_data, projections, bands_width):
-    """Prepare the projected bands to be plotted.
+class ProjectedBandsBuilder:
+    """Builder of the projected (`fat`) bands traces.
 
-    This function transforms the projected bands into a format that can be plotted
-    in a single trace. To use the fill option `toself`,
-    a band needs to be concatenated with its mirror image, first.
+    To use the fill option `toself`, a band needs to be concatenated with its
+    mirror image, first. The bands of each spin are then combined in a single
+    trace per projection group. The envelope of a fat band is linear in the bands
+    width, i.e. `y ± width / 2 * projection`, so the mirrored geometry and the
+    mirrored projection weights are computed once, and building the traces for a
+    new width only updates the `y` arrays in place.
+
+    Parameters
+    ----------
+    `bands_data`: `dict`
+        The bands data, as returned by `get_bands_data`.
+    `projections`: `list[list[dict]]`
+        The curated projections of each spin.
+    `bands_masks`: `list[np.ndarray | None]`, optional
+        The masks of the bands of each spin the projections were restricted to.
     """
-    projected_bands = []
-    for spin in [0, 1]:
-        # In case of non-spin-polarized calculations, the spin index is only 0
-        if spin not in bands_data["band_type_idx"]:
-            continue
 
-        x_bands = bands_data["x"]
-        # New shape: (number of bands, number of kpoints)
-        y_bands = bands_data["y"][:, bands_data["band_type_idx"] == spin].T
+    def __init__(self, bands_data, projections, bands_masks=None):
+        self.traces = []
+        self._centers = []
+        self._weights = []
+
+        for spin in [0, 1]:
+            # In case of non-spin-polarized calculations, the spin index is only 0
+            if spin not in bands_data["band_type_idx"]:
+                continue
 
-        for proj in projections[spin]:
-            # Create the upper and lower boundary of the fat bands based on the orbital projections
-            y_bands_proj_upper = y_bands + bands_width / 2 * proj["projections"].T
-            y_bands_proj_lower = y_bands - bands_width / 2 * proj["projections"].T
-            # As mentioned above, the bands need to be concatenated with their mirror image
+            x_bands = bands_data["x"]
+            # New shape: (number of bands, number of kpoints)
+            y_bands = bands_data["y"][:, bands_data["band_type_idx"] == spin].T
+            if bands_masks and bands_masks[spin] is not None:
+                y_bands = y_bands[bands_masks[spin]]
+
+            # The bands need to be concatenated with their mirror image
             # to create the filled areas properly
-            y_bands_mirror = np.hstack(
-                [y_bands_proj_upper, y_bands_proj_lower[:, ::-1]]
-            )
-            # Same logic for the energy axis
             x_bands_mirror = np.concatenate([x_bands, x_bands[::-1]]).reshape(1, -1)
-            x_bands_comb, y_bands_proj_comb = prepare_combined_plotly_traces(
+            y_bands_mirror = np.hstack([y_bands, y_bands[:, ::-1]])
+            x_bands_comb, y_bands_comb = prepare_combined_plotly_traces(
                 x_bands_mirror, y_bands_mirror
             )
 
-            projected_bands.append(
-                {
-                    "x": x_bands_comb.tolist(),
-                    "y": y_bands_proj_comb.tolist(),
-                    "label": proj["label"],
-                    "color": proj["color"],
-                }
-            )
-    return projected_bands
+            for proj in projections[spin]:
+                # The upper boundary is followed by the mirrored lower boundary
+                weights = proj["projections"].T
+                weights_mirror = np.hstack([weights, -weights[:, ::-1]])
+                _, weights_comb = prepare_combined_plotly_traces(
+                    x_bands_mirror, weights_mirror
+                )
+                self.traces.append(
+                    {
+                        "x": x_bands_comb,
+                        "y": np.empty_like(y_bands_comb),
+                        "label": proj["label"],
+                        "color": proj["color"],
+                    }
+                )
+                self._centers.append(y_bands_comb)
+                self._weights.append(weights_comb)
+
+    def build(self, bands_width):
+        """Build the traces for the given bands width.
+
+        Returns
+        -------
+        `list[dict]`
+            The traces, with their `x`, `y`, `label` and `color`.
+        """
+        for trace, centers, weights in zip(self.traces, self._centers, self._weights):
+            np.multiply(weights, bands_width / 2, out=trace["y"])
+            trace["y"] += centers
+        return self.traces
 
 
 def _projections_curated_options(
@@ -433,79 +933,87 @@ def _projections_curated_options(
     projections_pdos="pdos",
     spin_type="none",
     line_style="solid",
+    energy_window=None,
+    bands_mask=None,
+    broadening=None,
 ):
     """Extract and curate the projections.
 
     This function can be used to extract the PDOS or the projections data.
+    The orbital arrays are stacked once and reduced onto their groups with a
+    single matrix product, instead of being accumulated one orbital at a time.
+    The PDOS can be restricted to an (absolute) energy window and the projections
+    to a mask of the bands, before the reduction. If a `Broadening` is given, the
+    PDOS are recomputed on the same energy grid from the eigenvalues and their
+    projections, instead of being read from the `projwfc.x` PDOS.
     """
-    _proj_pdos = {}
-    list_positions = []
-
     # Constants for spin types
     SPIN_LABELS = {"up": "(↑)", "down": "(↓)", "none": ""}
     SIGN_MULT_FACTOR = {"up": 1, "down": -1, "none": 1}
 
     if projections_pdos == "pdos":
-        proj_data = projections.get_pdos()
+        array_prefix = "pdos"
     elif projections_pdos == "projections":
-        proj_data = projections.get_projections()
+        array_prefix = "proj"
     else:
         raise ValueError(f"Invalid value for `projections_pdos`: {projections_pdos}")
 
-    for orb_proj in proj_data:
-        if projections_pdos == "pdos":
-            orbital, proj_pdos, energy = orb_proj
-        elif projections_pdos == "projections":
-            orbital, proj_pdos = orb_proj
-            energy = None
-
-        (
-            orbital_name_plotly,
-            orbital_angular_momentum,
-            kind_name,
-            atom_position,
-        ) = _curate_orbitals(orbital)
-
-        if atom_position not in list_positions:
-            list_positions.append(atom_position)
+    labels, group_indices = _get_grouping_indices(
+        _get_orbital_table(projections),
+        group_tag,
+        plot_tag,
+        selected_atoms,
+    )
 
-        key = _get_grouping_key(
-            group_tag,
-            plot_tag,
-            atom_position,
-            kind_name,
-            orbital_name_plotly,
-            orbital_angular_momentum,
+    if projections_pdos == "pdos":
+        # Each group uses the energy grid of its first orbital
+        groups, first_orbitals = np.unique(group_indices, return_index=True)
+        energies = _get_orbital_arrays(
+            projections,
+            "energy",
+            first_orbitals[groups >= 0],
+        )
+        # The orbitals of a `projwfc` calculation share the same energy grid
+        window = (
+            _get_window_slice(energies[0], energy_window) if energies else slice(None)
+        )
+        energies = [energy[window] for energy in energies]
+    else:
+        window = (slice(None), slice(None) if bands_mask is None else bands_mask)
+
+    if projections_pdos == "pdos" and broadening and energies:
+        grouped = _broaden_projections(
+            projections,
+            group_indices,
+            len(labels),
+            energies[0],
+            broadening,
+            spin=int(spin_type == "down"),
+        )
+    else:
+        grouped = _reduce_projection_arrays(
+            projections,
+            array_prefix,
+            group_indices,
+            len(labels),
+            window,
         )
-        if not selected_atoms:
-            if key:
-                _proj_pdos.setdefault(key, [energy, 0])[1] += proj_pdos
-
-        else:
-            try:
-                index = list_positions.index(atom_position)
-                if index in selected_atoms:
-                    if key:
-                        _proj_pdos.setdefault(key, [energy, 0])[1] += proj_pdos
-
-            except ValueError:
-                pass
 
     curated_proj = []
-    for label, (energy, proj_pdos) in _proj_pdos.items():
+    for index, label in enumerate(labels):
         label += SPIN_LABELS[spin_type]  # noqa: PLW2901
         if projections_pdos == "pdos":
             orbital_proj_pdos = {
                 "label": label,
-                "x": energy.tolist(),
-                "y": (SIGN_MULT_FACTOR[spin_type] * proj_pdos).tolist(),
+                "x": energies[index],
+                "y": SIGN_MULT_FACTOR[spin_type] * grouped[index],
                 "borderColor": _cmap(label),
                 "lineStyle": line_style,
             }
         else:
             orbital_proj_pdos = {
                 "label": label,
-                "projections": proj_pdos,
+                "projections": grouped[index],
                 "color": _cmap(label),
             }
         curated_proj.append(orbital_proj_pdos)
@@ -513,45 +1021,330 @@ def _projections_curated_options(
     return curated_proj
 
 
-def _get_bands_labeling(bandsdata: dict) -> list:
-    """Function to return two lists containing the labels and values (kpoint) for plotting.
-    params:
-    - bandsdata: dictionary from `get_bands_projections_data` function
-    output:  update bandsdata with a new key "pathlabels" including (list of str), label_values (list of float)
+def _broaden_projections(
+    projections, group_indices, num_groups, energies, broadening, spin=0
+):
+    """Return the PDOS of each group, broadened from the projections of the states.
+
+    The projections of the states on the orbitals of each group are summed and
+    weighted by the k-point weights, before being broadened onto the energy grid.
+    """
+    eigenvalues, kpoint_weights = get_eigenvalues(
+        projections, broadening.degeneracy, spin
+    )
+    weights = (
+        _reduce_projection_arrays(projections, "proj", group_indices, num_groups)
+        * kpoint_weights
+    )
+    return broaden(
+        eigenvalues,
+        weights,
+        energies,
+        broadening.width,
+        broadening.broadening_type,
+    )
+
+
+def _broaden_total_dos(projections, energies, broadening, spin=0):
+    """Return the total DOS broadened from the eigenvalues of the projections."""
+    eigenvalues, kpoint_weights = get_eigenvalues(
+        projections, broadening.degeneracy, spin
+    )
+    return broaden(
+        eigenvalues,
+        np.broadcast_to(kpoint_weights, eigenvalues.shape)[np.newaxis],
+        energies,
+        broadening.width,
+        broadening.broadening_type,
+    )[0]
+
+
+def _get_grouping_indices(orbital_table, group_tag, plot_tag, selected_atoms):
+    """Map every orbital onto the index of the group it contributes to.
+
+    The groups are the unique rows of the orbital table columns identifying the
+    grouping, ordered by first appearance.
+
+    Returns
+    -------
+    `tuple[list[str], np.ndarray]`
+        The group labels and, for each orbital, the index of its group in the
+        labels list, or -1 if the orbital is not part of any group.
+    """
+    site_indices = np.asarray(orbital_table["site_index"], dtype=int)
+    group_indices = np.full(len(site_indices), -1, dtype=int)
+
+    if (group_tag, plot_tag) not in GROUPING_KEY_FORMATS:
+        return [], group_indices
+
+    columns = ["kind_index"]
+    if group_tag == "atoms":
+        columns.append("site_index")
+    columns += GROUPING_COLUMNS[plot_tag]
+
+    included = (
+        np.isin(site_indices, list(selected_atoms))
+        if selected_atoms
+        else np.ones(len(site_indices), dtype=bool)
+    )
+    if not included.any():
+        return [], group_indices
+
+    codes = np.column_stack([orbital_table[column] for column in columns])
+    _, first, inverse = np.unique(
+        codes[included],
+        axis=0,
+        return_index=True,
+        return_inverse=True,
+    )
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    group_indices[included] = rank[inverse.ravel()]
+
+    labels = [
+        _get_grouping_key(
+            group_tag,
+            plot_tag,
+            orbital_table["positions"][orbital_table["site_index"][i]],
+            orbital_table["kind_names"][orbital_table["kind_index"][i]],
+            orbital_table["orbital_names"][orbital_table["orbital_index"][i]],
+            orbital_table["angular_momentum_names"][
+                orbital_table["angular_momentum_index"][i]
+            ],
+        )
+        for i in np.flatnonzero(included)[first[order]]
+    ]
+
+    return labels, group_indices
+
+
+def _build_orbital_table(orbitals) -> dict:
+    """Build the table of orbital metadata of a list of orbitals.
+
+    See `get_orbital_table` for details.
     """
-    UNICODE_SYMBOL = {
-        "GAMMA": "\u0393",
-        "DELTA": "\u0394",
-        "LAMBDA": "\u039b",
-        "SIGMA": "\u03a3",
-        "EPSILON": "\u0395",
+    unique = {
+        "kind_names": {},
+        "positions": {},
+        "orbital_names": {},
+        "angular_momentum_names": {},
     }
-    paths = bandsdata.get("paths")
-    labels = []
-    for path in paths:  # Remove duplicates
-        label_a = [path["from"], path["x"][0]]
-        label_b = [path["to"], path["x"][-1]]
-        if label_a not in labels:
-            labels.append(label_a)
-        if label_b not in labels:
-            labels.append(label_b)
-
-    clean_labels = []  # Format
-    for i in labels:
-        if clean_labels:
-            if (i not in clean_labels) and (clean_labels[-1][-1] == i[1]):
-                clean_labels[-1][0] = clean_labels[-1][0] + "|" + i[0]
-            else:
-                clean_labels.append(i)
-        else:
-            clean_labels.append(i)
+    table = {
+        "version": ORBITAL_TABLE_VERSION,
+        "kind_index": [],
+        "site_index": [],
+        "orbital_index": [],
+        "angular_momentum_index": [],
+        "angular_momentum": [],
+        "magnetic_number": [],
+        "total_angular_momentum": [],
+        "radial_nodes": [],
+    }
+
+    for orbital in orbitals:
+        orbital_data = orbital.get_orbital_dict()
+        (
+            orbital_name_plotly,
+            orbital_angular_momentum,
+            kind_name,
+            atom_position,
+        ) = _curate_orbitals(orbital)
 
-    path_labels = [label[0] for label in clean_labels]
-    for i, label in enumerate(path_labels):
-        path_labels[i] = re.sub(
-            r"([A-Z]+)", lambda x: UNICODE_SYMBOL.get(x.group(), x.group()), label
+        for column, values, value in (
+            ("kind_index", "kind_names", kind_name),
+            ("site_index", "positions", tuple(atom_position)),
+            ("orbital_index", "orbital_names", orbital_name_plotly),
+            (
+                "angular_momentum_index",
+                "angular_momentum_names",
+                orbital_angular_momentum,
+            ),
+        ):
+            table[column].append(unique[values].setdefault(value, len(unique[values])))
+
+        table["angular_momentum"].append(orbital_data["angular_momentum"])
+        table["magnetic_number"].append(orbital_data["magnetic_number"])
+        table["total_angular_momentum"].append(
+            orbital_data.get("total_angular_momentum")
         )
-    path_values = [label[1] for label in clean_labels]
+        table["radial_nodes"].append(orbital_data["radial_nodes"])
+
+    for values, mapping in unique.items():
+        table[values] = (
+            [list(value) for value in mapping]
+            if values == "positions"
+            else list(mapping)
+        )
+
+    return table
+
+
+@lru_cache(maxsize=32)
+def _get_cached_orbital_table(uuid) -> dict:
+    """Return the orbital table of the stored projections node with the given UUID.
+
+    The table is read from the extras of the node if available, otherwise built
+    from the orbitals of the node.
+    """
+    projections = load_node(uuid)
+    table = projections.base.extras.get(ORBITAL_TABLE_EXTRA, None)
+    if table and table.get("version") == ORBITAL_TABLE_VERSION:
+        return table
+    return _build_orbital_table(projections.get_orbitals())
+
+
+def _get_orbital_arrays(projections: ProjectionData, prefix, indices, window=None):
+    """Return the `window` slices of the arrays named `prefix` of the orbitals at
+    the given indices."""
+    return _load_arrays(
+        projections,
+        [
+            f"{prefix}_{projections._from_index_to_arrayname(index)}"
+            for index in indices
+        ],
+        window,
+    )
+
+
+def _load_arrays(node, names, window=None):
+    """Return the `window` slices of the arrays of the node with the given names.
+
+    Unlike `ArrayData.get_array`, the arrays of stored nodes are not cached in the
+    node, which would keep all the arrays ever read in memory as long as the node
+    is alive. Moreover, the repository objects of all arrays are opened in a single
+    batch, instead of being looked up one by one.
+    """
+    if window is None:
+        window = slice(None)
+    if not node.is_stored:
+        return [node.get_array(name)[window] for name in names]
+
+    keys = [node.base.repository.get_object(f"{name}.npy").key for name in names]
+    arrays = {}
+    # Identical arrays share the same object, and objects are not streamed in order
+    for key, stream in node.backend.get_repository().iter_object_streams(set(keys)):
+        arrays[key] = _read_array(stream, window)
+    return [arrays[key] for key in keys]
+
+
+def _read_array(handle, window):
+    """Return the `window` slice of the `.npy` array of a binary file handle.
+
+    The file is memory-mapped if it is a file on disk, i.e. a loose repository
+    object, so that only the slice is read, and is read in full otherwise.
+    """
+    path = getattr(handle, "name", None)
+    array = None
+    if isinstance(path, str) and os.path.isfile(path):
+        try:
+            array = np.load(path, mmap_mode="r", allow_pickle=False)
+        except ValueError:
+            # E.g. empty arrays cannot be memory-mapped
+            pass
+    if array is None:
+        array = np.load(handle, allow_pickle=False)
+    # Copy the slice, to release the memory map or the full array
+    return np.array(array[window])
+
+
+def _reduce_projection_arrays(
+    projections, prefix, group_indices, num_groups, window=None
+):
+    """Sum the orbital arrays of each group.
+
+    Only the arrays of the orbitals belonging to a group are read, restricted to
+    their `window` index if given. They are read and stacked into
+    `(n_orbitals, n_values)` matrices of at most `REDUCE_CHUNK_SIZE` orbitals, each
+    reduced with the corresponding `(n_groups, n_orbitals)` membership matrix, so
+    that the memory used does not grow with the number of orbitals.
+
+    Returns
+    -------
+    `np.ndarray`
+        The summed arrays, with shape `(n_groups, *orbital_array_shape)`.
+    """
+    orbital_indices = np.flatnonzero(group_indices >= 0)
+    if not num_groups:
+        return np.empty((0,))
+
+    grouped = None
+    for start in range(0, len(orbital_indices), REDUCE_CHUNK_SIZE):
+        chunk = orbital_indices[start : start + REDUCE_CHUNK_SIZE]
+        arrays = _get_orbital_arrays(projections, prefix, chunk, window)
+        if grouped is None:
+            shape = arrays[0].shape
+            grouped = np.zeros((num_groups, arrays[0].size), dtype=np.float64)
+        stacked = np.stack([array.ravel() for array in arrays])
+        membership = np.zeros((num_groups, len(chunk)))
+        membership[group_indices[chunk], np.arange(len(chunk))] = 1
+        grouped += membership @ stacked
+
+    return grouped.reshape(num_groups, *shape)
+
+
+def _get_spin_fermi_energy(parameters, spin):
+    """Return the Fermi energy of the given spin index from the output parameters."""
+    if "fermi_energy" in parameters:
+        return parameters["fermi_energy"]
+    return parameters[("fermi_energy_up", "fermi_energy_down")[spin]]
+
+
+def _shift_energy_window(energy_window, fermi_energy):
+    """Return the absolute energy window of a window relative to the Fermi energy."""
+    if energy_window is None:
+        return None
+    return (energy_window[0] + fermi_energy, energy_window[1] + fermi_energy)
+
+
+def _get_window_slice(energies, energy_window):
+    """Return the slice of the sorted energies within the energy window.
+
+    The closest energy outside of the window on each side is kept, so that lines
+    are drawn up to the edges of the window.
+    """
+    if energy_window is None:
+        return slice(None)
+    start = max(np.searchsorted(energies, energy_window[0], side="left") - 1, 0)
+    stop = min(
+        np.searchsorted(energies, energy_window[1], side="right") + 1, len(energies)
+    )
+    return slice(start, stop)
+
+
+def _get_bands_mask(bands_data, spin, energy_window):
+    """Return the mask of the bands of a spin crossing the energy window.
+
+    The window is relative to the Fermi energy. Returns `None` if no window is
+    given, i.e. all bands are kept.
+    """
+    if energy_window is None:
+        return None
+    emin, emax = _shift_energy_window(
+        energy_window, _get_spin_fermi_energy(bands_data, spin)
+    )
+    # Shape: (number of kpoints, number of bands)
+    bands = bands_data["y"][:, bands_data["band_type_idx"] == spin]
+    return (bands.max(axis=0) >= emin) & (bands.min(axis=0) <= emax)
+
+
+def _get_path_labels(names, values) -> list:
+    """Return the labels of the k-path and their distance along the path.
+
+    The repeated labels are removed, and the labels at the same distance, i.e.
+    at a discontinuity of the path, are joined, e.g. `X|U`.
+    """
+    path_labels, path_values = [], []
+    for name, value in dict.fromkeys(zip(names, values)):
+        if path_values and path_values[-1] == value:
+            path_labels[-1] += f"|{name}"
+        else:
+            path_labels.append(name)
+            path_values.append(value)
+    path_labels = [
+        re.sub(r"([A-Z]+)", lambda x: UNICODE_SYMBOL.get(x.group(), x.group()), label)
+        for label in path_labels
+    ]
     return [path_labels, path_values]
 
 
@@ -585,189 +1378,128 @@ def _find_extreme_in_range(
     Returns:
     - Extreme value found in the range, or None if no valid values are found.
     """
-    extreme_value = initial_value
+    maxima, minima = find_extremes_in_range(x_data, [y_data], x_min, x_max)
+    extreme_value = maxima[0] if is_max else minima[0]
+    # Comparisons with NaN, i.e. no value in the range, are false
+    if extreme_value > initial_value if is_max else extreme_value < initial_value:
+        return float(extreme_value)
+    return None
 
-    for x, y in zip(x_data, y_data):
-        if x_min <= x <= x_max:
-            if (is_max and y > extreme_value) or (not is_max and y < extreme_value):
-                extreme_value = y
 
-    return extreme_value if extreme_value != initial_value else None
+def find_extremes_in_range(x_data, y_data, x_min, x_max):
+    """Find the maximum and minimum values of several traces in a range.
 
+    The traces share the same x values and are reduced in a single pass over
+    their stacked values.
 
-def _get_labels_radial_nodes(pdos_dict):
-    """
-    Extracts the original labels from the PDOS data and constructs an orbital dictionary.
-
-    Args:
-        pdos_dict (dict): Dictionary containing PDOS data with 'dos' key representing orbital information.
+    Parameters
+    ----------
+    `x_data`: `array_like`
+        The x values of the traces, of shape `(n_points,)`.
+    `y_data`: `array_like`
+        The y values of the traces, of shape `(n_traces, n_points)`.
+    `x_min`: `float`
+        Minimum x value of the range.
+    `x_max`: `float`
+        Maximum x value of the range.
 
-    Returns:
-        tuple:
-            - original_labels (list): List of strings representing the original orbital labels.
-            - orbital_dict (dict): A nested dictionary mapping atom kinds to orbital types and their corresponding radial nodes.
+    Returns
+    -------
+    `tuple[np.ndarray, np.ndarray]`
+        The maximum and the minimum of each trace in the range, NaN for the
+        traces without values in the range.
     """
-    original_labels = []
-    orbital_dict = {}
-
-    label_data_list = pdos_dict["dos"] if "dos" in pdos_dict else pdos_dict
-    for label_data in label_data_list:
-        # for label_data in pdos_dict["dos"]:
-        label_str = label_data["label"]
-        original_labels.append(label_str)
-
-        parts = label_str.split("-")
-        if len(parts) < 2:
-            continue  # Skip invalid or non-orbital labels
-
-        atom = parts[0]  # Atom type (e.g., 'Fe1')
-        radial_orbital = parts[1].split()  # Splits 'r# orbital' (e.g., 'r0 s')
-
-        if len(radial_orbital) < 2:
-            continue  # Malformed label
+    x_data = np.asarray(x_data, dtype=float)
+    y_data = np.atleast_2d(np.asarray(y_data, dtype=float))
+    in_range = (x_data >= x_min) & (x_data <= x_max)
+    if not in_range.any():
+        missing = np.full(len(y_data), np.nan)
+        return missing, missing.copy()
+    values = y_data[:, in_range]
+    return values.max(axis=1), values.min(axis=1)
 
-        radial_node = int(radial_orbital[0][1:])  # Extract radial index from 'r#'
-        orbital = radial_orbital[1][0]  # Orbital type ('s', 'p', 'd', 'f')
 
-        # Populate orbital_dict with atoms, orbitals, and radial nodes
-        orbital_dict.setdefault(atom, {}).setdefault(orbital, set()).add(radial_node)
+class _OrbitalLabel(NamedTuple):
+    """Structured record of an orbital label, e.g. `Fe1-r0 d<sub>xy</sub>(↑)`."""
 
-    return original_labels, orbital_dict
+    atom: str
+    radial_node: int
+    orbital: str
 
+    @property
+    def orbital_type(self) -> str:
+        return self.orbital[0]
 
-def _assign_orbital_labels(orbital_dict):
-    """
-    Assigns orbital labels to atoms based on their radial nodes and electronic structure.
 
-    Args:
-        orbital_dict (dict): A nested dictionary mapping atom kinds to orbital types and their corresponding radial nodes.
+@lru_cache(maxsize=4096)
+def _parse_orbital_label(label: str) -> _OrbitalLabel | None:
+    """Parse the label of a PDOS trace into an orbital record.
 
-    Returns:
-        dict: A dictionary mapping atoms and orbitals to their assigned radial labels.
+    Returns `None` if the label does not refer to a radial node, e.g. for the total
+    DOS. The labels repeat across spins and groupings, so they are parsed once.
     """
-    result = {}
-
-    for atom_with_number, orbitals in orbital_dict.items():
-        # Extract element name (remove numeric suffixes)
-        atom = re.sub(r"\d+", "", atom_with_number)
-        element = Element(atom)
-        electronic_structure = list(reversed(element.full_electronic_structure))
-
-        orbital_assignment = {orb: {} for orb in ["s", "p", "d", "f"]}
-
-        # Map orbitals from electronic structure
-        orbital_map = {
-            "s": [
-                f"{n}{orbital}"
-                for n, orbital, _ in electronic_structure
-                if orbital == "s"
-            ],
-            "p": [
-                f"{n}{orbital}"
-                for n, orbital, _ in electronic_structure
-                if orbital == "p"
-            ],
-            "d": [
-                f"{n}{orbital}"
-                for n, orbital, _ in electronic_structure
-                if orbital == "d"
-            ],
-            "f": [
-                f"{n}{orbital}"
-                for n, orbital, _ in electronic_structure
-                if orbital == "f"
-            ],
-        }
-
-        # Assign radial nodes to orbitals in reverse order
-        for orb_type in ["s", "p", "d", "f"]:
-            if orb_type in orbitals:
-                sorted_indices = sorted(orbitals[orb_type], reverse=True)
-                for idx, radial_node in enumerate(sorted_indices):
-                    if radial_node < len(orbital_map[orb_type]):
-                        orbital_assignment[orb_type][idx] = orbital_map[orb_type][
-                            radial_node
-                        ][0]
-
-        # Clean up empty orbital assignments
-        result[atom_with_number] = {
-            orb: val for orb, val in orbital_assignment.items() if val
-        }
+    atom, dash, orbital = label.partition("-")
+    parts = orbital.split(None, 1)
+    if not dash or len(parts) < 2:
+        return None
+    radial, name = parts
+    if not radial.startswith("r") or not radial[1:].isdigit():
+        return None
+    return _OrbitalLabel(atom, int(radial[1:]), name)
 
-    return result
-
-
-def _get_new_pdos_labels(input_list, orbital_dict):
-    output_list = []
-
-    for item in input_list:
-        # Check if the label contains a '-' to proceed with splitting
-        if "-" in item:
-            before_dash, after_dash = item.split("-", 1)
-
-            # Split the part after the dash into words to isolate the radial node (r#)
-            parts = after_dash.split()
-
-            if parts[0].startswith("r"):
-                radial_index = int(parts[0][1:])  # Extract the number after 'r'
-
-                # Check if the first element after removing the radial part corresponds to an orbital
-                orbital = parts[1]
-
-                # If the atom and orbital type exist in the orbital_dict, map the radial node
-                if (
-                    before_dash in orbital_dict
-                    and orbital[0] in orbital_dict[before_dash]
-                ):
-                    if radial_index in orbital_dict[before_dash][orbital[0]]:
-                        # Get the mapped radial value
-                        new_radial_value = orbital_dict[before_dash][orbital[0]][
-                            radial_index
-                        ]
-
-                        # Rebuild the string, removing the space before the orbital
-                        after_dash = after_dash.replace(
-                            f"r{radial_index}", new_radial_value, 1
-                        )
-                        after_dash = after_dash.replace(
-                            " ", "", 1
-                        )  # Remove the space after the radial value
-                        new_item = f"{before_dash}-{after_dash}"
-                    else:
-                        new_item = (
-                            item  # If radial index not found, use the original item
-                        )
-                else:
-                    new_item = item  # If no match in orbital_dict, use original label
-            else:
-                new_item = item  # In case there's no valid 'r#' part
-        else:
-            new_item = item  # If no dash, use the original item
 
-        output_list.append(new_item)
+@lru_cache(maxsize=128)
+def _get_element_shells(element: str) -> dict[str, tuple[str, ...]]:
+    """Return the principal quantum numbers of the shells of each orbital type.
 
-    return output_list
+    The shells are ordered from the outermost to the innermost one, following the
+    full electronic structure of the element.
+    """
+    shells = {orbital_type: [] for orbital_type in "spdf"}
+    for n, orbital_type, _ in reversed(Element(element).full_electronic_structure):
+        shells[orbital_type].append(str(n)[0])
+    return {orbital_type: tuple(values) for orbital_type, values in shells.items()}
 
 
 def _update_pdos_labels(pdos_data):
     """
     Updates PDOS labels by assigning correct radial nodes to orbitals based on their electronic structure.
 
+    The radial nodes of each atom and orbital type are mapped, from the highest to
+    the lowest, onto the principal quantum numbers of the shells of the element.
+
     Args:
-        pdos_data (dict): PDOS data structure containing 'dos' key with orbital information.
+        pdos_data (dict | list): PDOS data structure containing 'dos' key with orbital information, or the list of traces.
 
     Returns:
-        tuple:
-            - pdos_data (dict): Updated PDOS data with correct orbital labels.
+        pdos_data (dict | list): Updated PDOS data with correct orbital labels.
     """
-    original_labels, orbital_dict = _get_labels_radial_nodes(pdos_data)
-    orbital_assignment = _assign_orbital_labels(orbital_dict)
-    updated_labels = _get_new_pdos_labels(original_labels, orbital_assignment)
-
     label_data_list = pdos_data["dos"] if "dos" in pdos_data else pdos_data
-    # Update labels directly using zip
-    for label_data, label in zip(label_data_list, updated_labels):
-        label_data["label"] = label
+    records = [_parse_orbital_label(data["label"]) for data in label_data_list]
+
+    radial_nodes = {}
+    for record in records:
+        if record is not None:
+            radial_nodes.setdefault((record.atom, record.orbital_type), set()).add(
+                record.radial_node
+            )
+
+    principal_numbers = {}
+    for (atom, orbital_type), nodes in radial_nodes.items():
+        # Remove the numeric suffixes of the kind name
+        shells = _get_element_shells(re.sub(r"\d+", "", atom)).get(orbital_type, ())
+        principal_numbers[atom, orbital_type] = {
+            index: shells[radial_node]
+            for index, radial_node in enumerate(sorted(nodes, reverse=True))
+            if radial_node < len(shells)
+        }
+
+    for label_data, record in zip(label_data_list, records):
+        if record is None:
+            continue
+        n = principal_numbers[record.atom, record.orbital_type].get(record.radial_node)
+        if n is not None:
+            label_data["label"] = f"{record.atom}-{n}{record.orbital}"
 
     return pdos_data
 
@@ -0,0 +1,202 @@
+"""Pool of persistent renderers of static images of plotly figures.
+
+Rendering a figure to an image with `plotly.io.to_image` blocks the kernel
+thread, including the start of the Kaleido (headless Chromium) process on the
+first call. The renderer pool keeps its Kaleido processes alive and renders the
+figures queued to it in background threads, passing the images back to the
+thread of the kernel event loop.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import typing as t
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from threading import Lock
+
+import plotly
+
+from aiidalab_qe.common.worker import run_on_ui_thread
+
+# Figure rendered to start the Kaleido processes
+_WARM_UP_FIGURE = {"data": [], "layout": {}}
+
+
+class ImageRenderer:
+    """Render plotly figures to static images in a pool of Kaleido processes.
+
+    Each process renders one figure at a time. The processes are started on
+    demand, up to the size of the pool, and kept alive to render the next
+    figures. The figures are queued and rendered in the order of submission.
+    """
+
+    def __init__(self, size: int = 1):
+        self.size = size
+        self._lock = Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._scopes: queue.Queue = queue.Queue()
+        self._num_scopes = 0
+
+    def warm_up(self):
+        """Start the Kaleido processes of the pool in the background."""
+        with self._lock:
+            num_missing = self.size - self._num_scopes
+        for _ in range(num_missing):
+            self._submit(_WARM_UP_FIGURE, {"format": "png", "width": 10, "height": 10})
+
+    def render(
+        self,
+        figures: list,
+        image_format: str = "png",
+        width: int | None = None,
+        height: int | None = None,
+        scale: float | None = None,
+    ) -> list[Future]:
+        """Queue the rendering of the figures.
+
+        The figures are converted to dictionaries in the calling thread, so that
+        they can be modified while rendered, e.g. figure widgets.
+
+        Parameters
+        ----------
+        `figures`: `list`
+            The figures, as plotly figures or dictionaries.
+        `image_format`: `str`
+            The image format, e.g. `png`, `jpeg`, `svg` or `pdf`.
+        `width`, `height`: `int`, optional
+            The size of the images in layout pixels, by default the figure's.
+        `scale`: `float`, optional
+            The scale factor of the images.
+
+        Returns
+        -------
+        `list[Future]`
+            The futures of the image bytes, in the order of the figures.
+        """
+        options = {
+            "format": image_format,
+            "width": width,
+            "height": height,
+            "scale": scale,
+        }
+        return [
+            self._submit(
+                figure if isinstance(figure, dict) else figure.to_dict(),
+                options,
+            )
+            for figure in figures
+        ]
+
+    def render_async(
+        self,
+        figures: list,
+        on_result: t.Callable[[list[bytes]], t.Any],
+        on_error: t.Callable[[Exception], t.Any] | None = None,
+        **kwargs,
+    ) -> Future:
+        """Render the figures and pass the images to `on_result` on the UI thread.
+
+        The figures are rendered as a batch: `on_result` is called once, with the
+        images of all the figures, or `on_error` with the first error raised. The
+        keyword arguments are passed to `render`.
+
+        Returns
+        -------
+        `Future`
+            The future of the images, done once the callback is dispatched.
+        """
+        futures = self.render(figures, **kwargs)
+        batch = Future()
+        batch_lock = Lock()
+
+        def on_done(_):
+            with batch_lock:
+                if batch.done() or not all(future.done() for future in futures):
+                    return
+                batch.set_running_or_notify_cancel()
+            errors = [future.exception() for future in futures if future.exception()]
+            if errors:
+                if on_error is not None:
+                    run_on_ui_thread(lambda: on_error(errors[0]))
+                batch.set_exception(errors[0])
+            else:
+                images = [future.result() for future in futures]
+                run_on_ui_thread(lambda: on_result(images))
+                batch.set_result(images)
+
+        for future in futures:
+            future.add_done_callback(on_done)
+        return batch
+
+    def shutdown(self):
+        """Wait for the queued figures and stop the Kaleido processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        while not self._scopes.empty():
+            self._scopes.get_nowait()._shutdown_kaleido()
+        with self._lock:
+            self._num_scopes = 0
+
+    def _submit(self, figure: dict, options: dict) -> Future:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.size,
+                    thread_name_prefix="aiidalab-qe-renderer",
+                )
+            return self._executor.submit(self._render, figure, options)
+
+    def _render(self, figure: dict, options: dict) -> bytes:
+        scope = None
+        try:
+            scope = self._acquire_scope()
+            return scope.transform(figure, **options)
+        finally:
+            if scope is not None:
+                self._scopes.put(scope)
+
+    def _acquire_scope(self):
+        """Return an idle Kaleido scope, starting a new one if the pool allows it."""
+        try:
+            return self._scopes.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._num_scopes < self.size
+            if create:
+                self._num_scopes += 1
+        if not create:
+            return self._scopes.get()
+        try:
+            return self._create_scope()
+        except Exception:
+            # The scope is to be created again by the next render, instead of the
+            # renders waiting for a scope that never comes
+            with self._lock:
+                self._num_scopes -= 1
+            raise
+
+    @staticmethod
+    def _create_scope():
+        """Create a Kaleido scope configured as the one of `plotly.io`."""
+        from kaleido.scopes.plotly import PlotlyScope
+
+        plotlyjs = os.path.join(
+            os.path.dirname(os.path.abspath(plotly.__file__)),
+            "package_data",
+            "plotly.min.js",
+        )
+        return PlotlyScope(
+            plotlyjs=plotlyjs,
+            mathjax="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.5/MathJax.js",
+        )
+
+
+@lru_cache(maxsize=1)
+def get_image_renderer() -> ImageRenderer:
+    """Return the renderer pool shared by the figures of the app."""
+    return ImageRenderer()
@@ -83,6 +83,11 @@ class HasModels(t.Generic[T]):
 class HasProcess(tl.HasTraits):
     process_uuid = tl.Unicode(None, allow_none=True)
     monitor_counter = tl.Int(0)  # used for continuous updates
+    # The snapshot of the process tree refreshed by the monitor, if any
+    process_snapshot = tl.Instance(
+        "aiidalab_qe.common.process.snapshot.ProcessTreeSnapshot",
+        allow_none=True,
+    )
 
     @property
     def has_process(self):
@@ -1,9 +1,11 @@
+from .monitor import ProcessChangeMonitor
 from .process import QeAppWorkChainSelector, WorkChainSelector
 from .state import STATE_ICONS
 from .tree import SimplifiedProcessTree, SimplifiedProcessTreeModel
 
 __all__ = [
     "STATE_ICONS",
+    "ProcessChangeMonitor",
     "QeAppWorkChainSelector",
     "SimplifiedProcessTree",
     "SimplifiedProcessTreeModel",
@@ -0,0 +1,229 @@
+"""Broadcast of the changes of process trees to the app instances of a profile.
+
+Each app instance, i.e. each open notebook, monitors the process trees it shows
+with its own queries, see `monitor.py`, multiplying the load on the database
+when many notebooks are open. With the broadcast enabled, a single instance per
+AiiDA profile, the broadcaster, checks the process trees that any instance
+subscribed to, and publishes their fingerprints to files of a shared directory.
+The other instances only watch these files, without querying the database.
+
+The broadcaster is elected through an exclusive lock on a file of the directory:
+every instance with subscriptions tries to acquire the lock, the one holding it
+being the broadcaster. As the lock is released when its process ends, another
+instance takes over if the broadcaster is closed.
+
+The broadcast is enabled by setting the `AIIDALAB_QE_PROCESS_BROADCAST`
+environment variable to `1`, and requires file locks, i.e. a POSIX system. The
+monitors otherwise check their process trees themselves.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import threading
+import time
+import typing as t
+from functools import lru_cache
+from pathlib import Path
+
+from aiida import orm
+
+from .snapshot import ProcessTreeSnapshot
+
+try:
+    import fcntl
+except ImportError:  # not a POSIX system
+    fcntl = None
+
+BROADCAST_ENV_VARIABLE = "AIIDALAB_QE_PROCESS_BROADCAST"
+
+# Interval, in seconds, between two checks of the subscribed process trees
+BROADCAST_INTERVAL = 0.5
+
+# Time, in seconds, after which a subscription not renewed is dropped, e.g. that
+# of a closed notebook
+SUBSCRIPTION_TTL = 60.0
+
+LOCK_FILENAME = "broadcaster.lock"
+STATE_SUFFIX = ".state"
+SUBSCRIPTION_SUFFIX = ".subscription"
+
+
+def is_broadcast_enabled() -> bool:
+    """Whether the broadcast of the process changes is enabled and supported."""
+    enabled = os.environ.get(BROADCAST_ENV_VARIABLE, "").lower() in ("1", "true")
+    return enabled and fcntl is not None
+
+
+class ProcessBroadcastSubscription:
+    """Subscription of an app instance to the changes of a process tree.
+
+    Parameters
+    ----------
+    `broadcaster`: `ProcessStateBroadcaster`
+        The broadcaster of the profile.
+    `process_uuid`: `str`
+        The UUID of the root process of the tree.
+    """
+
+    def __init__(self, broadcaster: ProcessStateBroadcaster, process_uuid: str):
+        self.broadcaster = broadcaster
+        self.process_uuid = process_uuid
+        self.state_path = broadcaster.directory / f"{process_uuid}{STATE_SUFFIX}"
+        self.path = broadcaster.directory / (
+            f"{process_uuid}.{os.getpid()}-{id(self)}{SUBSCRIPTION_SUFFIX}"
+        )
+        self.renew()
+
+    def renew(self):
+        """Keep the subscription alive, see `SUBSCRIPTION_TTL`."""
+        self.path.touch()
+
+    def check(self) -> tuple[t.Hashable, bool]:
+        """Return the fingerprint of the process tree and whether it terminated.
+
+        The fingerprint is `None` until the broadcaster published the state of the
+        tree. The subscription is renewed on each check.
+        """
+        with contextlib.suppress(OSError):
+            self.renew()
+        try:
+            state = json.loads(self.state_path.read_text())
+        except (OSError, ValueError):
+            return None, False
+        return state["fingerprint"], state["terminated"]
+
+    def close(self):
+        """Cancel the subscription."""
+        with contextlib.suppress(OSError):
+            self.path.unlink()
+
+
+class ProcessStateBroadcaster:
+    """Publish the changes of the process trees subscribed to by app instances.
+
+    The instance runs a background thread which, as long as the instance holds the
+    lock of the directory, checks the subscribed process trees and publishes their
+    fingerprints, see `ProcessBroadcastSubscription.check`.
+
+    Parameters
+    ----------
+    `directory`: `Path`
+        The directory shared by the app instances of the profile.
+    `interval`: `float`
+        The interval, in seconds, between two checks of the process trees.
+    """
+
+    def __init__(self, directory: Path, interval: float = BROADCAST_INTERVAL):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.interval = interval
+        self._lock_file = None
+        self._snapshots: dict[str, ProcessTreeSnapshot] = {}
+        self._published: dict[str, t.Hashable] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def is_broadcasting(self) -> bool:
+        """Whether this instance is the broadcaster of the directory."""
+        return self._lock_file is not None
+
+    def subscribe(self, process_uuid: str) -> ProcessBroadcastSubscription:
+        """Subscribe to the changes of the process tree of the root process."""
+        return ProcessBroadcastSubscription(self, process_uuid)
+
+    def stop(self):
+        """Stop the thread, releasing the lock if held."""
+        self._stop.set()
+        self._thread.join()
+        self._release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._acquire():
+                self._broadcast()
+            self._stop.wait(self.interval)
+
+    def _acquire(self) -> bool:
+        if self._lock_file is None:
+            lock_file = open(self.directory / LOCK_FILENAME, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+            # The states published by a previous broadcaster may be outdated
+            self._snapshots.clear()
+            self._published.clear()
+        return True
+
+    def _release(self):
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _broadcast(self):
+        subscribed = self._get_subscribed()
+        for uuid in set(self._snapshots) - subscribed:
+            del self._snapshots[uuid]
+            self._published.pop(uuid, None)
+        for uuid in subscribed:
+            try:
+                if uuid not in self._snapshots:
+                    node = orm.load_node(uuid)
+                    self._snapshots[uuid] = ProcessTreeSnapshot(node.pk)
+                snapshot = self._snapshots[uuid]
+                snapshot.refresh()
+                if self._published.get(uuid) != snapshot.version:
+                    self._publish(uuid, snapshot)
+                    self._published[uuid] = snapshot.version
+            except Exception:
+                # E.g. a lost connection to the database, tried again next time
+                continue
+
+    def _get_subscribed(self) -> set[str]:
+        """Return the UUIDs of the subscribed processes, dropping the expired ones."""
+        subscribed = set()
+        expired = time.time() - SUBSCRIPTION_TTL
+        for path in self.directory.glob(f"*{SUBSCRIPTION_SUFFIX}"):
+            try:
+                if path.stat().st_mtime < expired:
+                    path.unlink()
+                    continue
+            except OSError:  # e.g. cancelled meanwhile
+                continue
+            subscribed.add(path.name.split(".", 1)[0])
+        for path in self.directory.glob(f"*{STATE_SUFFIX}"):
+            if path.name.removesuffix(STATE_SUFFIX) not in subscribed:
+                with contextlib.suppress(OSError):
+                    path.unlink()
+        return subscribed
+
+    def _publish(self, uuid: str, snapshot: ProcessTreeSnapshot):
+        state = {
+            # Unique across the broadcasters, whose snapshot versions all start at 0
+            "fingerprint": f"{os.getpid()}-{id(snapshot)}-{snapshot.version}",
+            "terminated": snapshot.is_terminated,
+        }
+        # Written to a temporary file first, for the subscribers never to read a
+        # partially written state
+        path = self.directory / f"{uuid}{STATE_SUFFIX}"
+        temporary = path.with_name(f".{path.name}.{os.getpid()}")
+        temporary.write_text(json.dumps(state))
+        os.replace(temporary, path)
+
+
+@lru_cache(maxsize=1)
+def get_process_broadcaster() -> ProcessStateBroadcaster:
+    """Return the broadcaster of the process changes of the current profile."""
+    from aiida import get_profile
+    from aiida.manage import get_config
+
+    directory = get_config().dirpath / "aiidalab_qe" / "broadcast" / get_profile().name
+    return ProcessStateBroadcaster(Path(directory))
@@ -0,0 +1,80 @@
+"""Cache of the expected number of jobs of the workchains of a process tree.
+
+The tally of each workchain node of the simplified process tree compares its
+finished jobs to the number of jobs expected from the metadata inputs of the
+workchain. Walking the nested metadata inputs of every workchain of the tree,
+each loaded from the database, is repeated whenever the tree is rendered. The
+expected numbers of jobs of all the workchains of a tree are instead cached in
+the extras of the root workchain node, keyed by the UUIDs of the workchains, as
+`extras.aiidalab_qe_expected_jobs`.
+"""
+
+from __future__ import annotations
+
+import typing as t
+from threading import Lock
+
+from aiida import orm
+
+EXPECTED_JOBS_VERSION = 1
+EXPECTED_JOBS_EXTRA = "aiidalab_qe_expected_jobs"
+
+
+class ExpectedJobsCache:
+    """Expected number of jobs of the workchains of the tree of a root workchain.
+
+    Parameters
+    ----------
+    `root_uuid`: `str`
+        The UUID of the root workchain node, in whose extras the cache is stored.
+    """
+
+    def __init__(self, root_uuid: str):
+        self.root_uuid = root_uuid
+        self._lock = Lock()
+        self._jobs: dict[str, dict] | None = None
+        self._modified = False
+
+    def get(self, uuid: str, compute: t.Callable[[], dict]) -> dict:
+        """Return the expected jobs of the workchain, computing them if missing.
+
+        Parameters
+        ----------
+        `uuid`: `str`
+            The UUID of the workchain node.
+        `compute`: `Callable[[], dict]`
+            Called to compute the expected jobs if missing, returning a dictionary
+            with the expected `count` of jobs, and whether the actual number of jobs
+            may be `dynamic`, e.g. larger due to restarts.
+        """
+        with self._lock:
+            if self._jobs is None:
+                self._jobs = self._load()
+            if uuid not in self._jobs:
+                expected = compute()
+                self._jobs[uuid] = {
+                    "count": expected["count"],
+                    "dynamic": expected["dynamic"],
+                }
+                self._modified = True
+            return self._jobs[uuid]
+
+    def save(self):
+        """Store the newly computed expected jobs in the extras of the root node."""
+        with self._lock:
+            if not self._modified:
+                return
+            root = orm.load_node(self.root_uuid)
+            if root.is_stored:
+                root.base.extras.set(
+                    EXPECTED_JOBS_EXTRA,
+                    {"version": EXPECTED_JOBS_VERSION, "jobs": self._jobs},
+                )
+            self._modified = False
+
+    def _load(self) -> dict[str, dict]:
+        root = orm.load_node(self.root_uuid)
+        cached = root.base.extras.get(EXPECTED_JOBS_EXTRA, None)
+        if cached and cached.get("version") == EXPECTED_JOBS_VERSION:
+            return dict(cached["jobs"])
+        return {}
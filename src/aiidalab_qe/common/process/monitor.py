@@ -0,0 +1,232 @@
+"""Monitor of a process tree, running its callbacks only when the tree changed.
+
+The results step used to run its callbacks every 0.5 s, whether or not anything
+changed, each callback fanning out to the status panel, the process tree, the
+summary and every results panel, all of which query the database. Many open
+notebooks thus kept the database busy while their calculations were idle.
+
+The monitor instead refreshes a snapshot of the records of the process tree,
+see `snapshot.py`, whose states and modification times are a cheap fingerprint
+of the tree, and only runs its callbacks when the fingerprint changed. The
+interval between two checks grows while nothing changes, e.g. for long-running
+jobs, and is reset on a change. The monitor can be woken up, e.g. on a user
+action, to check the tree and run its callbacks right away. Its snapshot is
+shared with the views, e.g. the simplified process tree, which read the records
+refreshed by the monitor instead of querying the database again.
+
+With the broadcast of the process changes enabled, see `broadcast.py`, the
+monitor subscribes to the fingerprints published by the broadcaster of the
+profile instead of querying the database itself.
+"""
+
+from __future__ import annotations
+
+import inspect
+import sys
+import threading
+import traceback
+import typing as t
+import warnings
+
+import ipywidgets as ipw
+import traitlets as tl
+
+from aiida import orm
+
+from .broadcast import (
+    ProcessStateBroadcaster,
+    get_process_broadcaster,
+    is_broadcast_enabled,
+)
+from .snapshot import ProcessTreeSnapshot
+
+# Interval, in seconds, between two checks of the process tree right after a change
+MONITOR_MIN_INTERVAL = 0.5
+
+# Maximum interval, in seconds, between two checks of an unchanged process tree
+MONITOR_MAX_INTERVAL = 10.0
+
+# Factor by which the interval between two checks grows while nothing changes
+MONITOR_BACKOFF = 1.5
+
+
+class ProcessChangeMonitor(tl.HasTraits):
+    """Monitor a process tree and run callbacks whenever it changes.
+
+    A drop-in replacement of the `ProcessMonitor` of `aiidalab_widgets_base`, the
+    tree being checked in a background thread until all its processes are
+    terminated, after which the callbacks are run a final time.
+
+    Parameters
+    ----------
+    `callbacks`: `list[Callable]`, optional
+        The functions to run on a change, with the UUID of the process, if they
+        take an argument. A function raising an exception is disabled.
+    `min_interval`: `float`
+        The interval, in seconds, between two checks right after a change.
+    `max_interval`: `float`
+        The maximum interval, in seconds, between two checks.
+    `backoff`: `float`
+        The factor by which the interval grows while nothing changes.
+    `broadcaster`: `ProcessStateBroadcaster`, optional
+        The broadcaster to subscribe to. By default, that of the profile if the
+        broadcast is enabled, otherwise the monitor checks the tree itself.
+    `log_widget`: `ipw.Output`, optional
+        The widget to print the tracebacks of the failing callbacks to.
+    """
+
+    value = tl.Unicode(allow_none=True)
+    # The snapshot refreshed by the monitor, once refreshed a first time, if the
+    # monitor checks the tree itself, i.e. does not subscribe to the broadcast
+    snapshot = tl.Instance(ProcessTreeSnapshot, allow_none=True)
+
+    def __init__(
+        self,
+        callbacks: list[t.Callable] | None = None,
+        min_interval: float = MONITOR_MIN_INTERVAL,
+        max_interval: float = MONITOR_MAX_INTERVAL,
+        backoff: float = MONITOR_BACKOFF,
+        broadcaster: ProcessStateBroadcaster | None = None,
+        **kwargs,
+    ):
+        self.callbacks = [] if callbacks is None else list(callbacks)
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.backoff = backoff
+        self.broadcaster = broadcaster
+        self.log_widget: ipw.Output | None = kwargs.pop("log_widget", None)
+
+        self._monitor_thread: threading.Thread | None = None
+        self._monitor_thread_stop = threading.Event()
+        self._monitor_thread_lock = threading.Lock()
+        self._wake_up = threading.Event()
+
+        super().__init__(**kwargs)
+
+    def wake_up(self):
+        """Check the process tree and run the callbacks without waiting.
+
+        The callbacks are run even if the tree did not change, e.g. after a user
+        action which the views should reflect right away.
+        """
+        self._wake_up.set()
+
+    def join(self):
+        if self._monitor_thread is not None:
+            self._monitor_thread.join()
+
+    @tl.observe("value")
+    def _observe_process(self, change):
+        """Stop monitoring the previous process, if any, and monitor the new one."""
+        process_uuid = change["new"]
+
+        with self._monitor_thread_lock:
+            if self._monitor_thread is not None:
+                self._monitor_thread_stop.set()
+                self._wake_up.set()
+                self._monitor_thread.join()
+                self._monitor_thread = None
+
+            self.snapshot = None
+            if process_uuid is None:
+                return
+
+            self._monitor_thread_stop.clear()
+            self._wake_up.clear()
+            self._monitor_thread = threading.Thread(
+                target=self._monitor_process,
+                args=(process_uuid,),
+                daemon=True,
+            )
+            self._monitor_thread.start()
+
+    def _monitor_process(self, process_uuid: str):
+        if subscription := self._subscribe(process_uuid):
+            check = subscription.check
+        elif not (check := self._get_snapshot_check(process_uuid)):
+            return
+        disabled_callbacks = set()
+        fingerprint = object()  # the callbacks are always run on the first check
+        interval = self.min_interval
+
+        try:
+            while not self._monitor_thread_stop.is_set():
+                woken_up = self._wake_up.is_set()
+                self._wake_up.clear()
+                new_fingerprint, terminated = check()
+
+                changed = new_fingerprint != fingerprint
+                fingerprint = new_fingerprint
+                if changed or woken_up:
+                    self._run_callbacks(process_uuid, disabled_callbacks)
+                    interval = self.min_interval
+                elif not subscription:
+                    # Only the queries back off, the published fingerprints being
+                    # cheap to check
+                    interval = min(interval * self.backoff, self.max_interval)
+
+                if terminated:
+                    break
+
+                self._wake_up.wait(timeout=interval)
+        finally:
+            if subscription:
+                subscription.close()
+
+    def _subscribe(self, process_uuid: str):
+        """Subscribe to the broadcaster, if any, see `broadcast.py`."""
+        try:
+            broadcaster = self.broadcaster or (
+                get_process_broadcaster() if is_broadcast_enabled() else None
+            )
+            return broadcaster.subscribe(process_uuid) if broadcaster else None
+        except OSError:
+            self._log_exception("Failed to subscribe to the process broadcast")
+            return None
+
+    def _get_snapshot_check(self, process_uuid: str):
+        """Return a check of the process tree from a snapshot of its own.
+
+        The snapshot is shared through the `snapshot` trait once refreshed, before
+        the callbacks are run. `None` is returned if the process cannot be loaded.
+        """
+        try:
+            snapshot = ProcessTreeSnapshot(orm.load_node(process_uuid).pk)
+        except Exception:
+            self._log_exception("Failed to load the process")
+            return None
+
+        def check():
+            try:
+                snapshot.refresh()
+            except Exception:
+                self._log_exception("Failed to check the process tree")
+            self.snapshot = snapshot
+            return snapshot.version, snapshot.is_terminated
+
+        return check
+
+    def _run_callbacks(self, process_uuid: str, disabled_callbacks: set):
+        for callback in self.callbacks:
+            if callback in disabled_callbacks:
+                continue
+            try:
+                if len(inspect.signature(callback).parameters) > 0:
+                    callback(process_uuid)
+                else:
+                    callback()
+            except Exception:
+                self._log_exception(
+                    f"The callback function {callback.__name__!r} was disabled "
+                    "due to an error"
+                )
+                disabled_callbacks.add(callback)
+
+    def _log_exception(self, message: str):
+        if self.log_widget:
+            with self.log_widget:
+                traceback.print_exc(file=sys.stdout)
+        warnings.warn(
+            f"WARNING: {message}:\n{traceback.format_exc()}",
+            stacklevel=2,
+        )
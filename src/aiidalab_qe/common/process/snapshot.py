@@ -0,0 +1,227 @@
+"""In-memory snapshot of a process tree, refreshed with a single query.
+
+The nodes of the simplified process tree used to query the database on every
+update of the monitor, each loading its process node, its called processes, and
+counting its finished calculations with a graph traversal. The snapshot instead
+fetches the records of the processes of the tree, i.e. their state, label,
+caller and modification time, with a single `QueryBuilder` query per update,
+from which all the nodes of the tree are updated.
+
+Only the children of the workflows that are not settled yet are fetched. A
+workflow is settled once it and all its children are terminated, as its
+children, and their states, can no longer change. The children of the workflows
+discovered in an update are fetched in a follow-up query of the same update, so
+that the snapshot always holds the whole tree.
+"""
+
+from __future__ import annotations
+
+import typing as t
+from datetime import datetime
+from threading import Lock
+
+from aiida import orm
+
+TERMINATED_STATES = ("finished", "excepted", "killed")
+
+# Projections of the process records, see `ProcessRecord`
+RECORD_PROJECTIONS = [
+    "id",
+    "uuid",
+    "node_type",
+    "attributes.process_label",
+    "attributes.process_state",
+    "attributes.exit_status",
+    "ctime",
+    "mtime",
+]
+
+
+class ProcessRecord(t.NamedTuple):
+    """Record of a process node of the tree.
+
+    The fields have the names of the corresponding attributes of the process
+    nodes, except for the `process_state`, which is the raw state value.
+    """
+
+    pk: int
+    uuid: str
+    node_type: str
+    process_label: str | None
+    process_state: str | None
+    exit_status: int | None
+    ctime: datetime
+    mtime: datetime
+
+    @property
+    def is_terminated(self) -> bool:
+        return self.process_state in TERMINATED_STATES
+
+    @property
+    def is_failed(self) -> bool:
+        return self.process_state == "finished" and self.exit_status != 0
+
+    @property
+    def is_workflow(self) -> bool:
+        return self.node_type.startswith("process.workflow.")
+
+    @property
+    def is_calcjob(self) -> bool:
+        return self.node_type.startswith("process.calculation.calcjob.")
+
+    @property
+    def is_calcfunction(self) -> bool:
+        return self.node_type.startswith("process.calculation.calcfunction.")
+
+
+class ProcessTreeSnapshot:
+    """Snapshot of the records of the processes called by a root process.
+
+    Parameters
+    ----------
+    `root_pk`: `int`
+        The PK of the root process node.
+    """
+
+    def __init__(self, root_pk: int):
+        self.root_pk = root_pk
+        # Incremented whenever a record changes, e.g. for the views to skip
+        # updates when nothing changed
+        self.version = 0
+        self._lock = Lock()
+        self._records: dict[int, ProcessRecord] = {}
+        self._children: dict[int, list[int]] = {}
+        self._settled: set[int] = set()
+        self._job_counts: dict[tuple[int, bool], int] = {}
+
+    def refresh(self):
+        """Fetch the records of the processes which may have changed.
+
+        A single query is run, unless new workflows were called since the last
+        refresh, whose children are then fetched by follow-up queries.
+        """
+        with self._lock:
+            pending = [
+                pk
+                for pk, record in self._records.items()
+                if record.is_workflow and pk not in self._settled
+            ]
+            if self.root_pk not in self._settled and self.root_pk not in pending:
+                pending.append(self.root_pk)
+            while pending:
+                pending = self._fetch(pending)
+            if self.root_pk not in self._settled and not self._children.get(
+                self.root_pk
+            ):
+                # The root is only projected as a parent, i.e. once it has children
+                self._update_records([self._query_root()])
+
+    @property
+    def is_terminated(self) -> bool:
+        """Whether all the processes of the tree are terminated."""
+        return self.root_pk in self._records and all(
+            record.is_terminated for record in self._records.values()
+        )
+
+    def get(self, pk: int) -> ProcessRecord | None:
+        """Return the record of the process, if in the snapshot."""
+        return self._records.get(pk)
+
+    def children(self, pk: int) -> list[ProcessRecord]:
+        """Return the records of the processes called by the process, by creation."""
+        return sorted(
+            (self._records[child] for child in self._children.get(pk, [])),
+            key=lambda record: record.ctime,
+        )
+
+    def count_jobs(self, pk: int, finished: bool = False) -> int:
+        """Return the number of calculation jobs of the subtree of the process.
+
+        If `finished`, only the jobs which finished successfully are counted.
+        """
+        if (pk, finished) not in self._job_counts:
+            record = self._records.get(pk)
+            counted = (
+                record is not None
+                and record.is_calcjob
+                and (
+                    not finished
+                    or (record.process_state == "finished" and record.exit_status == 0)
+                )
+            )
+            self._job_counts[pk, finished] = int(counted) + sum(
+                self.count_jobs(child, finished) for child in self._children.get(pk, [])
+            )
+        return self._job_counts[pk, finished]
+
+    def count_finished(self, pk: int) -> int:
+        """Return the number of calculation jobs of the subtree of the process
+        which finished successfully."""
+        return self.count_jobs(pk, finished=True)
+
+    def _fetch(self, parents: list[int]) -> list[int]:
+        """Fetch the children of the parents, with the parents' own records.
+
+        Returns the newly found workflows, whose children are still to be fetched.
+        """
+        query = orm.QueryBuilder()
+        query.append(
+            orm.ProcessNode,
+            filters={"id": {"in": parents}},
+            project=RECORD_PROJECTIONS,
+            tag="parent",
+        )
+        # The links between process nodes are all `CALL` links
+        query.append(
+            orm.ProcessNode,
+            with_incoming="parent",
+            project=RECORD_PROJECTIONS,
+            tag="child",
+        )
+        size = len(RECORD_PROJECTIONS)
+        records, children = [], {parent: [] for parent in parents}
+        for row in query.iterall():
+            parent, child = ProcessRecord(*row[:size]), ProcessRecord(*row[size:])
+            records += [parent, child]
+            children[parent.pk].append(child.pk)
+
+        new_workflows = [
+            record.pk
+            for record in records
+            if record.is_workflow
+            and record.pk not in self._children
+            and record.pk not in children
+        ]
+        self._update_records(records)
+        self._children |= children
+
+        for parent in parents:
+            record = self._records.get(parent)
+            if (
+                record
+                and record.is_terminated
+                and all(
+                    self._records[child].is_terminated for child in children[parent]
+                )
+            ):
+                self._settled.add(parent)
+        return list(dict.fromkeys(new_workflows))
+
+    def _update_records(self, records: list[ProcessRecord]):
+        changed = False
+        for record in records:
+            if self._records.get(record.pk) != record:
+                self._records[record.pk] = record
+                changed = True
+        if changed:
+            self._job_counts = {}
+            self.version += 1
+
+    def _query_root(self) -> ProcessRecord:
+        query = orm.QueryBuilder()
+        query.append(
+            orm.ProcessNode,
+            filters={"id": self.root_pk},
+            project=RECORD_PROJECTIONS,
+        )
+        return ProcessRecord(*query.one())
@@ -8,14 +8,14 @@ import ipywidgets as ipw
 import traitlets as tl
 
 from aiida import orm
-from aiida.common.links import LinkType
 from aiida.engine import ProcessState
-from aiida.tools.graph.graph_traversers import traverse_graph
 from aiidalab_qe.app.utils import get_entry_items
 from aiidalab_qe.common.mixins import HasProcess
 from aiidalab_qe.common.mvc import Model
 from aiidalab_qe.common.widgets import LoadingWidget
 
+from .expected import ExpectedJobsCache
+from .snapshot import ProcessRecord, ProcessTreeSnapshot
 from .state import STATE_ICONS
 
 TITLE_MAPPING = {
@@ -45,6 +45,10 @@ TITLE_MAPPING = {
 }
 
 
+# Number of branches of a workchain shown at once, the others being shown on demand
+BRANCHES_PAGE_SIZE = 50
+
+
 class SimplifiedProcessTreeModel(Model, HasProcess):
     clicked = tl.Unicode(None, allow_none=True)
 
@@ -66,6 +70,10 @@ class SimplifiedProcessTree(ipw.VBox):
             self._on_monitor_counter_change,
             "monitor_counter",
         )
+        self._model.observe(
+            self._on_process_snapshot_change,
+            "process_snapshot",
+        )
         self.rendered = False
 
     def render(self):
@@ -85,6 +93,18 @@ class SimplifiedProcessTree(ipw.VBox):
         if self.rendered:
             self._update()
 
+    def _on_process_snapshot_change(self, change):
+        """Rebuild the trunk on the snapshot shared by the monitor, if any."""
+        snapshot = change["new"]
+        if (
+            self.rendered
+            and snapshot
+            and snapshot is not self.trunk.snapshot
+            and snapshot.root_pk == self.trunk.pk
+        ):
+            self._build_trunk()
+            self.tree_container.children = [self.trunk]
+
     def _on_inspect(self, uuid: str):
         self._model.clicked = None  # ensure event is triggered when label is reclicked
         self._model.clicked = uuid
@@ -102,13 +122,7 @@ class SimplifiedProcessTree(ipw.VBox):
         )
         self.collapse_button.on_click(self._collapse_all)
 
-        root = self._model.fetch_process_node()
-
-        self.trunk = WorkChainTreeNode(node=root, on_inspect=self._on_inspect)
-        self.trunk.add_class("tree-trunk")
-        self.trunk.initialize()
-        self.trunk.expand()
-        self._update()
+        self._build_trunk()
 
         self.tree_container = ipw.VBox(
             children=[self.trunk],
@@ -139,6 +153,21 @@ class SimplifiedProcessTree(ipw.VBox):
 
         self.rendered = True
 
+    def _build_trunk(self):
+        """Build the trunk of the tree, on the snapshot shared by the monitor if of
+        the process, otherwise on a snapshot of its own."""
+        root = self._model.fetch_process_node()
+        snapshot = self._model.process_snapshot
+        self.trunk = WorkChainTreeNode(
+            node=root,
+            on_inspect=self._on_inspect,
+            snapshot=snapshot if snapshot and snapshot.root_pk == root.pk else None,
+        )
+        self.trunk.add_class("tree-trunk")
+        self.trunk.initialize()
+        self.trunk.expand()
+        self._update()
+
     def _update(self):
         self.trunk.update()
 
@@ -150,16 +179,46 @@ ProcessNodeType = t.TypeVar("ProcessNodeType", bound=orm.ProcessNode)
 
 
 class ProcessTreeNode(ipw.VBox, t.Generic[ProcessNodeType]):
+    """A node of the simplified process tree.
+
+    The nodes of a tree are updated from the records of a shared snapshot of the
+    process tree, refreshed by the root node of the tree or, if shared with the
+    process monitor, by the monitor, instead of querying the database for their
+    process node, see `snapshot.py`.
+
+    Parameters
+    ----------
+    `node`: `orm.ProcessNode | ProcessRecord`
+        The process node, or its record in the snapshot.
+    `level`: `int`
+        The depth of the node in the tree.
+    `on_inspect`: `Callable[[str], None]`, optional
+        Called with the UUID of a calculation clicked in the tree.
+    `snapshot`: `ProcessTreeSnapshot`, optional
+        The snapshot of the tree, refreshed by its owner. If not given, the node
+        is the root of a new snapshot, which it refreshes on update.
+    `expected_jobs_cache`: `ExpectedJobsCache`, optional
+        The cache of the expected jobs of the tree. If not given, the node is the
+        root of the tree, whose cache it saves on update.
+    """
+
     def __init__(
         self,
-        node: ProcessNodeType,
+        node: ProcessNodeType | ProcessRecord,
         level: int = 0,
         on_inspect: t.Callable[[str], None] | None = None,
+        snapshot: ProcessTreeSnapshot | None = None,
+        expected_jobs_cache: ExpectedJobsCache | None = None,
         **kwargs,
     ):
+        self.pk = node.pk
         self.uuid = node.uuid
         self.level = level
         self.on_inspect = on_inspect
+        self._owns_snapshot = snapshot is None
+        self.snapshot = snapshot or ProcessTreeSnapshot(node.pk)
+        self._owns_expected_jobs_cache = expected_jobs_cache is None
+        self.expected_jobs_cache = expected_jobs_cache or ExpectedJobsCache(node.uuid)
         super().__init__(**kwargs)
         self._node: dict[int, ProcessNodeType] = {}  # thread_id: node
 
@@ -170,11 +229,17 @@ class ProcessTreeNode(ipw.VBox, t.Generic[ProcessNodeType]):
             self._node[tid] = node
         return self._node[tid]
 
+    @property
+    def record(self) -> ProcessRecord | None:
+        return self.snapshot.get(self.pk)
+
     def initialize(self):
         self._build_header()
         self.children = [self.header]
 
     def update(self):
+        if self._owns_snapshot:
+            self.snapshot.refresh()
         self.state.value = self._get_state()
         self.emoji.value = self._get_emoji(self.state.value)
 
@@ -193,15 +258,15 @@ class ProcessTreeNode(ipw.VBox, t.Generic[ProcessNodeType]):
         return STATE_ICONS.get(state, "❓")
 
     def _get_state(self):
-        if not hasattr(self.node, "process_state"):
+        if (record := self.record) is None:
             return "queued"
-        if self.node.is_failed:
+        if record.is_failed:
             return "failed"
-        state = self.node.process_state
+        state = record.process_state
         return (
             "running"
-            if state is ProcessState.WAITING
-            else state.value
+            if state == ProcessState.WAITING.value
+            else state
             if state
             else "created"
         )
@@ -241,6 +306,9 @@ class ProcessTreeBranches(ipw.VBox):
 
 class WorkChainTreeNode(ProcessTreeNode[orm.WorkChainNode]):
     _adding_branches = False
+    _num_hidden = 0
+    _tally_counts: tuple[int, int] | None = None
+    _tally = ""
 
     @property
     def metadata_inputs(self):
@@ -273,23 +341,39 @@ class WorkChainTreeNode(ProcessTreeNode[orm.WorkChainNode]):
     def initialize(self):
         super().initialize()
         self.pks = set()
+        self.num_shown = BRANCHES_PAGE_SIZE
         self.branches = ProcessTreeBranches()
         self.branches.add_class("tree-node-branches")
-        self.children += (self.branches,)
-        self.expected_jobs = self._get_expected(self.metadata_inputs)
+        self.more_button = ipw.Button(
+            icon="ellipsis-h",
+            layout=ipw.Layout(
+                display="none",
+                margin=f"0 0 0 {22 * (self.level + 1) + 12}px",
+            ),
+        )
+        self.more_button.add_class("tree-node-more")
+        self.more_button.on_click(self._show_more_branches)
+        self.children += (self.branches, self.more_button)
+        self.expected_jobs = self.expected_jobs_cache.get(
+            self.uuid,
+            lambda: self._get_expected(self.metadata_inputs),
+        )
         self.update()
 
     def update(self):
         super().update()
         self.tally.value = self._get_tally()
+        # The branches of a collapsed node are hidden, and thus not updated
         if not self.collapsed:
             self._add_branches()
-        for branch in self.branches:
-            branch.update()
+            self._update_branches()
+        if self._owns_expected_jobs_cache:
+            self.expected_jobs_cache.save()
 
     def clear(self):
         self.branches.clear()
         self.pks.clear()
+        self.num_shown = BRANCHES_PAGE_SIZE
 
     def expand(self, recursive=False):
         if self.collapsed:
@@ -329,68 +413,82 @@ class WorkChainTreeNode(ProcessTreeNode[orm.WorkChainNode]):
         if self._adding_branches:
             return
         self._adding_branches = True
-        self._add_branches_recursive()
+        records = self._get_branch_records()
+        for record in records[: self.num_shown]:
+            if record.pk not in self.pks:
+                self._add_branch(record)
+        self._num_hidden = max(len(records) - self.num_shown, 0)
+        self._update_more_button()
         self._adding_branches = False
 
-    def _add_branches_recursive(self, node: orm.ProcessNode | None = None):
-        node = node or self.node
-        for child in sorted(node.called, key=lambda child: child.ctime):
-            if isinstance(child, orm.CalcFunctionNode):
-                continue
-            if child.pk in self.pks:
+    def _get_branch_records(self, pk: int | None = None) -> list[ProcessRecord]:
+        """Return the records of the branches, in order of creation.
+
+        Only the branches shown are built as tree nodes, the others, e.g. those of
+        collapsed nodes or beyond the shown pages, are kept as records of the
+        snapshot.
+        """
+        records = []
+        for child in self.snapshot.children(pk or self.pk):
+            if child.is_calcfunction:
                 continue
             if child.process_label in (
                 "BandsWorkChain",
                 "ProjwfcBaseWorkChain",
             ):
-                self._add_branches_recursive(child)
+                records += self._get_branch_records(child.pk)
             else:
-                self._add_branch(child)
+                records.append(child)
+        return records
 
-    def _add_branch(self, child: orm.ProcessNode):
+    def _add_branch(self, child: orm.ProcessNode | ProcessRecord):
         TreeNodeClass = (
             WorkChainTreeNode
-            if isinstance(child, orm.WorkChainNode)
+            if child.node_type.startswith("process.workflow.workchain.")
             else CalcJobTreeNode
         )
         branch = TreeNodeClass(
             node=child,
             level=self.level + 1,
             on_inspect=self.on_inspect,
+            snapshot=self.snapshot,
+            expected_jobs_cache=self.expected_jobs_cache,
         )
         branch.initialize()
         self.branches += branch
         self.pks.add(child.pk)
 
+    def _update_branches(self):
+        for branch in self.branches:
+            branch.update()
+
+    def _show_more_branches(self, _=None):
+        self.num_shown += BRANCHES_PAGE_SIZE
+        self._add_branches()
+
+    def _update_more_button(self):
+        num_hidden = self._num_hidden
+        if self.collapsed or not num_hidden:
+            self.more_button.layout.display = "none"
+            return
+        self.more_button.description = (
+            f"Show {min(num_hidden, BRANCHES_PAGE_SIZE)} more "
+            f"({num_hidden} not shown)"
+        )
+        self.more_button.layout.display = "flex"
+
     def _get_tally(self):
-        total = self.expected_jobs["count"]
+        # The expected total is refined by the jobs actually called, e.g. restarts
+        total = max(self.expected_jobs["count"], self.snapshot.count_jobs(self.pk))
         dynamic = self.expected_jobs["dynamic"]
-        finished = self._count_finished()
-        tally = f"{finished}/{total}"
-        tally += "*" if dynamic else ""
-        tally += " job" if total == 1 else " jobs"
-        return tally
-
-    def _count_finished(self):
-        traverser = traverse_graph(
-            starting_pks=[self.node.pk],
-            links_forward=[
-                LinkType.CALL_WORK,
-                LinkType.CALL_CALC,
-            ],
-        )
-        return (
-            orm.QueryBuilder()
-            .append(
-                orm.CalcJobNode,
-                filters=(
-                    (orm.CalcJobNode.fields.pk.in_(traverser.get("nodes")))
-                    & (orm.CalcJobNode.fields.process_state == "finished")
-                    & (orm.CalcJobNode.fields.exit_status == 0)
-                ),
-            )
-            .count()
-        )
+        finished = self.snapshot.count_finished(self.pk)
+        if (finished, total) != self._tally_counts:
+            self._tally_counts = (finished, total)
+            tally = f"{finished}/{total}"
+            tally += "*" if dynamic else ""
+            tally += " job" if total == 1 else " jobs"
+            self._tally = tally
+        return self._tally
 
     def _get_expected(self, inputs: dict[str, dict]) -> dict:
         expected = {}
@@ -421,9 +519,11 @@ class WorkChainTreeNode(ProcessTreeNode[orm.WorkChainNode]):
             self.branches.add_class("open")
             self.toggle.icon = "minus"
             self._add_branches()
+            self._update_branches()
         else:
             self.branches.remove_class("open")
             self.toggle.icon = "plus"
+            self._update_more_button()
 
 
 class CalcJobTreeNode(ProcessTreeNode[orm.CalcJobNode]):
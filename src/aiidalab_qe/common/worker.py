@@ -0,0 +1,152 @@
+"""Background worker for the preparation of data off the kernel's main thread.
+
+Heavy tasks, e.g. parsing the outputs of a calculation, are run in a worker
+thread, so that the app remains responsive. Their progress and results are
+passed back to the thread of the kernel event loop, the one handling the widget
+events (the UI thread), where the widgets can be safely updated.
+"""
+
+from __future__ import annotations
+
+import typing as t
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from threading import Lock
+
+
+def run_on_ui_thread(callback: t.Callable[[], t.Any]):
+    """Run the callback on the thread of the kernel event loop.
+
+    Without a running kernel, e.g. in scripts and tests, the callback is run
+    immediately in the calling thread.
+    """
+    from IPython import get_ipython
+
+    kernel = getattr(get_ipython(), "kernel", None)
+    io_loop = getattr(kernel, "io_loop", None)
+    if io_loop is None:
+        callback()
+    else:
+        io_loop.add_callback(callback)
+
+
+class WorkerRequest:
+    """A request submitted to a `BackgroundWorker`.
+
+    The task of the request can report its progress and check whether it was
+    superseded by a newer request, to stop early.
+    """
+
+    def __init__(self, worker: BackgroundWorker, generation: int, on_progress=None):
+        self._worker = worker
+        self._generation = generation
+        self._on_progress = on_progress
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the request was superseded by a newer request."""
+        return self._generation != self._worker.generation
+
+    def raise_if_cancelled(self):
+        """Raise a `CancelledError` if the request was superseded."""
+        if self.cancelled:
+            raise CancelledError
+
+    def report_progress(self, progress: float, message: str = ""):
+        """Report the progress, between 0 and 1, of the request to the UI thread.
+
+        Raises a `CancelledError` if the request was superseded.
+        """
+        self.raise_if_cancelled()
+        if self._on_progress:
+            self.dispatch(self._on_progress, progress, message)
+
+    def dispatch(self, callback, *args):
+        """Run the callback on the UI thread, unless the request was superseded."""
+
+        def run():
+            if not self.cancelled:
+                callback(*args)
+
+        run_on_ui_thread(run)
+
+
+class BackgroundWorker:
+    """Run tasks in a single background thread, the latest request winning.
+
+    Submitting a request supersedes the previous ones: those not yet started are
+    skipped, and the results of those running are discarded. Only the result of
+    the latest request is passed, on the UI thread, to its `on_result` callback.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self._lock = Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._future: Future | None = None
+
+    def submit(
+        self,
+        task: t.Callable[[WorkerRequest], t.Any],
+        on_result: t.Callable[[t.Any], t.Any],
+        on_progress: t.Callable[[float, str], t.Any] | None = None,
+        on_error: t.Callable[[Exception], t.Any] | None = None,
+    ) -> WorkerRequest:
+        """Submit a task, superseding the previous requests.
+
+        Parameters
+        ----------
+        `task`: `Callable[[WorkerRequest], Any]`
+            The task, run in the worker thread with the request as argument.
+        `on_result`: `Callable[[Any], Any]`
+            Called on the UI thread with the result of the task.
+        `on_progress`: `Callable[[float, str], Any]`, optional
+            Called on the UI thread with the progress reported by the task.
+        `on_error`: `Callable[[Exception], Any]`, optional
+            Called on the UI thread with the exception raised by the task.
+
+        Returns
+        -------
+        `WorkerRequest`
+            The request of the task.
+        """
+        with self._lock:
+            self.generation += 1
+            request = WorkerRequest(self, self.generation, on_progress)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1,
+                    thread_name_prefix="aiidalab-qe-worker",
+                )
+            self._future = self._executor.submit(
+                self._run, task, request, on_result, on_error
+            )
+        return request
+
+    def cancel(self):
+        """Supersede all the submitted requests, without submitting a new one."""
+        with self._lock:
+            self.generation += 1
+
+    def wait(self, timeout: float | None = None):
+        """Wait for the latest request to be done.
+
+        Without a running kernel, its result is then applied. With a running
+        kernel, this must not be called from the UI thread, which applies it.
+        """
+        if self._future is not None:
+            self._future.result(timeout)
+
+    @staticmethod
+    def _run(task, request: WorkerRequest, on_result, on_error):
+        if request.cancelled:
+            return
+        try:
+            result = task(request)
+        except CancelledError:
+            return
+        except Exception as error:
+            if on_error is None:
+                raise
+            request.dispatch(on_error, error)
+            return
+        request.dispatch(on_result, result)
@@ -3,6 +3,7 @@
 import ipywidgets as ipw
 
 from aiidalab_qe.common.bands_pdos import BandsPdosModel, BandsPdosWidget
+from aiidalab_qe.common.bands_pdos.analysis import get_band_analysis
 from aiidalab_qe.common.panel import ResultsPanel
 from aiidalab_qe.common.widgets import LoadingWidget
 
@@ -13,6 +14,7 @@ class ElectronicStructureResultsPanel(ResultsPanel[ElectronicStructureResultsMod
     has_property_selector = False
 
     def _render(self):
+        self.band_analysis_container = ipw.VBox()
         self.bands_pdos_container = ipw.VBox()
         # If the model implements `get_model_state` and `set_model_state`
         # we can add the `state_buttons` to the results container.
@@ -22,7 +24,7 @@ class ElectronicStructureResultsPanel(ResultsPanel[ElectronicStructureResultsMod
         if self._model.needs_property_selector:
             children.append(self._render_property_selector())
             self.has_property_selector = True
-        children.append(self.bands_pdos_container)
+        children += [self.band_analysis_container, self.bands_pdos_container]
         self.results_container.children = children
 
     def _post_render(self):
@@ -94,6 +96,7 @@ class ElectronicStructureResultsPanel(ResultsPanel[ElectronicStructureResultsMod
 
     def _render_bands_pdos_widget(self, node_identifiers):
         message = f"Loading {' + '.join(node_identifiers)} results"
+        self.band_analysis_container.children = []
         self.bands_pdos_container.children = [LoadingWidget(message)]
         nodes = {
             **{
@@ -103,9 +106,16 @@ class ElectronicStructureResultsPanel(ResultsPanel[ElectronicStructureResultsMod
             "root": self._model.fetch_process_node(),
         }
         model = BandsPdosModel.from_nodes(**nodes)
+        self._bands_pdos_model = model
+        if "bands" in node_identifiers:
+            # The analysis uses the bands data once parsed by the model, in the
+            # background, unless cached in the extras of the root node
+            model.observe(self._on_bands_pdos_update, "updating")
         widget = BandsPdosWidget(model=model)
         widget.render()
         self.bands_pdos_container.children = [widget]
+        if "bands" in node_identifiers and model.bands_data:
+            self._render_band_analysis(model.bands_data)
 
         ipw.link(
             (self._model, "dos_atoms_group"),
@@ -127,3 +137,84 @@ class ElectronicStructureResultsPanel(ResultsPanel[ElectronicStructureResultsMod
             (self._model, "bands_width_percentage"),
             (model, "bands_width_percentage"),
         )
+
+    def _on_bands_pdos_update(self, change):
+        model = change["owner"]
+        # Skip the models replaced by a new selection of properties
+        if model is not self._bands_pdos_model or change["new"]:
+            return
+        if model.bands_data and not self.band_analysis_container.children:
+            self._render_band_analysis(model.bands_data)
+
+    def _render_band_analysis(self, bands_data):
+        """Show the band gap, band edges and effective masses above the plot.
+
+        The analysis is cached in the extras of the root node, see `analysis.py`.
+        """
+        root = self._model.fetch_process_node()
+        analysis = get_band_analysis(root, bands_data=bands_data)
+        if not analysis:
+            return
+
+        if analysis["gap_type"] == "metal":
+            summary = "<b>Band gap:</b> 0 eV (metallic)"
+        elif analysis["gap_type"] is None:
+            summary = (
+                "<b>Band gap:</b> unknown, as there are no computed bands on one "
+                "side of the Fermi energy"
+            )
+        else:
+            summary = (
+                f"<b>Band gap:</b> {analysis['band_gap']:.3f} eV "
+                f"({analysis['gap_type']}), "
+                f"<b>direct gap:</b> {analysis['direct_gap']:.3f} eV"
+            )
+        rows = [
+            self._format_band_analysis_row(spin)
+            for spin in analysis["spins"]
+            if spin["gap_type"] not in ("metal", None)
+        ]
+        table = ""
+        if rows:
+            table = f"""
+                <table style="border-spacing: 12px 2px;">
+                    <tr>
+                        <th>Spin</th>
+                        <th>Gap (eV)</th>
+                        <th>VBM (eV)</th>
+                        <th>CBM (eV)</th>
+                        <th>Valence band width (eV)</th>
+                        <th>Conduction band width (eV)</th>
+                        <th>m*<sub>h</sub> (m<sub>e</sub>)</th>
+                        <th>m*<sub>e</sub> (m<sub>e</sub>)</th>
+                    </tr>
+                    {"".join(rows)}
+                </table>
+            """
+        self.band_analysis_container.children = [
+            ipw.HTML(f"<div style='margin: 10px 0;'>{summary}{table}</div>"),
+        ]
+
+    @staticmethod
+    def _format_band_analysis_row(spin):
+        """Return the HTML row of the band analysis of a spin channel."""
+
+        def edge(band_edge):
+            location = band_edge["label"] or f"x = {band_edge['x']:.3f}"
+            return f"{band_edge['energy']:.3f} at {location}"
+
+        def mass(value):
+            return "-" if value is None else f"{value:.3f}"
+
+        widths = spin["band_widths"]
+        cells = [
+            spin["spin"] or "-",
+            f"{spin['band_gap']:.3f} ({spin['gap_type']})",
+            edge(spin["vbm"]),
+            edge(spin["cbm"]),
+            f"{widths[spin['vbm']['band_index']]:.3f}",
+            f"{widths[spin['cbm']['band_index']]:.3f}",
+            mass(spin["hole_effective_mass"]),
+            mass(spin["electron_effective_mass"]),
+        ]
+        return "<tr>" + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>"
@@ -2,6 +2,7 @@
 # AiiDA Quantum ESPRESSO plugin inputs.
 from aiida import orm
 from aiida.common import AttributeDict
+from aiida.common.exceptions import NotExistent
 from aiida.engine import ToContext, WorkChain, if_
 from aiida.plugins import DataFactory
 from aiida_quantumespresso.common.types import ElectronicType, RelaxType, SpinType
@@ -105,6 +106,8 @@ class QeAppWorkChain(WorkChain):
         spec.exit_code(402, 'ERROR_SUB_PROCESS_FAILED_PDOS',
                        message='The PdosWorkChain sub process failed')
         spec.output('structure', valid_type=StructureData, required=False)
+        spec.output('plot_payload', valid_type=orm.SinglefileData, required=False,
+                    help='The precomputed plot data of the bands and PDOS results.')
         # yapf: enable
 
     @classmethod
@@ -321,6 +324,57 @@ class QeAppWorkChain(WorkChain):
                     workchain, entry_point["workchain"], namespace=name
                 )
             )
+        self.store_plot_payload()
+        self.store_band_analysis()
+
+    def store_plot_payload(self):
+        """Store the precomputed plot data of the bands and PDOS results, if any.
+
+        The plot payload is optional, as the results can always be parsed from the
+        outputs, so failing to parse them does not fail the workchain. It only holds
+        the plot data of the default grouping, i.e. by kinds and angular momentum,
+        see `PLOT_PAYLOAD_GROUPING`; the other groupings are parsed from the outputs
+        when requested in the app.
+        """
+        from aiidalab_qe.common.bands_pdos.payload import (
+            create_plot_payload,
+            get_plot_payload_inputs,
+        )
+        from aiidalab_qe.common.bands_pdos.utils import (
+            extract_bands_output,
+            extract_pdos_output,
+        )
+
+        bands = self.ctx.bands if self.should_run_plugin("bands") else None
+        pdos = self.ctx.pdos if self.should_run_plugin("pdos") else None
+        if not (bands or pdos):
+            return
+        try:
+            inputs = get_plot_payload_inputs(
+                bands=extract_bands_output(bands),
+                pdos=extract_pdos_output(pdos),
+            )
+            inputs["metadata"] = {"call_link_label": "plot_payload"}
+            self.out("plot_payload", create_plot_payload(**inputs))
+        except (KeyError, ValueError, NotExistent) as exception:
+            self.report(f"Failed to create the plot payload: {exception}")
+
+    def store_band_analysis(self):
+        """Cache the analysis of the band structure, if any, in the extras.
+
+        The analysis, e.g. the band gap, is then available to the calculation
+        history. As the plot payload, it is optional, as it can always be computed
+        from the outputs.
+        """
+        from aiidalab_qe.common.bands_pdos.analysis import get_band_analysis
+        from aiidalab_qe.common.bands_pdos.utils import extract_bands_output
+
+        if not self.should_run_plugin("bands"):
+            return
+        try:
+            get_band_analysis(self.node, extract_bands_output(self.ctx.bands))
+        except (KeyError, ValueError, NotExistent) as exception:
+            self.report(f"Failed to analyze the band structure: {exception}")
 
     def on_terminated(self):
         """Clean the working directories of all child calculations if `clean_workdir=True` in the inputs."""
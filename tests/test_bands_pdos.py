@@ -0,0 +1,761 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def generate_site_projection_data(generate_bands_data):
+    """Return a `ProjectionData` node with s and p orbitals on three sites."""
+
+    def _generate_site_projection_data():
+        from aiida.plugins import DataFactory, OrbitalFactory
+
+        ProjectionData = DataFactory("core.array.projection")
+        OrbitalCls = OrbitalFactory("core.realhydrogen")
+
+        sites = [
+            ("Si", [0.0, 0.0, 0.0]),
+            ("Si", [1.3575, 1.3575, 1.3575]),
+            ("O", [0.5, 0.5, 0.5]),
+        ]
+        orbitals = [
+            OrbitalCls(
+                kind_name=kind_name,
+                angular_momentum=angular_momentum,
+                magnetic_number=magnetic_number,
+                radial_nodes=0,
+                position=position,
+            )
+            for kind_name, position in sites
+            for angular_momentum in (0, 1)
+            for magnetic_number in range(2 * angular_momentum + 1)
+        ]
+        num_orbitals = len(orbitals)
+
+        projection_data = ProjectionData()
+        projection_data.set_reference_bandsdata(generate_bands_data())
+        projection_data.set_projectiondata(
+            orbitals,
+            list_of_projections=[np.array([[i + 1.0]]) for i in range(num_orbitals)],
+            list_of_energy=[np.linspace(-1, 1, 3) for _ in range(num_orbitals)],
+            list_of_pdos=[np.full(3, i + 1.0) for i in range(num_orbitals)],
+            bands_check=False,
+        )
+        projection_data.store()
+        return projection_data
+
+    return _generate_site_projection_data
+
+
+def test_projections_grouping(generate_site_projection_data):
+    """Test the grouping of the orbital projections."""
+    from aiidalab_qe.common.bands_pdos.utils import _projections_curated_options
+
+    projections = generate_site_projection_data()
+
+    pdos = _projections_curated_options(
+        projections,
+        group_tag="kinds",
+        plot_tag="angular_momentum",
+        selected_atoms=[],
+    )
+    assert [trace["label"] for trace in pdos] == [
+        "Si-r0 s",
+        "Si-r0 p",
+        "O-r0 s",
+        "O-r0 p",
+    ]
+    # The Si s orbitals are the 1st and 5th orbitals
+    assert np.allclose(pdos[0]["y"], [6.0, 6.0, 6.0])
+    assert np.allclose(pdos[0]["x"], [-1.0, 0.0, 1.0])
+    # The O p orbitals are the 10th to 12th orbitals
+    assert np.allclose(pdos[3]["y"], [33.0, 33.0, 33.0])
+
+    bands = _projections_curated_options(
+        projections,
+        group_tag="atoms",
+        plot_tag="total",
+        selected_atoms=[1],
+        projections_pdos="projections",
+        spin_type="down",
+    )
+    assert len(bands) == 1
+    assert bands[0]["label"] == "Si-[1.36, 1.36, 1.36](↓)"
+    assert np.allclose(bands[0]["projections"], [[26.0]])
+
+
+def test_projections_arrays_not_cached(generate_site_projection_data):
+    """Test that the arrays of stored projections are not kept in the node."""
+    from aiidalab_qe.common.bands_pdos.utils import _projections_curated_options
+
+    projections = generate_site_projection_data()
+    pdos = _projections_curated_options(
+        projections,
+        group_tag="atoms",
+        plot_tag="total",
+        selected_atoms=[],
+    )
+    # The orbitals share the same energy array, i.e. the same repository object
+    assert all(np.allclose(trace["x"], [-1.0, 0.0, 1.0]) for trace in pdos)
+    assert np.allclose(pdos[2]["y"], [42.0, 42.0, 42.0])
+    assert not projections._cached_arrays
+
+
+def test_projections_energy_window(generate_site_projection_data):
+    """Test that the PDOS and the bands are restricted to the energy window."""
+    from aiidalab_qe.common.bands_pdos.utils import (
+        _get_bands_mask,
+        _projections_curated_options,
+    )
+
+    pdos = _projections_curated_options(
+        generate_site_projection_data(),
+        group_tag="kinds",
+        plot_tag="total",
+        selected_atoms=[],
+        energy_window=(0.5, 2.0),
+    )
+    # The closest energy below the window is kept
+    assert np.allclose(pdos[0]["x"], [0.0, 1.0])
+    assert np.allclose(pdos[0]["y"], [36.0, 36.0])
+
+    bands_data = {
+        "y": np.array([[-5.0, -1.0, 0.5, 8.0], [-4.0, 1.0, 0.8, 9.0]]),
+        "band_type_idx": np.array([0, 0, 0, 0]),
+        "fermi_energy": 1.0,
+    }
+    mask = _get_bands_mask(bands_data, 0, energy_window=(-1.0, 1.0))
+    assert mask.tolist() == [False, True, True, False]
+    assert _get_bands_mask(bands_data, 0, energy_window=None) is None
+
+
+def test_projections_invalid_type(generate_site_projection_data):
+    """Test that an unknown projection type is rejected."""
+    from aiidalab_qe.common.bands_pdos.utils import _projections_curated_options
+
+    with pytest.raises(ValueError, match="Invalid value"):
+        _projections_curated_options(
+            generate_site_projection_data(),
+            group_tag="kinds",
+            plot_tag="total",
+            selected_atoms=[],
+            projections_pdos="bands",
+        )
+
+
+def test_orbital_table(generate_site_projection_data):
+    """Test that the orbital table is computed once per projections node."""
+    from aiidalab_qe.common.bands_pdos.utils import (
+        ORBITAL_TABLE_EXTRA,
+        get_orbital_table,
+    )
+
+    projections = generate_site_projection_data()
+    table = get_orbital_table(projections)
+
+    assert table["kind_names"] == ["Si", "O"]
+    assert table["positions"] == [
+        [0.0, 0.0, 0.0],
+        [1.36, 1.36, 1.36],
+        [0.5, 0.5, 0.5],
+    ]
+    assert table["site_index"] == [0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2]
+    assert table["angular_momentum"] == [0, 1, 1, 1] * 3
+    assert table["angular_momentum_names"] == ["r0 s", "r0 p"]
+    # The table is only stored in the extras on request
+    assert ORBITAL_TABLE_EXTRA not in projections.base.extras.keys()
+    assert get_orbital_table(projections, persist=True) == table
+    assert projections.base.extras.get(ORBITAL_TABLE_EXTRA) == table
+
+    # Each caller gets its own copy of the cached table
+    table["kind_names"].append("H")
+    assert get_orbital_table(projections)["kind_names"] == ["Si", "O"]
+
+
+def test_projected_bands_builder():
+    """Test that the fat bands are rebuilt in place for a new width."""
+    from aiidalab_qe.common.bands_pdos.utils import ProjectedBandsBuilder
+
+    bands_data = {
+        "x": np.array([0.0, 0.5, 1.0]),
+        # Two bands, as (number of kpoints, number of bands)
+        "y": np.array([[-1.0, 2.0], [-1.5, 2.5], [-1.0, 3.0]]),
+        "band_type_idx": np.array([0, 0]),
+    }
+    projections = [
+        [
+            {
+                "label": "Si-r0 s",
+                "color": "#000000",
+                "projections": np.array([[0.2, 0.0], [0.4, 0.0], [0.2, 1.0]]),
+            }
+        ]
+    ]
+    builder = ProjectedBandsBuilder(bands_data, projections)
+
+    (trace,) = builder.build(1.0)
+    x, y = trace["x"], trace["y"]
+    assert x.shape == y.shape == (2 * (2 * 3 + 1),)
+    # The first band, upper boundary then mirrored lower boundary
+    assert np.allclose(y[:6], [-0.9, -1.3, -0.9, -1.1, -1.7, -1.1])
+    assert np.isnan(y[6])
+    # The second band is only projected at the last kpoint
+    assert np.allclose(y[7:13], [2.0, 2.5, 3.5, 2.5, 2.5, 2.0])
+
+    (trace,) = builder.build(2.0)
+    assert trace["x"] is x
+    assert trace["y"] is y
+    assert np.allclose(y[:6], [-0.8, -1.1, -0.8, -1.2, -1.9, -1.2])
+
+
+def test_build_kpath():
+    """Test the distances, segments and labels of a discontinuous k-path."""
+    from aiidalab_qe.common.bands_pdos.utils import build_kpath
+
+    kpoints = np.zeros((8, 3))
+    kpoints[:, 0] = [0, 1, 2, 3, 10, 10, 11, 13]
+    labels = [(0, "GAMMA"), (3, "X"), (4, "U"), (6, "K")]
+
+    kpath = build_kpath(kpoints, labels)
+    # No distance between X and U, the ends of two segments
+    assert np.allclose(kpath["x"], [0, 1, 2, 3, 3, 3, 4, 6])
+    assert np.array_equal(kpath["segments"], [[0, 3], [4, 7]])
+    # The last k-point is labelled, if not by a high-symmetry point
+    assert kpath["pathlabels"] == [["\u0393", "X|U", "K", ""], [0.0, 3.0, 4.0, 6.0]]
+    assert kpath["kpoint_labels"] == [[0, "GAMMA"], [3, "X"], [4, "U"], [6, "K"]]
+
+    # Without labels, the ends of the path are labelled by their index
+    kpath = build_kpath(kpoints, [])
+    assert np.array_equal(kpath["segments"], [[0, 7]])
+    assert kpath["pathlabels"] == [["0", "1"], [0.0, 13.0]]
+
+
+def test_downsample_curves():
+    """Test that the downsampled curves keep the extrema of each bucket."""
+    from aiidalab_qe.common.bands_pdos.utils import downsample_curves
+
+    x = np.linspace(0, 1, 101)
+    y = np.vstack([np.sin(10 * x), -x])
+    y[0, 41] = 5.0
+
+    x_down, y_down = downsample_curves(x, y, num_buckets=10)
+    assert x_down.shape == y_down.shape == (2, 20)
+    assert y_down[0].max() == 5.0
+    assert np.isclose(y_down[0].min(), y[0].min())
+    assert np.allclose(y_down[1], -x_down[1])
+
+    # Zoomed in, the points in range and the closest ones outside are kept
+    x_down, y_down = downsample_curves(x, y, num_buckets=10, x_range=[0.2, 0.3])
+    assert np.allclose(x_down[0], x[19:32])
+    assert np.allclose(y_down, y[:, 19:32])
+
+
+def test_find_extremes_in_range():
+    """Test the extremes of the DOS traces within an energy range."""
+    from aiidalab_qe.common.bands_pdos.utils import (
+        find_extremes_in_range,
+        find_max_in_range,
+        find_max_up_and_down,
+    )
+
+    x = np.linspace(-5, 5, 11)
+    y = np.vstack([x**2, -np.abs(x)])
+
+    maxima, minima = find_extremes_in_range(x, y, -2, 3)
+    assert np.allclose(maxima, [9.0, 0.0])
+    assert np.allclose(minima, [0.0, -3.0])
+
+    maxima, minima = find_extremes_in_range(x, y, 10, 20)
+    assert np.isnan(maxima).all() and np.isnan(minima).all()
+
+    assert find_max_in_range(x, x**2, -2, 3) == 9.0
+    assert find_max_in_range(x, x**2, 10, 20) is None
+    assert find_max_up_and_down(x, x**2, x, -np.abs(x), -2, 3) == (-3.0, 9.0)
+    # The most negative value is only found below zero
+    assert find_max_up_and_down(x, x**2, x, x**2, -2, 3) == (None, 9.0)
+
+
+@pytest.mark.parametrize("broadening_type", ["gaussian", "lorentzian"])
+def test_broaden(broadening_type):
+    """Test the broadening of weighted eigenvalues onto an energy grid."""
+    from aiidalab_qe.common.bands_pdos import broadening
+
+    energies = np.linspace(-10, 10, 2001)
+    eigenvalues = np.array([[-1.234, 0.5], [0.25, 2.0]])
+    weights = np.stack([np.ones((2, 2)), [[1.0, 0.0], [0.0, 2.0]]])
+
+    def kernel(energy):
+        if broadening_type == "gaussian":
+            return np.exp(-((energy / 0.2) ** 2)) / (0.2 * np.sqrt(np.pi))
+        return 0.2 / np.pi / (energy**2 + 0.2**2)
+
+    dos = broadening.broaden(eigenvalues, weights, energies, 0.2, broadening_type)
+    assert dos.shape == (2, 2001)
+    expected = kernel(energies + 1.234) + 2 * kernel(energies - 2.0)
+    assert np.allclose(dos[1], expected, atol=1e-3 * expected.max())
+    # The densities integrate to the weights, up to the Lorentzian tails
+    assert np.allclose((dos * np.gradient(energies)).sum(axis=1), [4.0, 3.0], rtol=2e-2)
+
+    # The direct and FFT convolutions agree
+    fft = broadening.broaden(eigenvalues, weights, energies, 2.0, broadening_type)
+    direct = broadening.broaden(
+        eigenvalues, weights, energies[::50], 2.0, broadening_type
+    )
+    assert np.allclose(fft[:, ::50], direct, atol=1e-2 * direct.max())
+
+    with pytest.raises(ValueError):
+        broadening.broaden(eigenvalues, weights, energies, 0.0)
+    with pytest.raises(ValueError):
+        broadening.broaden(eigenvalues, weights, energies, 0.2, "cauchy")
+
+
+def test_projections_broadening(generate_site_projection_data):
+    """Test the PDOS broadened from the projections of the states."""
+    from aiidalab_qe.common.bands_pdos.broadening import Broadening
+    from aiidalab_qe.common.bands_pdos.utils import _projections_curated_options
+
+    projections = generate_site_projection_data()
+    pdos = _projections_curated_options(
+        projections,
+        group_tag="kinds",
+        plot_tag="angular_momentum",
+        selected_atoms=[],
+        broadening=Broadening(5.0, degeneracy=1.0),
+    )
+    # A single state at -5.64 eV, projected with a weight of 6 on the Si s orbitals
+    energies = np.linspace(-1, 1, 3)
+    expected = np.exp(-(((energies + 5.64024889) / 5.0) ** 2)) / (5.0 * np.sqrt(np.pi))
+    assert np.allclose(pdos[0]["x"], energies)
+    assert np.allclose(pdos[0]["y"], 6 * expected, rtol=3e-2)
+    assert np.allclose(pdos[3]["y"], 33 * expected, rtol=3e-2)
+
+
+def test_data_cache(generate_bands_data):
+    """Test the size-bounded cache of the parsed data."""
+    from aiidalab_qe.common.bands_pdos.cache import DataCache, get_outputs_key
+
+    cache = DataCache(max_bytes=2000)
+    computed = []
+
+    def compute(size):
+        computed.append(size)
+        return {"x": np.zeros(size // 8), "label": "data"}
+
+    first = cache.get("a", lambda: compute(800))
+    assert cache.get("a", lambda: compute(800)) is first
+    assert computed == [800]
+    # The cached arrays are shared, so they are read-only
+    with pytest.raises(ValueError):
+        first["x"][0] = 1.0
+
+    cache.get("b", lambda: compute(800))
+    cache.get("a", lambda: compute(800))
+    # The least recently used data are evicted first
+    cache.get("c", lambda: compute(800))
+    assert "a" in cache and "b" not in cache and "c" in cache
+    assert cache.nbytes == 1600
+    # Data larger than the cache, or without key, are not cached
+    cache.get("d", lambda: compute(4000))
+    cache.get(None, lambda: compute(800))
+    assert len(cache) == 2
+    assert computed == [800, 800, 800, 4000, 800]
+
+    bands = generate_bands_data()
+    key = get_outputs_key({"band_structure": bands}, "bands")
+    assert key == ((("band_structure", bands.uuid),), "bands")
+    assert get_outputs_key({"band_structure": bands}, "bands") == key
+    assert get_outputs_key({"band_structure": bands}, "pdos") != key
+    # Unstored nodes may still be modified
+    bands = bands.clone()
+    assert get_outputs_key({"band_structure": bands}, "bands") is None
+    assert get_outputs_key(None) is None
+
+
+def test_plot_payload_round_trip():
+    """Test that the plot payload is written and read back as an `.npz` archive."""
+    import io
+    import json
+
+    from aiidalab_qe.common.bands_pdos.payload import (
+        read_plot_payload,
+        write_plot_payload,
+    )
+
+    payload = {
+        "bands": {
+            "x": np.array([0.0, 0.5, 1.0]),
+            "y": np.array([[-1.0, 2.0], [-1.5, 2.5], [-1.0, 3.0]]),
+            "band_type_idx": np.array([0, 0]),
+            "segments": np.array([[0, 2]]),
+            "pathlabels": [["GAMMA", "X"], [0.0, 1.0]],
+            "fermi_energy": np.float64(0.5),
+        },
+        "pdos": {
+            "dos": [{"label": "Total DOS", "x": np.arange(3.0), "y": np.ones(3)}],
+            "fermi_energy": 0.5,
+        },
+        "projections": None,
+    }
+    handle = io.BytesIO()
+    write_plot_payload(payload, handle)
+    handle.seek(0)
+    loaded = read_plot_payload(handle)
+
+    assert np.allclose(loaded["bands"]["x"], [0.0, 0.5, 1.0])
+    assert np.allclose(loaded["bands"]["y"], payload["bands"]["y"])
+    assert np.array_equal(loaded["bands"]["segments"], [[0, 2]])
+    assert loaded["bands"]["pathlabels"] == [["GAMMA", "X"], [0.0, 1.0]]
+    assert loaded["bands"]["fermi_energy"] == 0.5
+    assert loaded["pdos"]["dos"][0]["label"] == "Total DOS"
+    assert np.allclose(loaded["pdos"]["dos"][0]["y"], np.ones(3))
+    assert loaded["projections"] is None
+
+    # Payloads of other versions are ignored
+    handle = io.BytesIO()
+    np.savez(handle, metadata=np.array(json.dumps({"version": 0, "payload": {}})))
+    handle.seek(0)
+    assert read_plot_payload(handle) is None
+
+
+@pytest.mark.parametrize("export_format", ["json", "npz", "csv", "hdf5"])
+def test_export_data(tmp_path, export_format):
+    """Test that the exported files hold the bands and PDOS data."""
+    import json
+
+    from aiidalab_qe.common.bands_pdos.export import (
+        EXPORT_FORMATS,
+        export_data,
+    )
+    from aiidalab_qe.common.bands_pdos.payload import _insert_arrays
+
+    if export_format not in EXPORT_FORMATS:
+        pytest.skip(f"The {export_format} export is not available")
+
+    bands_data = {
+        "x": [0.0, 0.5, 1.0],
+        "y": np.array([[-1.0, 2.0], [-1.5, 2.5], [-1.0, 3.0]]),
+        "band_type_idx": np.array([0, 1]),
+        "pathlabels": [["GAMMA", "X"], [0.0, 1.0]],
+        "kpoint_labels": [[0, "GAMMA"], [2, "X"]],
+        "fermi_energy_up": 0.5,
+        "fermi_energy_down": 0.6,
+    }
+    pdos_data = {
+        "dos": [
+            {"label": "Total DOS", "x": np.arange(3.0), "y": np.ones(3)},
+            {"label": "Si-3s, 3p", "x": np.arange(3.0), "y": np.full(3, 0.5)},
+        ],
+        "fermi_energy": 0.5,
+    }
+
+    for name, data in (("bands", bands_data), ("dos", pdos_data)):
+        path = export_data(data, name, export_format, export_dir=tmp_path)
+        assert path.parent.parent == tmp_path
+        assert [file.name for file in path.parent.iterdir()] == [path.name]
+
+        if export_format == "json":
+            loaded = json.loads(path.read_text())
+        elif export_format == "npz":
+            with np.load(path) as archive:
+                loaded = _insert_arrays(json.loads(archive["metadata"].item()), archive)
+        elif export_format == "hdf5":
+            import h5py
+
+            with h5py.File(path) as handle:
+                metadata = json.loads(handle.attrs["metadata"])
+                loaded = _insert_arrays(metadata, {k: v[()] for k, v in handle.items()})
+        else:
+            lines = path.read_text().splitlines()
+            if name == "bands":
+                assert lines[:4] == [
+                    "# fermi_energy_up = 0.5 eV",
+                    "# fermi_energy_down = 0.6 eV",
+                    "# label GAMMA at x=0",
+                    "# label X at x=1",
+                ]
+                assert lines[4] == "x,band_0 (up),band_1 (down)"
+                assert lines[5:] == ["0,-1,2", "0.5,-1.5,2.5", "1,-1,3"]
+            else:
+                assert lines[1] == 'energy,Total DOS,"Si-3s, 3p"'
+                assert lines[2:] == ["0,1,0.5", "1,1,0.5", "2,1,0.5"]
+            continue
+
+        if name == "bands":
+            # The keys of the bands data of AiiDA's `_get_bandplot_data` are kept
+            assert {
+                "x",
+                "y",
+                "band_type_idx",
+                "labels",
+                "raw_labels",
+                "path",
+                "paths",
+                "pathlabels",
+                "fermi_energy_up",
+                "fermi_energy_down",
+            } <= set(loaded)
+            assert np.allclose(loaded["y"], bands_data["y"])
+            assert loaded["pathlabels"] == bands_data["pathlabels"]
+            assert loaded["fermi_energy_down"] == 0.6
+            assert [list(label) for label in loaded["labels"]] == [
+                [0.0, "GAMMA"],
+                [1.0, "X"],
+            ]
+            assert loaded["path"] == [["GAMMA", "X"]]
+            (path,) = loaded["paths"]
+            assert path["from"] == "GAMMA" and path["length"] == 2
+            assert np.allclose(path["values"], bands_data["y"].T)
+            assert path["two_band_types"]
+        else:
+            assert loaded["dos"][1]["label"] == "Si-3s, 3p"
+            assert np.allclose(loaded["dos"][1]["y"], 0.5)
+
+
+def test_export_download(tmp_path, monkeypatch):
+    """Test that the exports are served by the `files/` handler of the server."""
+    import os
+
+    from aiidalab_qe.common.bands_pdos import export, model
+
+    root_dir = tmp_path.resolve()
+    monkeypatch.setattr(
+        export,
+        "get_server_info",
+        lambda: {"root_dir": root_dir, "base_url": "/user/jovyan/"},
+    )
+    pdos_data = {"dos": [{"label": "Total DOS", "x": [0.0], "y": [1.0]}]}
+    path = export.export_data(pdos_data, "dos", "json")
+    assert path.parent.parent == root_dir / export.EXPORT_DIRNAME
+    href = f"/user/jovyan/files/aiidalab_qe_exports/{path.parent.name}/dos_data.json"
+    assert export.get_download_url(path) == href
+
+    shown = []
+    monkeypatch.setattr(model, "display", lambda javascript: shown.append(javascript))
+    model.BandsPdosModel._download(path)
+    assert f'link.href = "{href}";' in shown[0].data
+
+    # Only the latest exports are kept
+    old = export.get_export_dir() / "dos_old"
+    old.mkdir()
+    os.utime(old, (0, 0))
+    paths = [
+        export.export_data(pdos_data, "dos", "json")
+        for _ in range(export.EXPORT_MAX_COUNT + 2)
+    ]
+    assert not old.exists()
+    assert not path.exists()
+    assert len(list(export.get_export_dir().iterdir())) == export.EXPORT_MAX_COUNT
+    assert all(path.exists() for path in paths[-export.EXPORT_MAX_COUNT :])
+
+
+def test_align_bands_data():
+    """Test that compared bands are aligned to the reference k-path and Fermi."""
+    from aiidalab_qe.common.bands_pdos.utils import align_bands_data
+
+    reference = {
+        "x": [0.0, 0.5, 1.0, 2.0],
+        "y": np.zeros((4, 1)),
+        "band_type_idx": np.array([0]),
+        "pathlabels": [["Γ", "X", "Γ"], [0.0, 1.0, 2.0]],
+        "fermi_energy": 1.0,
+    }
+    bands_data = {
+        "x": [0.0, 1.5, 3.0, 4.0],
+        "y": np.array([[0.0, 0.0], [1.0, 2.0], [0.0, 0.0], [1.0, 2.0]]),
+        "band_type_idx": np.array([0, 1]),
+        "pathlabels": [["Γ", "X", "Γ"], [0.0, 3.0, 4.0]],
+        "fermi_energy_up": 0.5,
+        "fermi_energy_down": 1.5,
+    }
+
+    aligned = align_bands_data(bands_data, reference)
+    assert np.allclose(aligned["x"], [0.0, 0.5, 1.0, 2.0])
+    assert np.allclose(aligned["y"][1], [1.5, 1.5])
+    assert aligned["pathlabels"] == reference["pathlabels"]
+
+    # Different paths are only scaled to the path length of the reference
+    bands_data["pathlabels"] = [["Γ", "L"], [0.0, 4.0]]
+    aligned = align_bands_data(bands_data, reference)
+    assert np.allclose(aligned["x"], [0.0, 0.75, 1.5, 2.0])
+
+
+def test_update_pdos_labels():
+    """Test that the radial nodes are relabeled with the principal numbers."""
+    from aiidalab_qe.common.bands_pdos.utils import _update_pdos_labels
+
+    labels = [
+        "Total DOS (↑)",
+        "Fe1-r0 s(↑)",
+        "Fe1-r1 s(↑)",
+        "Fe1-r0 d<sub>xy</sub>(↑)",
+        "O-r0 p<br>[-1.0, 0.5, 0.0]",
+        "Si-[0.0, 0.0, 0.0]",
+    ]
+    pdos_data = _update_pdos_labels({"dos": [{"label": label} for label in labels]})
+
+    # The highest radial node is the outermost shell
+    assert [trace["label"] for trace in pdos_data["dos"]] == [
+        "Total DOS (↑)",
+        "Fe1-3s(↑)",
+        "Fe1-4s(↑)",
+        "Fe1-3d<sub>xy</sub>(↑)",
+        "O-2p<br>[-1.0, 0.5, 0.0]",
+        "Si-[0.0, 0.0, 0.0]",
+    ]
+
+
+def test_update_pdos_traces():
+    """Test that only the PDOS traces whose key changed are removed or added."""
+    from aiidalab_qe.common.bands_pdos.bandpdosplotly import BandsPdosPlotly
+
+    def get_pdos_data(labels, scale=1.0):
+        return {
+            "dos": [
+                {
+                    "label": label,
+                    "x": np.linspace(-5, 5, 11),
+                    "y": np.full(11, scale),
+                    "borderColor": "#000000",
+                }
+                for label in labels
+            ],
+            "fermi_energy": 0.0,
+        }
+
+    helper = BandsPdosPlotly(pdos_data=get_pdos_data(["Total DOS", "Si-3s", "O-2s"]))
+    fig = helper.bandspdosfigure
+    total_dos = fig.data[0]
+
+    helper.pdos_data = get_pdos_data(["Total DOS", "O-2s", "O-2p"], scale=2.0)
+    removed, added = helper.update_pdos_traces(fig)
+
+    assert removed == ["pdos/none/Si-3s"]
+    assert added == ["pdos/none/O-2p"]
+    assert [trace.name for trace in fig.data] == ["Total DOS", "O-2s", "O-2p"]
+    # The unchanged traces are updated in place
+    assert fig.data[0] is total_dos
+    assert np.allclose(total_dos.y, 2.0)
+
+
+def test_image_renderer():
+    """Test that the figures are rendered as a batch by a persistent renderer."""
+    import plotly.graph_objects as go
+
+    from aiidalab_qe.common.image_renderer import ImageRenderer
+
+    renderer = ImageRenderer()
+    figures = [
+        go.FigureWidget(go.Scatter(x=[0, 1], y=[0, 1])),
+        {"data": [{"type": "bar", "y": [1, 2]}], "layout": {}},
+    ]
+    images = []
+    try:
+        batch = renderer.render_async(
+            figures,
+            on_result=images.append,
+            image_format="svg",
+            width=200,
+            height=100,
+        )
+        assert len(batch.result(timeout=60)) == 2
+        assert images == [batch.result()]
+        assert all(image.startswith(b"<svg") for image in images[0])
+
+        # The Kaleido process is reused
+        scope = renderer._scopes.queue[0]
+        renderer.render(figures[:1], image_format="png")[0].result(timeout=60)
+        assert list(renderer._scopes.queue) == [scope]
+    finally:
+        renderer.shutdown()
+
+
+def test_image_renderer_failed_start(monkeypatch):
+    """Test that a failed start of a Kaleido process does not block the pool."""
+    from aiidalab_qe.common.image_renderer import ImageRenderer
+
+    attempts = []
+
+    def create_scope():
+        attempts.append(None)
+        raise RuntimeError("Kaleido failed to start")
+
+    renderer = ImageRenderer()
+    monkeypatch.setattr(renderer, "_create_scope", create_scope)
+    figure = {"data": [], "layout": {}}
+    try:
+        for _ in range(2):
+            with pytest.raises(RuntimeError, match="failed to start"):
+                renderer.render([figure])[0].result(timeout=10)
+        assert len(attempts) == 2
+        assert renderer._num_scopes == 0
+    finally:
+        renderer.shutdown()
+
+
+def test_analyze_bands():
+    """Test the band gaps, band edges and effective masses of parabolic bands."""
+    from aiidalab_qe.common.bands_pdos.analysis import analyze_bands
+    from aiidalab_qe.common.bands_pdos.utils import build_kpath
+
+    k = np.linspace(0, 1, 51)
+    kpoints = np.column_stack([k, np.zeros_like(k), np.zeros_like(k)])
+    bands_data = build_kpath(kpoints, [(0, "GAMMA"), (50, "X")])
+    # Valence band maximum at Γ and conduction band minimum at X, with
+    # E = ħ²k²/(2m*) and ħ²/(2m_e) = 3.80998 eV Å²
+    valence = -3.80998 * k**2 / 2.0
+    conduction = 1.0 + 3.80998 * (k - 1) ** 2 / 0.5
+    bands_data.update(
+        y=np.column_stack([valence - 5, valence, conduction]),
+        band_type_idx=np.array([0, 0, 0]),
+        fermi_energy=0.0,
+    )
+
+    analysis = analyze_bands(bands_data)
+    assert analysis["gap_type"] == "indirect"
+    assert np.isclose(analysis["band_gap"], 1.0)
+    (spin,) = analysis["spins"]
+    assert spin["vbm"]["label"] == "Γ"
+    assert spin["cbm"]["label"] == "X"
+    assert spin["direct_gap_kpoint"]["label"] is None
+    assert np.isclose(spin["hole_effective_mass"], 2.0)
+    assert np.isclose(spin["electron_effective_mass"], 0.5)
+    assert np.allclose(spin["band_widths"], [1.90499, 1.90499, 7.61996])
+
+    # A band crossing the Fermi energy of a spin makes the system metallic
+    bands_data.update(
+        y=np.column_stack([valence, conduction, valence + 0.5, conduction]),
+        band_type_idx=np.array([0, 0, 1, 1]),
+        fermi_energy_up=0.0,
+        fermi_energy_down=0.0,
+    )
+    del bands_data["fermi_energy"]
+    analysis = analyze_bands(bands_data)
+    assert analysis["gap_type"] == "metal"
+    assert [spin["spin"] for spin in analysis["spins"]] == ["up", "down"]
+    assert analysis["spins"][0]["gap_type"] == "indirect"
+    assert analysis["spins"][1]["gap_type"] == "metal"
+
+
+def test_get_band_analysis(generate_bands_data):
+    """Test that the band analysis is cached in the extras of the node."""
+    from aiida import orm
+    from aiida.common.extendeddicts import AttributeDict
+    from aiidalab_qe.common.bands_pdos.analysis import (
+        BAND_ANALYSIS_EXTRA,
+        get_band_analysis,
+    )
+
+    node = orm.WorkflowNode().store()
+    assert get_band_analysis(node) is None
+
+    outputs = AttributeDict(
+        {
+            "band_structure": generate_bands_data(),
+            "band_parameters": orm.Dict({"fermi_energy": 0.0}),
+        }
+    )
+    analysis = get_band_analysis(node, outputs)
+    # No band above the Fermi energy
+    assert analysis["band_gap"] is None
+    assert node.base.extras.get(BAND_ANALYSIS_EXTRA) == analysis
+    # The cached analysis is used without the outputs
+    assert get_band_analysis(node) == analysis
@@ -18,11 +18,13 @@ def test_result(generate_qeapp_workchain):
 
     panel.render()
 
-    # only state buttons container and bands, so no controls
-    assert len(panel.results_container.children) == 2
+    # only state buttons, band analysis and bands containers, so no controls
+    assert len(panel.results_container.children) == 3
 
     widget = panel.bands_pdos_container.children[0]  # type: ignore
     model = widget._model
+    # The plot data is prepared in the background
+    model.wait_for_update()
 
     assert isinstance(widget, BandsPdosWidget)
     assert isinstance(widget.plot, go.FigureWidget)
@@ -1,4 +1,5 @@
 def test_electronic_structure(generate_qeapp_workchain):
+    import numpy as np
     import plotly.graph_objects as go
 
     from aiidalab_qe.common.bands_pdos import BandsPdosWidget
@@ -17,15 +18,21 @@ def test_electronic_structure(generate_qeapp_workchain):
 
     panel.render()
 
-    # only state buttons container and bands, so no controls
-    assert len(panel.results_container.children) == 3
+    # state buttons, property selector, band analysis and bands + PDOS containers
+    assert len(panel.results_container.children) == 4
 
     widget = panel.bands_pdos_container.children[0]  # type: ignore
     model = widget._model
+    # The plot data is prepared in the background
+    model.wait_for_update()
 
     assert isinstance(widget, BandsPdosWidget)
     assert isinstance(widget.plot, go.FigureWidget)
 
+    # The band analysis is shown above the plot, from the parsed bands data
+    (summary,) = panel.band_analysis_container.children  # type: ignore
+    assert "<b>Band gap:</b>" in summary.value
+
     # Check if data is correct
 
     assert model.bands_data is not None
@@ -43,3 +50,6 @@ def test_electronic_structure(generate_qeapp_workchain):
     assert model.bands_data["pathlabels"][0] == list(  # type: ignore
         widget.plot.layout.xaxis.ticktext
     )
+
+    # The traces are sent to the frontend as binary typed arrays
+    assert all(trace.y.dtype == np.float32 for trace in widget.plot.data)
@@ -22,6 +22,8 @@ def test_result(generate_qeapp_workchain):
 
     widget = panel.bands_pdos_container.children[0]  # type: ignore
     model = widget._model
+    # The plot data is prepared in the background
+    model.wait_for_update()
 
     assert isinstance(widget, BandsPdosWidget)
     assert isinstance(widget.plot, go.FigureWidget)
@@ -13,7 +13,12 @@ from aiidalab_qe.app.result.components.status import (
     WorkChainStatusModel,
     WorkChainStatusPanel,
 )
+from aiidalab_qe.common.process.broadcast import ProcessStateBroadcaster
+from aiidalab_qe.common.process.expected import EXPECTED_JOBS_EXTRA
+from aiidalab_qe.common.process.monitor import ProcessChangeMonitor
+from aiidalab_qe.common.process.snapshot import ProcessTreeSnapshot
 from aiidalab_qe.common.process.tree import (
+    BRANCHES_PAGE_SIZE,
     TITLE_MAPPING,
     CalcJobTreeNode,
     SimplifiedProcessTree,
@@ -102,6 +107,126 @@ def mock_qeapp_workchain():
     yield qe_workchain
 
 
+def test_process_tree_snapshot(mock_qeapp_workchain, monkeypatch):
+    snapshot = ProcessTreeSnapshot(mock_qeapp_workchain.pk)
+    fetched = []
+    fetch = snapshot._fetch
+    monkeypatch.setattr(
+        snapshot,
+        "_fetch",
+        lambda parents: fetched.append(parents) or fetch(parents),
+    )
+
+    snapshot.refresh()
+    root = snapshot.get(mock_qeapp_workchain.pk)
+    assert root.process_label == "QeAppWorkChain"
+    assert root.process_state == "finished"
+    assert not root.is_failed
+    (relax,) = snapshot.children(root.pk)
+    assert relax.process_label == "PwRelaxWorkChain"
+    (base,) = snapshot.children(relax.pk)
+    (calcjob,) = snapshot.children(base.pk)
+    assert calcjob.is_calcjob
+    assert snapshot.children(calcjob.pk) == []
+    assert snapshot.count_finished(root.pk) == snapshot.count_finished(base.pk) == 1
+    # One query per level of newly discovered workflows
+    assert len(fetched) == 3
+
+    # The terminated workflows are settled, and thus not fetched again
+    version = snapshot.version
+    snapshot.refresh()
+    assert len(fetched) == 3
+    assert snapshot.version == version
+
+
+def test_process_change_monitor():
+    workchain = orm.WorkChainNode()
+    workchain.set_process_state(ProcessState.RUNNING)
+    workchain.store()
+    updates = []
+    monitor = ProcessChangeMonitor(
+        callbacks=[lambda: updates.append(workchain.uuid)],
+        min_interval=0.01,
+        max_interval=0.05,
+    )
+    monitor.value = workchain.uuid
+    time.sleep(0.5)
+    # The callbacks are only run on the first check while nothing changes
+    assert len(updates) == 1
+
+    monitor.wake_up()
+    time.sleep(0.2)
+    assert len(updates) == 2
+
+    workchain.set_process_state(ProcessState.FINISHED)
+    workchain.set_exit_status(0)
+    monitor.join()  # stops once the process is terminated
+    assert len(updates) == 3
+
+
+def test_process_change_monitor_snapshot(mock_qeapp_workchain, monkeypatch):
+    monitor = ProcessChangeMonitor(min_interval=0.01)
+    with pytest.warns(UserWarning, match="Failed to load the process"):
+        monitor.value = "00000000-0000-0000-0000-000000000000"
+        monitor.join()  # the thread exits instead of failing
+    assert monitor.snapshot is None
+
+    model = SimplifiedProcessTreeModel()
+    tree = SimplifiedProcessTree(model=model)
+    model.process_uuid = mock_qeapp_workchain.uuid
+    own_snapshot = tree.trunk.snapshot
+
+    # The tree is rebuilt on the snapshot refreshed by the monitor
+    ipw.dlink((monitor, "snapshot"), (model, "process_snapshot"))
+    monitor.value = mock_qeapp_workchain.uuid
+    monitor.join()
+    assert tree.trunk.snapshot is monitor.snapshot is not own_snapshot
+    assert tree.trunk.branches[0].snapshot is monitor.snapshot
+
+    # and no longer refreshes it itself
+    refresh = []
+    monkeypatch.setattr(ProcessTreeSnapshot, "refresh", lambda _: refresh.append(1))
+    model.monitor_counter += 1
+    assert not refresh
+
+
+def test_process_state_broadcast(tmp_path):
+    workchain = orm.WorkChainNode()
+    workchain.set_process_state(ProcessState.RUNNING)
+    workchain.store()
+    # Two app instances of the same profile, a single one being the broadcaster
+    broadcasters = [ProcessStateBroadcaster(tmp_path, interval=0.01) for _ in range(2)]
+    time.sleep(0.2)
+    assert sum(broadcaster.is_broadcasting for broadcaster in broadcasters) == 1
+    subscriber = next(b for b in broadcasters if not b.is_broadcasting)
+
+    updates = []
+    monitor = ProcessChangeMonitor(
+        callbacks=[lambda: updates.append(workchain.uuid)],
+        min_interval=0.01,
+        broadcaster=subscriber,
+    )
+    monitor.value = workchain.uuid
+    time.sleep(0.5)
+    assert (tmp_path / f"{workchain.uuid}.state").exists()
+    # The first check, and the first published state unless already read by it
+    num_updates = len(updates)
+    assert 1 <= num_updates <= 2
+
+    workchain.set_process_state(ProcessState.FINISHED)
+    workchain.set_exit_status(0)
+    monitor.join()
+    assert len(updates) == num_updates + 1
+    assert not list(tmp_path.glob("*.subscription"))
+
+    # The other instance takes over once the broadcaster is stopped
+    broadcasters.remove(subscriber)
+    broadcasters[0].stop()
+    time.sleep(0.2)
+    assert subscriber.is_broadcasting
+    subscriber.stop()
+
+
 class TreeTestingMixin:
     tree: SimplifiedProcessTree
 
@@ -230,6 +355,7 @@ class TestSimplifiedProcessTree(TreeTestingMixin):
         def update_monitor():
             for _ in range(10):
                 self.model.monitor_counter += 1
+                time.sleep(0.1)  # updates from the snapshot are near instant
 
         if without_flag:  # skip `_adding_branches` flag check
             add_branches = self.tree.trunk._add_branches  # store original method
@@ -278,6 +404,91 @@ class TestSimplifiedProcessTree(TreeTestingMixin):
             assert len(self.tree.trunk.branches) == 1
 
 
+def test_tree_branches_pagination():
+    workchain = mock_workchain("PhononWorkChain")
+    num_calcjobs = 2 * BRANCHES_PAGE_SIZE + 10
+    calcjobs = [mock_calcjob("PhCalculation") for _ in range(num_calcjobs)]
+    for index, calcjob in enumerate(calcjobs):
+        calcjob.base.links.add_incoming(
+            workchain,
+            link_type=LinkType.CALL_CALC,
+            link_label=f"iteration_{index:03}",
+        )
+    workchain.store()
+    for calcjob in calcjobs:
+        calcjob.store()
+
+    model = SimplifiedProcessTreeModel()
+    tree = SimplifiedProcessTree(model=model)
+    model.process_uuid = workchain.uuid
+    # Only the first page of branches is built
+    assert len(tree.trunk.branches) == BRANCHES_PAGE_SIZE
+    assert tree.trunk.more_button.layout.display == "flex"
+    assert tree.trunk.more_button.description == (
+        f"Show {BRANCHES_PAGE_SIZE} more ({num_calcjobs - BRANCHES_PAGE_SIZE} not shown)"
+    )
+
+    tree.trunk.collapse()
+    assert tree.trunk.more_button.layout.display == "none"
+    tree.trunk.expand()
+    assert tree.trunk.more_button.layout.display == "flex"
+
+    tree.trunk.more_button.click()
+    tree.trunk.more_button.click()
+    assert len(tree.trunk.branches) == num_calcjobs
+    assert tree.trunk.more_button.layout.display == "none"
+    # The branches are in order of creation
+    assert [branch.pk for branch in tree.trunk.branches] == sorted(tree.trunk.pks)
+
+
+def test_tree_expected_jobs(mock_qeapp_workchain, monkeypatch):
+    model = SimplifiedProcessTreeModel()
+    tree = SimplifiedProcessTree(model=model)
+    model.process_uuid = mock_qeapp_workchain.uuid
+    tree.trunk.expand(recursive=True)
+    tree.trunk.update()
+    cached = mock_qeapp_workchain.base.extras.get(EXPECTED_JOBS_EXTRA)
+    assert set(cached["jobs"]) == {
+        node.uuid
+        for node in (tree.trunk, *tree.trunk.branches, *tree.trunk.branches[0].branches)
+    }
+    assert cached["jobs"][mock_qeapp_workchain.uuid] == {"count": 1, "dynamic": True}
+    assert tree.trunk.tally.value == "1/1* job"
+
+    # The expected jobs of the tree are read from the extras of the root
+    def get_expected(*_):
+        raise AssertionError("expected jobs not cached")
+
+    monkeypatch.setattr(WorkChainTreeNode, "_get_expected", get_expected)
+    model = SimplifiedProcessTreeModel()
+    tree = SimplifiedProcessTree(model=model)
+    model.process_uuid = mock_qeapp_workchain.uuid
+    tree.trunk.expand(recursive=True)
+    assert tree.trunk.tally.value == "1/1* job"
+
+
+def test_tree_expected_jobs_refined():
+    workchain = mock_workchain("ConvergenceWorkChain")
+    workchain.set_metadata_inputs({"pw": {"metadata": {"options": {}}}})
+    calcjobs = [mock_calcjob("PhCalculation") for _ in range(3)]
+    for index, calcjob in enumerate(calcjobs):
+        calcjob.base.links.add_incoming(
+            workchain,
+            link_type=LinkType.CALL_CALC,
+            link_label=f"iteration_{index:02}",
+        )
+    workchain.store()
+    for calcjob in calcjobs:
+        calcjob.store()
+
+    model = SimplifiedProcessTreeModel()
+    tree = SimplifiedProcessTree(model=model)
+    model.process_uuid = workchain.uuid
+    # A single job is expected, but three were called
+    assert tree.trunk.expected_jobs["count"] == 1
+    assert tree.trunk.tally.value == "3/3* jobs"
+
+
 class TestWorkChainStatusPanel(TreeTestingMixin):
     model: WorkChainStatusModel
     panel: WorkChainStatusPanel
@@ -0,0 +1,154 @@
+"""Synthetic bands/PDOS outputs for the benchmarks of the results viewer.
+
+The outputs mimic those of the bands and PDOS workchains, without running
+Quantum ESPRESSO, for any number of atoms, k-points and spin treatment.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from aiida import orm
+from aiida.common.extendeddicts import AttributeDict
+from aiida.plugins import OrbitalFactory
+
+pytest_plugins = ["aiida.manage.tests.pytest_fixtures"]
+
+KINDS = ["Si", "O"]
+NUM_ENERGIES = 2000
+MAX_NUM_BANDS = 64
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: mark test as slow to run")
+
+
+def _get_orbitals(kind_name, position, spin_type):
+    """Return the s and p orbitals of an atom."""
+    if spin_type == "soc":
+        SpinorbitOrbital = OrbitalFactory("spinorbithydrogen")
+        return [
+            SpinorbitOrbital(
+                kind_name=kind_name,
+                position=position,
+                total_angular_momentum=j,
+                angular_momentum=angular_momentum,
+                magnetic_number=m_j,
+                radial_nodes=0,
+            )
+            for angular_momentum, j in ((0, 0.5), (1, 0.5), (1, 1.5))
+            for m_j in np.arange(-j, j + 1)
+        ]
+    RealhydrogenOrbital = OrbitalFactory("core.realhydrogen")
+    return [
+        RealhydrogenOrbital(
+            kind_name=kind_name,
+            position=position,
+            angular_momentum=angular_momentum,
+            magnetic_number=m,
+            radial_nodes=0,
+        )
+        for angular_momentum in (0, 1)
+        for m in range(2 * angular_momentum + 1)
+    ]
+
+
+def _generate_outputs(num_atoms, num_kpoints, spin_type, seed=0):
+    """Generate and store the bands and PDOS outputs of a synthetic calculation."""
+    rng = np.random.default_rng(seed)
+    num_bands = min(max(4 * num_atoms, 8), MAX_NUM_BANDS)
+    num_spins = 2 if spin_type == "collinear" else 1
+
+    kpoints = np.zeros((num_kpoints, 3))
+    kpoints[:, 0] = np.linspace(0, 0.5, num_kpoints)
+    bands = orm.BandsData()
+    bands.set_cell(np.eye(3) * 5.43)
+    bands.set_kpoints(kpoints)
+    bands.labels = [(0, "GAMMA"), (num_kpoints - 1, "X")]
+    energies = np.sort(rng.normal(0, 5, (num_spins, num_kpoints, num_bands)), axis=-1)
+    bands.set_bands(energies if num_spins == 2 else energies[0], units="eV")
+    bands.store()
+
+    orbitals = [
+        orbital
+        for atom in range(num_atoms)
+        for orbital in _get_orbitals(
+            KINDS[atom % len(KINDS)],
+            [0.5 * atom, 0.0, 0.0],
+            spin_type,
+        )
+    ]
+    energy_grid = np.linspace(-20, 20, NUM_ENERGIES)
+
+    def generate_projections():
+        projections = orm.ProjectionData()
+        projections.set_reference_bandsdata(bands)
+        projections.set_projectiondata(
+            orbitals,
+            list_of_projections=[
+                rng.random((num_kpoints, num_bands)) for _ in orbitals
+            ],
+            list_of_energy=[energy_grid for _ in orbitals],
+            list_of_pdos=[rng.random(NUM_ENERGIES) for _ in orbitals],
+            bands_check=False,
+        )
+        return projections.store()
+
+    if num_spins == 2:
+        projwfc = AttributeDict(
+            {
+                "projections_up": generate_projections(),
+                "projections_down": generate_projections(),
+            }
+        )
+        parameters = {"fermi_energy_up": 0.1, "fermi_energy_down": 0.2}
+        dos_labels = ["dos_spin_up", "dos_spin_down"]
+    else:
+        projwfc = AttributeDict({"projections": generate_projections()})
+        parameters = {"fermi_energy": 0.1}
+        dos_labels = ["dos"]
+    parameters["spin_orbit_calculation"] = spin_type == "soc"
+    parameters = orm.Dict(parameters).store()
+
+    dos = orm.XyData()
+    dos.set_x(energy_grid, "Energy", "eV")
+    dos.set_y(
+        [rng.random(NUM_ENERGIES) for _ in dos_labels],
+        dos_labels,
+        ["states/eV"] * len(dos_labels),
+    )
+    dos.store()
+
+    bands_outputs = AttributeDict(
+        {
+            "band_structure": bands,
+            "band_parameters": parameters,
+            "projwfc": projwfc,
+        }
+    )
+    pdos_outputs = AttributeDict(
+        {
+            "dos": AttributeDict({"output_dos": dos}),
+            "projwfc": projwfc,
+            "nscf": AttributeDict({"output_parameters": parameters}),
+        }
+    )
+    return bands_outputs, pdos_outputs
+
+
+@pytest.fixture(scope="module")
+def generate_bands_pdos_outputs():
+    """Return the bands and PDOS outputs of a synthetic calculation.
+
+    The outputs are generated once per module for each set of parameters.
+    """
+    cache = {}
+
+    def _generate_bands_pdos_outputs(num_atoms, num_kpoints, spin_type="none"):
+        key = (num_atoms, num_kpoints, spin_type)
+        if key not in cache:
+            cache[key] = _generate_outputs(num_atoms, num_kpoints, spin_type)
+        return cache[key]
+
+    return _generate_bands_pdos_outputs
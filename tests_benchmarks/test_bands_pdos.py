@@ -0,0 +1,138 @@
+"""Benchmarks of the bands/PDOS post-processing pipeline of the results viewer.
+
+Run with `pytest tests_benchmarks`, and e.g. `--benchmark-autosave` and
+`--benchmark-compare` to check an optimisation against a previous run. Besides
+the wall time, the peak memory of each stage is reported in the `extra_info` of
+the benchmarks.
+"""
+
+import tracemalloc
+
+import pytest
+
+from aiidalab_qe.common.bands_pdos.bandpdosplotly import BandsPdosPlotly
+from aiidalab_qe.common.bands_pdos.utils import (
+    _get_cached_orbital_table,
+    get_bands_data,
+    get_bands_projections_data,
+    get_pdos_data,
+)
+
+pytest.importorskip("pytest_benchmark")
+
+GROUPING = {
+    "group_tag": "kinds",
+    "plot_tag": "angular_momentum",
+    "selected_atoms": [],
+}
+
+SIZES = [
+    pytest.param(1, 40, id="1-atoms-40-kpoints"),
+    pytest.param(10, 40, id="10-atoms-40-kpoints"),
+    pytest.param(10, 160, id="10-atoms-160-kpoints"),
+    pytest.param(100, 160, id="100-atoms-160-kpoints", marks=pytest.mark.slow),
+    pytest.param(500, 160, id="500-atoms-160-kpoints", marks=pytest.mark.slow),
+]
+
+SPIN_TYPES = ["none", "collinear", "soc"]
+
+
+def _run_benchmark(benchmark, stage, rounds=5):
+    """Benchmark a stage of the pipeline and record its peak memory.
+
+    The in-memory caches are cleared before each round, to measure the opening of
+    the results in a new session.
+    """
+    _get_cached_orbital_table.cache_clear()
+    tracemalloc.start()
+    try:
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info["peak_memory_mb"] = peak / 1e6
+
+    return benchmark.pedantic(
+        stage,
+        setup=_get_cached_orbital_table.cache_clear,
+        rounds=rounds,
+        iterations=1,
+    )
+
+
+@pytest.mark.parametrize("spin_type", SPIN_TYPES)
+@pytest.mark.parametrize(("num_atoms", "num_kpoints"), SIZES)
+def test_get_bands_data(
+    benchmark,
+    generate_bands_pdos_outputs,
+    num_atoms,
+    num_kpoints,
+    spin_type,
+):
+    bands, _ = generate_bands_pdos_outputs(num_atoms, num_kpoints, spin_type)
+
+    bands_data = _run_benchmark(benchmark, lambda: get_bands_data(bands))
+
+    assert bands_data["pathlabels"]
+
+
+@pytest.mark.parametrize("spin_type", SPIN_TYPES)
+@pytest.mark.parametrize(("num_atoms", "num_kpoints"), SIZES)
+def test_get_pdos_data(
+    benchmark,
+    generate_bands_pdos_outputs,
+    num_atoms,
+    num_kpoints,
+    spin_type,
+):
+    _, pdos = generate_bands_pdos_outputs(num_atoms, num_kpoints, spin_type)
+
+    pdos_data = _run_benchmark(benchmark, lambda: get_pdos_data(pdos, **GROUPING))
+
+    assert pdos_data["dos"]
+
+
+@pytest.mark.parametrize("spin_type", SPIN_TYPES)
+@pytest.mark.parametrize(("num_atoms", "num_kpoints"), SIZES)
+def test_get_bands_projections_data(
+    benchmark,
+    generate_bands_pdos_outputs,
+    num_atoms,
+    num_kpoints,
+    spin_type,
+):
+    bands, _ = generate_bands_pdos_outputs(num_atoms, num_kpoints, spin_type)
+    bands_data = get_bands_data(bands)
+
+    projections_data = _run_benchmark(
+        benchmark,
+        lambda: get_bands_projections_data(
+            bands,
+            bands_data,
+            bands_width=0.5,
+            **GROUPING,
+        ),
+    )
+
+    assert projections_data
+
+
+@pytest.mark.parametrize("spin_type", SPIN_TYPES)
+@pytest.mark.parametrize(("num_atoms", "num_kpoints"), SIZES)
+def test_bands_pdos_plotly(
+    benchmark,
+    generate_bands_pdos_outputs,
+    num_atoms,
+    num_kpoints,
+    spin_type,
+):
+    bands, pdos = generate_bands_pdos_outputs(num_atoms, num_kpoints, spin_type)
+    bands_data = get_bands_data(bands)
+    pdos_data = get_pdos_data(pdos, **GROUPING)
+
+    plot = _run_benchmark(
+        benchmark,
+        lambda: BandsPdosPlotly(bands_data=bands_data, pdos_data=pdos_data),
+    )
+
+    assert plot.plot_type == "combined"